@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+
+class Pipe:
+    '''
+    One direction of an in-memory serial line.
+    '''
+    def __init__(self):
+        self.buffer = bytearray()
+        self.condition = threading.Condition()
+
+    def put(self, data):
+        with self.condition:
+            self.buffer += data
+            self.condition.notify_all()
+
+    def get(self, size, timeout):
+        deadline = time.monotonic() + (timeout or 0)
+        with self.condition:
+            while len(self.buffer) < size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            return data
+
+
+def make_link():
+    '''
+    Return the (read, write) functions of both ends of a line.
+    '''
+    a_to_b, b_to_a = Pipe(), Pipe()
+    a = (lambda size, timeout=1: b_to_a.get(size, timeout), lambda data, timeout=1: a_to_b.put(bytes(data)))
+    b = (lambda size, timeout=1: a_to_b.get(size, timeout), lambda data, timeout=1: b_to_a.put(bytes(data)))
+    return a, b
+
+
+class Peer(threading.Thread):
+    '''
+    Run one side of a transfer in the background and keep its result.
+    '''
+    def __init__(self, target):
+        super().__init__(daemon=True)
+        self._target_call = target
+        self.result = None
+
+    def run(self):
+        self.result = self._target_call()
+
+
+@pytest.fixture
+def link():
+    return make_link()
@@ -0,0 +1,56 @@
+import pytest
+
+from conftest import Peer
+from ymodem.Batch import scan_paths
+from ymodem.Socket import ModemSocket
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "project"
+    for name in ["README.md", "src/a.py", "src/b.pyc", "src/sub/c.py", "src/sub/d.txt",
+                 "build/out.py", ".git/config"]:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(name.encode())
+    return root
+
+
+@pytest.mark.parametrize("include, exclude, expected", [
+    # the files of a directory come before its subdirectories
+    (None, None, ["project/README.md", "project/.git/config", "project/build/out.py",
+                  "project/src/a.py", "project/src/b.pyc", "project/src/sub/c.py", "project/src/sub/d.txt"]),
+    (["*.py"], None, ["project/build/out.py", "project/src/a.py", "project/src/sub/c.py"]),
+    # an excluded directory is not walked at all
+    (None, ["build", ".git", "*.pyc"], ["project/README.md", "project/src/a.py", "project/src/sub/c.py", "project/src/sub/d.txt"]),
+    (["*.py", "*.txt"], ["build"], ["project/src/a.py", "project/src/sub/c.py", "project/src/sub/d.txt"]),
+    # patterns also match the relative name
+    (["project/src/*"], ["project/src/sub"], ["project/src/a.py", "project/src/b.pyc"]),
+])
+def test_scan_directory(tree, include, exclude, expected):
+    assert [name for _, name, _ in scan_paths([str(tree)], include, exclude)] == expected
+
+
+def test_single_file_is_named_by_its_base_name(tree):
+    assert [name for _, name, _ in scan_paths([str(tree / "src" / "a.py")], ["*.py"])] == ["a.py"]
+    assert not list(scan_paths([str(tree / "src" / "a.py")], exclude=["*.py"]))
+
+
+def test_directory_is_sent_with_relative_names(link, tree, tmp_path):
+    (a_read, a_write), (b_read, b_write) = link
+    destination = tmp_path / "received"
+    destination.mkdir()
+
+    sender = ModemSocket(a_read, a_write)
+    receiver = ModemSocket(b_read, b_write)
+    peer = Peer(lambda: receiver.recv(str(destination)))
+    peer.start()
+    assert sender.send([str(tree)], include=["*.py", "*.md"], exclude=["build"])
+    peer.join(30)
+
+    assert peer.result
+    names = ["project/README.md", "project/src/a.py", "project/src/sub/c.py"]
+    assert [result.name for result in receiver.results] == names
+    for name in names:
+        assert (destination / name).read_bytes() == name[len("project/"):].encode()
+    assert not (destination / "project" / "build").exists()
@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+from ymodem import Benchmark
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_time_budget(monkeypatch):
+    # the fresh interpreter imports the package of this tree
+    monkeypatch.chdir(ROOT)
+    assert Benchmark.check_import_time(budget_ms=Benchmark.IMPORT_TIME_BUDGET_MS)
+
+
+@pytest.mark.parametrize("mode", list(Benchmark.SCALE_MODES))
+def test_scale_budgets(mode):
+    # small enough for the suite, still wraps the sequence number and measures the throughput after the traced start
+    assert Benchmark.check_scale([mode], [2], trace_mb=0.25)
@@ -0,0 +1,21 @@
+import pytest
+
+from ymodem.Compression import Compressor
+from ymodem.Socket import ModemSocket
+
+
+@pytest.mark.parametrize("method, level", [("zlib", 42), ("zlib", -2), ("lzma", -1), ("lzma", 10)])
+def test_invalid_level_fails_before_the_transfer(method, level):
+    written = []
+    with pytest.raises(ValueError, match="compression level"):
+        ModemSocket(lambda size, timeout=1: b"", lambda data, timeout=1: written.append(data),
+                    compression=method, compression_level=level)
+    with pytest.raises(ValueError, match="compression level"):
+        Compressor(method, level)
+    assert written == []
+
+
+@pytest.mark.parametrize("method, level", [("zlib", -1), ("zlib", 9), ("lzma", 0), ("lzma", 9)])
+def test_valid_levels(method, level):
+    compressor = Compressor(method, level)
+    assert compressor.compress(b"data") + compressor.flush()
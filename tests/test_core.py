@@ -0,0 +1,269 @@
+'''
+The state machines driven byte by byte, without any channel, thread or clock.
+'''
+import pytest
+
+from ymodem.Core import (ACK, CAN, CRC, EOT, NAK, Data, FileDone, FileEnd, FileHeader, FileStarted, G, ReceiverCore,
+                         Retransmit, SenderCore, _psm, make_checksum, make_header)
+from ymodem.Protocol import YMODEM, ProtocolSubType, ProtocolType
+from ymodem.Stream import FileInfo
+
+STYLE_ID = "UNIX_RZ_SZ"
+FEATURES = _psm.get_available_style(STYLE_ID).get_protocol_features(ProtocolType.YMODEM)
+BATCH = ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION
+
+
+def packet(sequence, payload, crc=1):
+    payload = payload.ljust(128, b"\x1a" if sequence else b"\x00")
+    return bytes(make_header(128, sequence)) + payload + bytes(make_checksum(crc, payload))
+
+
+def events(core):
+    result = []
+    event = core.next_event()
+    while event is not None:
+        result.append(event)
+        event = core.next_event()
+    return result
+
+
+def event_types(core):
+    return [type(event) for event in events(core)]
+
+
+def new_sender():
+    sender = SenderCore(ProtocolType.YMODEM, BATCH, FEATURES, 128)
+    sender.start_file(0, FileInfo("a.bin", 5, 0))
+    return sender
+
+
+def new_receiver():
+    receiver = ReceiverCore(ProtocolType.YMODEM, BATCH, FEATURES, STYLE_ID)
+    assert receiver.data_to_send() == CRC
+    return receiver
+
+
+def test_sender_header_data_eot():
+    sender = new_sender()
+    # nothing goes out before the receiver asks
+    assert sender.data_to_send() == b""
+
+    sender.receive_data(CRC)
+    header = sender.data_to_send()
+    assert header[:3] == b"\x01\x00\xff"
+    assert header[3:].startswith(b"a.bin\x005 ")
+    assert len(header) == 3 + 128 + 2
+
+    sender.receive_data(ACK)
+    assert sender.data_to_send() == b""
+    sender.receive_data(CRC)
+    assert event_types(sender) == [FileStarted]
+    assert sender.wants_data
+
+    sender.send_data(b"hello")
+    sender.end_file()
+    assert sender.data_to_send() == packet(1, b"hello")
+
+    sender.receive_data(ACK)
+    assert sender.data_to_send() == EOT
+    sender.receive_data(ACK)
+    done = [event for event in events(sender) if isinstance(event, FileDone)]
+    assert [(event.name, event.done) for event in done] == [("a.bin", 5)]
+    assert sender.idle
+
+    sender.end_batch()
+    sender.receive_data(CRC)
+    assert sender.data_to_send() == packet(0, b"")
+    sender.receive_data(ACK)
+    assert sender.done and sender.result
+
+
+def test_sender_resends_on_nak():
+    sender = new_sender()
+    sender.receive_data(CRC)
+    header = sender.data_to_send()
+    sender.receive_data(NAK)
+    assert sender.data_to_send() == header
+    assert event_types(sender) == [Retransmit]
+
+
+def test_sender_stops_on_can():
+    sender = new_sender()
+    sender.receive_data(CRC)
+    sender.data_to_send()
+    sender.receive_data(CAN)
+    assert sender.done and not sender.result
+    assert sender.data_to_send() == b""
+
+
+def test_receiver_header_data_eot():
+    receiver = new_receiver()
+
+    receiver.receive_data(packet(0, b"a.bin\x005"))
+    headers = events(receiver)
+    assert [(event.info.name, event.info.length) for event in headers if isinstance(event, FileHeader)] == [("a.bin", 5)]
+    assert receiver.idle and receiver.data_to_send() == b""
+
+    receiver.accept_file()
+    assert receiver.data_to_send() == ACK + CRC
+    assert event_types(receiver) == [FileStarted]
+
+    receiver.receive_data(packet(1, b"hello"))
+    assert receiver.data_to_send() == ACK
+    # the padding after the announced length is dropped
+    assert [event.data for event in events(receiver) if isinstance(event, Data)] == [b"hello"]
+
+    receiver.receive_data(EOT)
+    assert event_types(receiver) == [FileEnd]
+    receiver.finish_file(True)
+    assert receiver.data_to_send() == ACK + CRC
+    assert event_types(receiver) == [FileDone]
+
+    receiver.receive_data(packet(0, b""))
+    assert receiver.data_to_send() == ACK
+    assert receiver.done and receiver.result
+
+
+def test_receiver_acknowledges_a_duplicate_block_once():
+    receiver = new_receiver()
+    receiver.receive_data(packet(0, b"a.bin\x00256"))
+    receiver.accept_file()
+    receiver.data_to_send()
+    events(receiver)
+
+    block = packet(1, b"x" * 128)
+    receiver.receive_data(block)
+    assert receiver.data_to_send() == ACK
+    assert len([event for event in events(receiver) if isinstance(event, Data)]) == 1
+
+    # the ACK was lost and the sender sent the block again
+    receiver.receive_data(block)
+    assert receiver.data_to_send() == ACK
+    assert not [event for event in events(receiver) if isinstance(event, Data)]
+
+
+def test_receiver_naks_a_damaged_block():
+    receiver = new_receiver()
+    receiver.receive_data(packet(0, b"a.bin\x005"))
+    receiver.accept_file()
+    receiver.data_to_send()
+
+    damaged = bytearray(packet(1, b"hello"))
+    damaged[5] ^= 0x01
+    receiver.receive_data(bytes(damaged))
+    assert Retransmit in event_types(receiver)
+    # the rest of the damaged packet is purged before asking again
+    assert receiver.data_to_send() == b""
+    receiver.timeout()
+    assert receiver.data_to_send() == NAK
+
+    receiver.receive_data(packet(1, b"hello"))
+    assert receiver.data_to_send() == ACK
+
+
+def test_receiver_stops_on_can():
+    receiver = new_receiver()
+    receiver.receive_data(CAN + CAN)
+    assert receiver.done
+    assert receiver.data_to_send() == b""
+
+
+def test_cores_talk_to_each_other():
+    data = bytes(range(256)) * 10
+    sender = SenderCore(ProtocolType.YMODEM, BATCH, FEATURES, 1024)
+    receiver = ReceiverCore(ProtocolType.YMODEM, BATCH, FEATURES, STYLE_ID)
+    sender.start_file(0, FileInfo("b.bin", len(data), 0))
+    received = bytearray()
+    offset = 0
+    ended = False
+
+    for _ in range(1000):
+        if sender.done and receiver.done:
+            break
+        sender.receive_data(receiver.data_to_send())
+        while sender.wants_data and not ended:
+            chunk = data[offset:offset + 1024]
+            offset += len(chunk)
+            if chunk:
+                sender.send_data(chunk)
+            else:
+                sender.end_file()
+                ended = True
+        for event in events(sender):
+            if isinstance(event, FileDone):
+                sender.end_batch()
+        receiver.receive_data(sender.data_to_send())
+        for event in events(receiver):
+            if isinstance(event, FileHeader):
+                receiver.accept_file()
+            elif isinstance(event, Data):
+                received += event.data
+            elif isinstance(event, FileEnd):
+                receiver.finish_file(True)
+
+    assert sender.result and receiver.result
+    assert bytes(received) == data
+
+
+L, D, M, S = YMODEM.USE_LENGTH_FIELD, YMODEM.USE_DATE_FIELD, YMODEM.USE_MODE_FIELD, YMODEM.USE_SN_FIELD
+
+
+@pytest.mark.parametrize("header_features, preferred, expected", [
+    (L, None, "VMS_RB_SB"),
+    (0, None, "CP_M_YAM"),
+    # two fields are one away from three styles, the preferred one wins the tie
+    (L | D, None, "UNIX_RZ_SZ"),
+    (L | D, "PRO_YAM", "PRO_YAM"),
+    (L | D, "VMS_RB_SB", "VMS_RB_SB"),
+    (L | D | M, "PRO_YAM", "UNIX_RZ_SZ"),
+    (L | D | S, "UNIX_RZ_SZ", "PRO_YAM"),
+    (L | D | M | S, None, "UNIX_RZ_SZ"),
+    (L | D | M | S, "PRO_YAM", "PRO_YAM"),
+])
+def test_match_style(header_features, preferred, expected):
+    assert _psm.match_style(ProtocolType.YMODEM, header_features, preferred) == expected
+
+
+def received_header(style_id, fields, options=[], subtype=BATCH):
+    receiver = ReceiverCore(ProtocolType.YMODEM, subtype, _psm.get_available_style(style_id).get_protocol_features(ProtocolType.YMODEM),
+                            style_id, options)
+    receiver.data_to_send()
+    receiver.receive_data(packet(0, b"a.bin\x00" + fields.encode()))
+    events(receiver)
+    return receiver
+
+
+@pytest.mark.parametrize("style_id, fields, expected", [
+    ("UNIX_RZ_SZ", "5", "VMS_RB_SB"),
+    ("UNIX_RZ_SZ", "5 14000000000", "UNIX_RZ_SZ"),
+    ("PRO_YAM", "5 14000000000", "PRO_YAM"),
+    ("UNIX_RZ_SZ", "5 14000000000 100644", "UNIX_RZ_SZ"),
+    ("PRO_YAM", "5 14000000000 100644", "UNIX_RZ_SZ"),
+    # a third field without file type bits is a serial number, unless the receiver's style sends modes
+    ("VMS_RB_SB", "5 14000000000 17", "PRO_YAM"),
+    ("UNIX_RZ_SZ", "5 14000000000 0", "UNIX_RZ_SZ"),
+    ("PRO_YAM", "5 14000000000 0", "PRO_YAM"),
+    ("UNIX_RZ_SZ", "5 14000000000 0 0", "UNIX_RZ_SZ"),
+    ("PRO_YAM", "5 14000000000 0 0", "PRO_YAM"),
+    ("VMS_RB_SB", "5 14000000000 100644 0", "UNIX_RZ_SZ"),
+])
+def test_receiver_detects_the_sender_style(style_id, fields, expected):
+    receiver = received_header(style_id, fields)
+    assert receiver._session_style_id == expected
+    assert receiver.protocol_subtype == BATCH
+
+
+def test_receiver_switches_to_ymodem_g_with_the_sender_style():
+    receiver = received_header("VMS_RB_SB", "5 14000000000 17", ["g"])
+    assert receiver._session_style_id == "PRO_YAM"
+    assert receiver.protocol_subtype == ProtocolSubType.YMODEM_G_FILE_TRANSMISSION
+    receiver.accept_file()
+    assert receiver.data_to_send() == ACK + G
+
+
+def test_receiver_leaves_ymodem_g_for_a_sender_without_it():
+    receiver = received_header("PRO_YAM", "5 14000000000 100644", ["g"], ProtocolSubType.YMODEM_G_FILE_TRANSMISSION)
+    assert receiver._session_style_id == "UNIX_RZ_SZ"
+    assert receiver.protocol_subtype == BATCH
+    receiver.accept_file()
+    assert receiver.data_to_send() == ACK + CRC
@@ -0,0 +1,44 @@
+import threading
+import time
+
+from conftest import Peer
+from ymodem.Core import STX, XOFF, XON
+from ymodem.Socket import ModemSocket
+from ymodem.Stream import Source
+
+
+def test_ymodem_g_sender_stalls_on_xoff(link, tmp_path):
+    (a_read, a_write), (b_read, b_write) = link
+    data = bytes(range(256)) * 1024
+    packets = [0]
+    paused = threading.Event()
+
+    def sender_write(data, timeout=1):
+        if data[:1] == STX:
+            packets[0] += 1
+            if packets[0] == 4:
+                # the receiver's buffer is full
+                b_write(XOFF)
+                paused.set()
+        return a_write(data, timeout)
+
+    sender = ModemSocket(a_read, sender_write, protocol_type_options=["g"], xonxoff=True)
+    receiver = ModemSocket(b_read, b_write, protocol_type_options=["g"])
+    receiving = Peer(lambda: receiver.recv(str(tmp_path)))
+    receiving.start()
+    sending = Peer(lambda: sender.send([Source("stream.bin", data)]))
+    sending.start()
+
+    assert paused.wait(10)
+    # the packet on its way when the XOFF arrived may still go out
+    time.sleep(0.3)
+    stalled_at = packets[0]
+    time.sleep(1)
+    assert packets[0] == stalled_at < len(data) // 1024
+    assert sending.is_alive()
+
+    b_write(XON)
+    sending.join(30)
+    receiving.join(30)
+    assert sending.result and receiving.result
+    assert (tmp_path / "stream.bin").read_bytes() == data
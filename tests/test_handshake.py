@@ -0,0 +1,44 @@
+import io
+import time
+
+from conftest import Peer
+from ymodem.Protocol import ProtocolType
+from ymodem.Socket import ModemSocket
+from ymodem.Stream import Source
+
+
+def test_late_xmodem_sender_follows_the_last_request(link):
+    '''
+    The fast receiver has fallen back to checksum mode by the time the sender
+    starts, its C requests are still queued in front of the NAK.
+    '''
+    (a_read, a_write), (b_read, b_write) = link
+    data = bytes(range(256)) * 8
+    sink = io.BytesIO()
+
+    receiver = ModemSocket(b_read, b_write, protocol_type=ProtocolType.XMODEM, fast_handshake=True)
+    peer = Peer(lambda: receiver.recv(lambda info: sink))
+    peer.start()
+    time.sleep(1.5)
+
+    sender = ModemSocket(a_read, a_write, protocol_type=ProtocolType.XMODEM)
+    assert sender.send([Source("late.bin", data)])
+    peer.join(30)
+    assert peer.result
+    assert sink.getvalue().rstrip(b"\x1a") == data
+
+
+def test_late_ymodem_sender_follows_the_last_request(link, tmp_path):
+    (a_read, a_write), (b_read, b_write) = link
+    data = bytes(range(256)) * 20
+
+    receiver = ModemSocket(b_read, b_write, fast_handshake=True)
+    peer = Peer(lambda: receiver.recv(str(tmp_path)))
+    peer.start()
+    time.sleep(1.5)
+
+    sender = ModemSocket(a_read, a_write)
+    assert sender.send([Source("late.bin", data)])
+    peer.join(30)
+    assert peer.result
+    assert (tmp_path / "late.bin").read_bytes() == data
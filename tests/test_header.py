@@ -0,0 +1,41 @@
+import pytest
+
+from conftest import Peer
+from ymodem.Core import FileHeader
+from ymodem.Socket import ModemSocket
+from ymodem.Stream import Source
+
+
+@pytest.mark.parametrize("style_id", ["CP_M_YAM", "KMD_IMP"])
+def test_offers_of_a_style_without_header_fields(link, tmp_path, style_id):
+    (a_read, a_write), (b_read, b_write) = link
+    data = bytes(range(1, 200)) * 50
+
+    sender = ModemSocket(a_read, a_write, style_id=style_id, compression="zlib", digest="sha256", digest_trailer=True)
+    receiver = ModemSocket(b_read, b_write, style_id=style_id)
+    peer = Peer(lambda: list(receiver.iter_recv(str(tmp_path))))
+    peer.start()
+    assert sender.send([Source("offers.bin", data)])
+    peer.join(30)
+
+    headers = [event for event in peer.result if isinstance(event, FileHeader)]
+    assert [header.compression for header in headers] == ["zlib"]
+    assert [result.verified for result in sender.results] == [True]
+    assert [result.verified for result in receiver.results] == [True]
+    # without a length field the receiver keeps the padding of the last packet
+    assert (tmp_path / "offers.bin").read_bytes().rstrip(b"\x1a") == data
+
+
+def test_digest_trailer_is_declined_without_a_length(link, tmp_path):
+    (a_read, a_write), (b_read, b_write) = link
+    data = bytes(range(1, 200)) * 50
+
+    sender = ModemSocket(a_read, a_write, style_id="CP_M_YAM", digest="sha256", digest_trailer=True)
+    receiver = ModemSocket(b_read, b_write, style_id="CP_M_YAM")
+    peer = Peer(lambda: receiver.recv(str(tmp_path)))
+    peer.start()
+    assert sender.send([Source("padded.bin", data)])
+    peer.join(30)
+
+    assert peer.result
+    assert [result.verified for result in sender.results] == [None]
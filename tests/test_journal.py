@@ -0,0 +1,54 @@
+from conftest import Peer, make_link
+from ymodem.CRC import calc_crc16
+from ymodem.Socket import ModemSocket
+
+
+def corrupting(write):
+    '''
+    Flip a byte of the first data packet and fix its CRC, the damage is only
+    noticed by comparing the digests.
+    '''
+    state = {"done": False}
+
+    def corrupted_write(data, timeout=1):
+        data = bytes(data)
+        if not state["done"] and len(data) == 1029 and data[:2] == b"\x02\x01":
+            state["done"] = True
+            payload = bytearray(data[3:1027])
+            payload[0] ^= 0xff
+            data = data[:3] + bytes(payload) + calc_crc16(payload).to_bytes(2, "big")
+        return write(data, timeout)
+    return corrupted_write
+
+
+def transfer(paths, destination, journal, corrupt=False):
+    destination.mkdir()
+    (a_read, a_write), (b_read, b_write) = make_link()
+    sender = ModemSocket(a_read, corrupting(a_write) if corrupt else a_write,
+                         digest="sha256", digest_trailer=True)
+    receiver = ModemSocket(b_read, b_write)
+    peer = Peer(lambda: receiver.recv(str(destination)))
+    peer.start()
+    result = sender.send(paths, journal=journal, resume_batch=True)
+    peer.join(30)
+    return result, sender.results, receiver.results
+
+
+def test_file_with_mismatching_digest_is_not_journalled(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    first, second = source / "first.bin", source / "second.bin"
+    first.write_bytes(bytes(range(256)) * 8)
+    second.write_bytes(b"second")
+    journal = str(tmp_path / "batch.journal")
+    paths = [str(first), str(second)]
+
+    result, sent, _ = transfer(paths, tmp_path / "corrupted", journal, corrupt=True)
+    assert not result
+    assert [event.verified for event in sent] == [False, True]
+
+    # the resumed batch sends the damaged file again
+    result, sent, received = transfer(paths, tmp_path / "resumed", journal)
+    assert result
+    assert [event.name for event in received] == ["first.bin"]
+    assert (tmp_path / "resumed" / "first.bin").read_bytes() == first.read_bytes()
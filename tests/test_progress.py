@@ -0,0 +1,34 @@
+from conftest import Peer
+from ymodem.Progress import ProgressDispatcher
+from ymodem.Socket import ModemSocket
+from ymodem.Stream import Source
+
+
+def test_completion_is_forwarded_once():
+    calls = []
+    progress = ProgressDispatcher(lambda *args: calls.append(args), interval=10)
+    for done in (100, 200, 200, 200):
+        progress.update(1, "a.bin", 200, done)
+    progress.flush()
+    progress.update(2, "b.bin", 50, 50)
+    progress.flush()
+    assert calls == [(1, "a.bin", 200, 100), (1, "a.bin", 200, 200), (2, "b.bin", 50, 50)]
+
+
+def test_compressed_progress_follows_the_packets_sent(link, tmp_path):
+    (a_read, a_write), (b_read, b_write) = link
+    data = b"".join(b"line %d of a compressible log\n" % i for i in range(20000))
+
+    calls = []
+    sender = ModemSocket(a_read, a_write, compression="zlib")
+    receiver = ModemSocket(b_read, b_write)
+    peer = Peer(lambda: receiver.recv(str(tmp_path)))
+    peer.start()
+    assert sender.send([Source("log.txt", data)], lambda *args: calls.append(args))
+    peer.join(30)
+
+    done = [call[3] for call in calls]
+    assert done == sorted(done)
+    assert [value for value in done if value >= len(data)] == [len(data)]
+    assert done[-1] == len(data)
+    assert len(done) > 2
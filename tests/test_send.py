@@ -0,0 +1,10 @@
+import pytest
+
+from ymodem.Socket import ModemSocket
+
+
+def test_unsupported_item_is_rejected(link):
+    (a_read, a_write), _ = link
+    sender = ModemSocket(a_read, a_write)
+    with pytest.raises(TypeError, match="Source"):
+        sender.send([b"raw bytes"])
@@ -0,0 +1,50 @@
+import io
+
+import pytest
+
+from conftest import Peer
+from ymodem.Socket import ModemSocket
+from ymodem.Stream import Source
+
+
+def read_all(source, size=1024):
+    reader = source.open()
+    chunks = []
+    while True:
+        data = reader.read(size)
+        if not data:
+            break
+        chunks.append(data)
+    reader.close()
+    return b"".join(chunks)
+
+
+@pytest.mark.parametrize("data", [b"x" * 1000, io.BytesIO(b"x" * 1000)])
+def test_reads_stop_at_the_size(data):
+    assert read_all(Source("part.bin", data, size=500), 128) == b"x" * 500
+
+
+def test_chunks_past_the_size_are_an_error():
+    with pytest.raises(ValueError, match="more data"):
+        read_all(Source("long.bin", iter([b"x" * 1000, b"y" * 1000]), size=500))
+
+
+@pytest.mark.parametrize("data", [iter([b"x" * 100]), io.BytesIO(b"x" * 100)])
+def test_short_data_is_an_error(data):
+    with pytest.raises(ValueError, match="before its size"):
+        read_all(Source("short.bin", data, size=500))
+
+
+@pytest.mark.parametrize("chunks", [[b"x" * 1000, b"y" * 1000], [b"x" * 100]])
+def test_chunk_source_not_matching_its_size_aborts_the_transfer(link, tmp_path, chunks):
+    (a_read, a_write), (b_read, b_write) = link
+    receiver = ModemSocket(b_read, b_write)
+    peer = Peer(lambda: receiver.recv(str(tmp_path)))
+    peer.start()
+
+    sender = ModemSocket(a_read, a_write)
+    assert not sender.send([Source("g.bin", iter(chunks), size=500)])
+    peer.join(30)
+    # nothing past the announced size reaches the receiver
+    received = tmp_path / "g.bin"
+    assert not received.exists() or received.stat().st_size <= 500
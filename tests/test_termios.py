@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+from conftest import Peer
+from ymodem.Socket import ModemSocket
+from ymodem.Stream import Source
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="TermiosChannel is Linux only")
+
+
+@pytest.mark.parametrize("options", [[], ["g"]])
+@pytest.mark.parametrize("direction", ["send", "recv"])
+def test_termios_channel_over_a_pty(tmp_path, options, direction):
+    from ymodem.Transport import StdioChannel, TermiosChannel
+
+    master, slave = os.openpty()
+    tty = TermiosChannel(os.ttyname(slave), 921600)
+    tty.open()
+    # the master end of the pair, driven like the standard input and output of sz/rz
+    pty = StdioChannel(master, master, raw=True)
+    pty.open()
+    data = os.urandom(100000)
+    try:
+        ends = [(tty.read, tty.write, tty.writev), (pty.read, pty.write, pty.writev)]
+        if direction == "recv":
+            ends.reverse()
+        (a_read, a_write, a_writev), (b_read, b_write, b_writev) = ends
+        sender = ModemSocket(a_read, a_write, writev=a_writev, protocol_type_options=options)
+        receiver = ModemSocket(b_read, b_write, writev=b_writev, protocol_type_options=options)
+        peer = Peer(lambda: receiver.recv(str(tmp_path)))
+        peer.start()
+        assert sender.send([Source("pty.bin", data)])
+        peer.join(30)
+        assert peer.result
+        assert (tmp_path / "pty.bin").read_bytes() == data
+    finally:
+        tty.close()
+        pty.close()
+        os.close(master)
+        os.close(slave)
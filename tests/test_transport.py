@@ -0,0 +1,106 @@
+import socket
+
+import pytest
+
+from conftest import Peer
+from ymodem.Socket import ModemSocket
+from ymodem.Stream import Source
+from ymodem.Transport import TcpChannel
+
+
+class WithoutSendmsg:
+    '''
+    Socket of a platform without sendmsg(), e.g. Windows.
+    '''
+    def __init__(self, sock):
+        self._sock = sock
+
+    def __getattr__(self, name):
+        if name == "sendmsg":
+            raise AttributeError(name)
+        return getattr(self._sock, name)
+
+
+def test_tcp_writev_without_sendmsg():
+    a, b = socket.socketpair()
+    channel = TcpChannel.from_socket(a)
+    channel._sock = WithoutSendmsg(a)
+    try:
+        assert channel.writev([b"\x02\x01\xfe", b"payload", b"\x12\x34"]) == 12
+        b.settimeout(1)
+        assert b.recv(64) == b"\x02\x01\xfepayload\x12\x34"
+        assert not channel.gathered_writes
+    finally:
+        a.close()
+        b.close()
+
+
+IAC, DONT, DO, WONT, WILL, SB, SE = 255, 254, 253, 252, 251, 250, 240
+
+
+def received(sock):
+    sock.settimeout(0.2)
+    data = b""
+    try:
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+    except socket.timeout:
+        pass
+    return data
+
+
+def test_telnet_decode():
+    a, b = socket.socketpair()
+    channel = TcpChannel.from_socket(a)
+    try:
+        # doubled IAC, NOP and a subnegotiation with an escaped IAC inside
+        assert channel._decode(bytes([1, IAC, IAC, 2, IAC, 241, 3, IAC, SB, 44, 101, IAC, IAC, 7, IAC, SE, 4])) == b"\x01\xff\x02\x03\x04"
+        # a command split over two reads
+        assert channel._decode(b"\x05\xff") == b"\x05"
+        assert channel._decode(b"\xff\x06") == b"\xff\x06"
+        # options: BINARY is accepted, an unknown option refused
+        assert channel._decode(bytes([IAC, DO, 0, IAC, WILL, 3, IAC, DO, 24, 8])) == b"\x08"
+        assert received(b) == bytes([IAC, WILL, 0, IAC, DO, 3, IAC, WONT, 24])
+    finally:
+        a.close()
+        b.close()
+
+
+def test_rfc2217_negotiation():
+    a, b = socket.socketpair()
+    channel = TcpChannel.from_socket(a, rfc2217=True, baudrate=9600, parity="E", rtscts=True)
+    try:
+        sent = received(b)
+        assert bytes([IAC, WILL, 0, IAC, DO, 0, IAC, WILL, 3, IAC, DO, 3, IAC, WILL, 44]) in sent
+        assert bytes([IAC, SB, 44, 1]) + (9600).to_bytes(4, "big") + bytes([IAC, SE]) in sent
+        assert bytes([IAC, SB, 44, 3, 3, IAC, SE]) in sent
+        assert bytes([IAC, SB, 44, 5, 3, IAC, SE]) in sent
+        assert channel.telnet
+    finally:
+        a.close()
+        b.close()
+
+
+@pytest.mark.parametrize("options", [[], ["g"]])
+def test_telnet_transfer_with_iac_bytes(tmp_path, options):
+    a, b = socket.socketpair()
+    sender_channel = TcpChannel.from_socket(a, telnet=True)
+    receiver_channel = TcpChannel.from_socket(b, telnet=True)
+    data = b"\xff" * 3000 + bytes(range(256)) * 40 + b"\xff\xff\x00\xff"
+    try:
+        sender = ModemSocket(sender_channel.read, sender_channel.write, writev=sender_channel.writev,
+                             protocol_type_options=options)
+        receiver = ModemSocket(receiver_channel.read, receiver_channel.write, writev=receiver_channel.writev,
+                               protocol_type_options=options)
+        peer = Peer(lambda: receiver.recv(str(tmp_path)))
+        peer.start()
+        assert sender.send([Source("iac.bin", data)])
+        peer.join(30)
+        assert peer.result
+        assert (tmp_path / "iac.bin").read_bytes() == data
+    finally:
+        sender_channel.close(linger=0)
+        receiver_channel.close(linger=0)
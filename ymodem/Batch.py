@@ -0,0 +1,87 @@
+'''
+Collect the files of a batch from file and directory paths.
+
+Directories are walked with os.scandir, which costs a single stat call per
+file. Files are named by their path relative to the parent of the directory
+given on the command line, with '/' as separator.
+'''
+import fnmatch
+import os
+import stat
+from typing import Iterator, List, Optional, Tuple
+
+def _matches(name: str, patterns: List[str]) -> bool:
+    basename = name.rsplit("/", 1)[-1]
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(basename, pattern):
+            return True
+    return False
+
+
+def _accepts(name: str, include: Optional[List[str]], exclude: Optional[List[str]]) -> bool:
+    if exclude and _matches(name, exclude):
+        return False
+    if include and not _matches(name, include):
+        return False
+    return True
+
+
+def scan_paths(paths: List[str],
+               include: Optional[List[str]] = None,
+               exclude: Optional[List[str]] = None
+               ) -> Iterator[Tuple[str, str, os.stat_result]]:
+    '''
+    Yield (path, name, stat) for every regular file of the batch.
+
+    param paths: file or directory paths, directories are walked recursively
+    param include: glob patterns, only matching files are sent
+    param exclude: glob patterns, matching files and directories are skipped
+    Patterns are matched against both the relative name and the base name.
+    '''
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+
+        if stat.S_ISREG(st.st_mode):
+            name = os.path.basename(path)
+            if _accepts(name, include, exclude):
+                yield path, name, st
+        elif stat.S_ISDIR(st.st_mode):
+            yield from _walk(path, os.path.basename(os.path.abspath(path)), include, exclude)
+
+
+def _walk(root: str,
+          root_name: str,
+          include: Optional[List[str]],
+          exclude: Optional[List[str]]
+          ) -> Iterator[Tuple[str, str, os.stat_result]]:
+    # depth first, entries of a directory in name order
+    stack = [(root, root_name)]
+    while stack:
+        directory, directory_name = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            name = directory_name + "/" + entry.name
+            try:
+                # symbolic links to directories are not followed to avoid loops
+                if entry.is_dir(follow_symlinks=False):
+                    if not (exclude and _matches(name, exclude)):
+                        subdirectories.append((entry.path, name))
+                    continue
+                if not _accepts(name, include, exclude):
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                yield entry.path, name, st
+
+        stack.extend(reversed(subdirectories))
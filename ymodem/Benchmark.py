@@ -0,0 +1,659 @@
+'''
+Performance checks for the ymodem package.
+
+    python -m ymodem.Benchmark importtime [--budget-ms 50] [--module ymodem.__main__]
+    python -m ymodem.Benchmark syscalls [--size-mb 1] [--channel closure serial termios]
+    python -m ymodem.Benchmark micro [--save results.json] [--baseline baseline.json | --no-baseline] [--tolerance 0.25]
+    python -m ymodem.Benchmark scale [--size-mb 1024 4096] [--mode ymodem ymodem-g xmodem] [--nak-every 1000]
+
+Each command prints its measurements and exits with a non-zero status when a
+budget is exceeded, so it can be used as a regression gate.
+'''
+import argparse
+import json
+import logging
+import platform
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Startup budget for `import ymodem.__main__`, measured with -X importtime
+IMPORT_TIME_BUDGET_MS = 50
+
+# Modules that must stay out of the startup path
+LAZY_MODULES = ["serial", "ordered_set"]
+
+# Port reconfigurations (tcgetattr + tcsetattr) allowed in a transfer through SerialChannel, opening the port excluded
+RECONFIGURE_BUDGET = 4
+
+# Channels measured by the syscalls command
+#   closure: pyserial driven as the CLI used to, timeouts assigned and flush() on every call
+#   serial:  pyserial through SerialChannel
+#   termios: TermiosChannel
+SYSCALL_CHANNELS = ["closure", "serial", "termios"]
+
+# Baseline of the microbenchmarks shipped with the package, refreshed with `micro --save`
+MICRO_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "micro_baseline.json")
+
+# Payload sizes of the microbenchmarks, the two packet sizes
+MICRO_SIZES = [128, 1024]
+
+# Slowdown against the baseline tolerated by the micro command, 0.25 is 25 % slower
+MICRO_TOLERANCE = 0.25
+
+# Modes of the scale command: protocol, protocol options, packet size,
+# minimum throughput in MB/s and peak Python memory in bytes, both ends together
+SCALE_MODES = {
+    "ymodem":   ("ymodem", [],    1024, 1.0,  1024 * 1024),
+    "ymodem-g": ("ymodem", ["g"], 1024, 1.0,  1024 * 1024),
+    "xmodem":   ("xmodem", [],    128,  0.4,  1024 * 1024),
+}
+
+# Growth of the peak resident set size allowed during a scale run
+SCALE_RSS_BUDGET = 32 * 1024 * 1024
+
+# Bytes at the start of a scale run traced with tracemalloc, which slows the transfer
+# more than tenfold, throughput is measured over the rest of the file
+SCALE_TRACE_BYTES = 16 * 1024 * 1024
+
+# Bytes the in-memory link holds before the writer blocks, like the buffer of a serial driver
+SCALE_LINK_CAPACITY = 64 * 1024
+
+
+def measure_import_time(module: str, runs: int = 5) -> Tuple[int, Dict[str, int]]:
+    '''
+    Import the module in a fresh interpreter with -X importtime.
+
+    Return the best cumulative import time of the module in microseconds
+    and the cumulative time of every module imported along with it.
+    '''
+    best = -1
+    imported = {}
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Failed to import {module}:\n{proc.stderr}")
+
+        imported = {}
+        for line in proc.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith("import time:"):
+                continue
+            fields = line[len("import time:"):].split("|")
+            if len(fields) != 3 or not fields[1].strip().isdigit():
+                continue
+            imported[fields[2].strip()] = int(fields[1])
+
+        if module in imported and (best < 0 or imported[module] < best):
+            best = imported[module]
+
+    return best, imported
+
+
+def check_import_time(module: str = "ymodem.__main__",
+                      budget_ms: float = IMPORT_TIME_BUDGET_MS,
+                      lazy_modules: Optional[List[str]] = None,
+                      runs: int = 5) -> bool:
+    if lazy_modules is None:
+        lazy_modules = LAZY_MODULES
+
+    cost, imported = measure_import_time(module, runs)
+    ok = True
+
+    print(f"import {module}: {cost / 1000:.2f} ms (budget {budget_ms:.2f} ms)")
+    if cost < 0 or cost > budget_ms * 1000:
+        print(f"FAIL: import time of {module} is over budget")
+        ok = False
+
+    for name in lazy_modules:
+        if name in imported:
+            print(f"FAIL: {name} is imported at startup")
+            ok = False
+
+    return ok
+
+
+class _CallCounter:
+    '''
+    Count the calls of the functions issuing system calls (os.read, select.select,
+    termios.tcsetattr...) made by one thread, by wrapping them for the duration
+    of the with block. Poll objects created inside the block are counted too.
+    '''
+    def __init__(self, thread_id: int):
+        import fcntl
+        import select
+        import termios
+
+        self._thread_id = thread_id
+        self._targets = [(os, "read"), (os, "write"), (os, "writev"),
+                         (select, "select"), (select, "poll"),
+                         (termios, "tcgetattr"), (termios, "tcsetattr"), (termios, "tcdrain"), (fcntl, "ioctl")]
+        self._originals = []
+        self.counts = {}            # type: Dict[str, int]
+
+    def __enter__(self) -> "_CallCounter":
+        for module, name in self._targets:
+            original = getattr(module, name)
+            self._originals.append((module, name, original))
+            key = f"{module.__name__}.{name}"
+            self.counts[key] = 0
+            if name == "poll":
+                setattr(module, name, self._wrap_poll(original))
+            else:
+                setattr(module, name, self._wrap(key, original))
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        for module, name, original in self._originals:
+            setattr(module, name, original)
+        self._originals.clear()
+
+    def _wrap(self, key: str, function: Callable) -> Callable:
+        def wrapper(*args, **kwargs):
+            if threading.get_ident() == self._thread_id:
+                self.counts[key] += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    def _wrap_poll(self, poll: Callable) -> Callable:
+        counter = self
+
+        class CountingPoll:
+            def __init__(self):
+                self._poller = poll()
+                self.register = self._poller.register
+                self.unregister = self._poller.unregister
+
+            def poll(self, *args):
+                if threading.get_ident() == counter._thread_id:
+                    counter.counts["select.poll"] += 1
+                return self._poller.poll(*args)
+
+        return CountingPoll
+
+
+def _open_channel(kind: str, port: str) -> Tuple[Any, Dict[str, Any]]:
+    '''
+    Return the port object and the ModemSocket arguments driving it.
+    '''
+    if kind == "termios":
+        from ymodem.Transport import TermiosChannel
+
+        channel = TermiosChannel(port, 115200)
+        channel.open()
+        return channel, {"read": channel.read, "write": channel.write, "writev": channel.writev, "flush": channel.flush}
+
+    import serial
+
+    serial_io = serial.Serial(port, 115200, timeout=1)
+    if kind == "serial":
+        from ymodem.Transport import SerialChannel
+
+        channel = SerialChannel(serial_io)
+        return channel, {"read": channel.read, "write": channel.write, "flush": channel.flush}
+
+    # the read/write closures of the CLI before SerialChannel
+    def read(size: int, timeout: Optional[float] = 3) -> Any:
+        serial_io.timeout = timeout
+        return serial_io.read(size)
+
+    def write(data: bytes, timeout: Optional[float] = 3) -> Any:
+        serial_io.write_timeout = timeout
+        serial_io.write(data)
+        serial_io.flush()
+
+    return serial_io, {"read": read, "write": write}
+
+
+def measure_syscalls(kind: str, direction: str, size: int) -> Tuple[Dict[str, int], float]:
+    '''
+    Transfer size bytes over a pseudo terminal, the channel under test on the
+    slave side and a plain file descriptor peer on the master side. Return the
+    calls made by the channel side and the duration of the transfer.
+    '''
+    import pty
+    import select
+    import tty
+
+    from ymodem.Socket import ModemSocket
+    from ymodem.Stream import Source
+
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    port = os.ttyname(slave)
+
+    def peer_read(n: int, timeout: Optional[float] = 1) -> bytes:
+        data = b""
+        deadline = time.monotonic() + (timeout or 0)
+        while len(data) < n:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([master], [], [], remaining)[0]:
+                break
+            data += os.read(master, n - len(data))
+        return data
+
+    def peer_write(data: bytes, timeout: Optional[float] = 1) -> None:
+        view = memoryview(bytes(data))
+        while view:
+            select.select([], [master], [], timeout)
+            view = view[os.write(master, view):]
+
+    payload = os.urandom(size)
+    received = []
+    peer = ModemSocket(peer_read, peer_write)
+    result = {}
+
+    # the configuration of the port when it is opened is not part of the transfer
+    channel, socket_args = _open_channel(kind, port)
+    try:
+        socket = ModemSocket(socket_args.pop("read"), socket_args.pop("write"), **socket_args)
+        with _CallCounter(threading.get_ident()) as counter:
+            if direction == "send":
+                thread = threading.Thread(target=lambda: result.setdefault("peer", peer.recv(lambda info: received.append)))
+                start = time.perf_counter()
+                thread.start()
+                result["channel"] = socket.send([Source("benchmark.bin", payload)])
+            else:
+                thread = threading.Thread(target=lambda: result.setdefault("peer", peer.send([Source("benchmark.bin", payload)])))
+                start = time.perf_counter()
+                thread.start()
+                result["channel"] = socket.recv(lambda info: received.append)
+            duration = time.perf_counter() - start
+            thread.join()
+    finally:
+        channel.close()
+        os.close(master)
+        os.close(slave)
+
+    if not (result.get("channel") and result.get("peer")) or b"".join(received) != payload:
+        raise RuntimeError(f"Transfer through the {kind} channel failed")
+    return counter.counts, duration
+
+
+def check_syscalls(channels: List[str], size_mb: float = 1) -> bool:
+    size = int(size_mb * 1024 * 1024)
+    keys = ["termios.tcgetattr", "termios.tcsetattr", "termios.tcdrain", "fcntl.ioctl", "select.select", "select.poll", "os.read", "os.write", "os.writev"]
+    ok = True
+
+    print(f"{'channel':8} {'dir':4} " + " ".join(f"{key.split('.')[1]:>9}" for key in keys) + f" {'total':>9} {'seconds':>8}  (calls per MB)")
+    for kind in channels:
+        for direction in ("send", "recv"):
+            try:
+                counts, duration = measure_syscalls(kind, direction, size)
+            except ImportError as err:
+                print(f"{kind:8} {direction:4} skipped: {err}")
+                break
+            per_mb = {key: counts.get(key, 0) / size_mb for key in keys}
+            print(f"{kind:8} {direction:4} " + " ".join(f"{per_mb[key]:9.0f}" for key in keys)
+                  + f" {sum(per_mb.values()):9.0f} {duration:8.2f}")
+
+            reconfigure = counts.get("termios.tcgetattr", 0) + counts.get("termios.tcsetattr", 0)
+            if kind == "serial" and reconfigure > RECONFIGURE_BUDGET:
+                print(f"FAIL: {reconfigure} port reconfigurations in the transfer through SerialChannel (budget {RECONFIGURE_BUDGET})")
+                ok = False
+
+    return ok
+
+
+def _micro_cases(size: int) -> Dict[str, Callable[[], Any]]:
+    '''
+    Hot spots of the packet path, each called with a payload of size bytes.
+    '''
+    from ymodem.CRC import calc_checksum, calc_crc16, calc_crc32
+    from ymodem.Core import ReceiverCore, SenderCore, _psm, make_checksum, make_header, verify_checksum
+    from ymodem.Protocol import ProtocolType, ProtocolSubType
+    from ymodem.Stream import FileInfo
+
+    payload = bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+    crc_packet = bytes(payload + make_checksum(1, payload))
+    sum_packet = bytes(payload + make_checksum(0, payload))
+
+    style_id = _psm.get_available_styles()[2]
+    features = _psm.get_available_style(style_id).get_protocol_features(ProtocolType.YMODEM)
+    sender = SenderCore(ProtocolType.YMODEM, ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION, features, size)
+    info = FileInfo("firmware-image.bin", 123456789, 1700000000)
+    header_data, _ = sender._make_file_header(info)
+    header_packet = header_data + make_checksum(1, header_data)
+    receiver = ReceiverCore(ProtocolType.YMODEM, ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION, features, style_id)
+
+    def parse_header() -> None:
+        receiver._on_header_packet(0, 0, header_packet)
+        receiver._events.clear()
+
+    return {
+        "crc16":            lambda: calc_crc16(payload),
+        "checksum":         lambda: calc_checksum(payload),
+        "crc32":            lambda: calc_crc32(payload),
+        "make_header":      lambda: make_header(size, 1),
+        "make_crc16":       lambda: make_checksum(1, payload),
+        "make_checksum":    lambda: make_checksum(0, payload),
+        "verify_crc16":     lambda: verify_checksum(1, crc_packet),
+        "verify_checksum":  lambda: verify_checksum(0, sum_packet),
+        "build_filename":   lambda: sender._make_file_header(info),
+        "parse_filename":   parse_header,
+    }
+
+
+def measure_micro(iterations: int = 1000, repeat: int = 5) -> Dict[str, float]:
+    '''
+    Return the best time of every case in nanoseconds per call, keyed by "case/size".
+    '''
+    results = {}
+    for size in MICRO_SIZES:
+        for name, case in _micro_cases(size).items():
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter_ns()
+                for _ in range(iterations):
+                    case()
+                elapsed = (time.perf_counter_ns() - start) / iterations
+                if best is None or elapsed < best:
+                    best = elapsed
+            results[f"{name}/{size}"] = best
+    return results
+
+
+def check_micro(iterations: int = 1000,
+                save: Optional[str] = None,
+                baseline: Optional[str] = MICRO_BASELINE,
+                tolerance: float = MICRO_TOLERANCE) -> bool:
+    results = measure_micro(iterations)
+    reference = {}          # type: Dict[str, float]
+    if baseline:
+        with open(baseline, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        reference = stored["results"]
+        recorded = (stored.get("implementation"), stored.get("python"), stored.get("machine"))
+        current = (platform.python_implementation(), platform.python_version(), platform.machine())
+        if recorded != current:
+            print(f"Note: the baseline was recorded with {' '.join(map(str, recorded))}, this is {' '.join(current)}")
+    ok = True
+
+    print(f"{'case':24} {'ns/call':>12} {'MB/s':>9} {'baseline':>12} {'change':>8}")
+    for key, elapsed in results.items():
+        size = int(key.split("/")[1])
+        line = f"{key:24} {elapsed:12.0f} {size * 1000 / elapsed:9.1f}"
+        if key in reference:
+            change = elapsed / reference[key] - 1
+            line += f" {reference[key]:12.0f} {change:+8.1%}"
+            if change > tolerance:
+                line += "  FAIL"
+                ok = False
+        print(line)
+
+    if baseline and not ok:
+        print(f"FAIL: slower than the baseline {baseline} by more than {tolerance:.0%}")
+
+    if save:
+        with open(save, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(),
+                       "implementation": platform.python_implementation(),
+                       "machine": platform.machine(),
+                       "iterations": iterations,
+                       "results": results}, f, indent=2)
+            f.write("\n")
+
+    return ok
+
+
+class _MemoryPipe:
+    '''
+    One direction of an in-memory link with a bounded buffer.
+    '''
+    def __init__(self, capacity: int = SCALE_LINK_CAPACITY):
+        self._buffer = bytearray()
+        self._capacity = capacity
+        self._cond = threading.Condition()
+        self.closed = False
+
+    def write(self, data: Any, timeout: Optional[float] = None) -> int:
+        data = bytes(data)
+        with self._cond:
+            while len(self._buffer) >= self._capacity and not self.closed:
+                self._cond.wait(1)
+            self._buffer += data
+            self._cond.notify_all()
+        return len(data)
+
+    def read(self, size: int, timeout: Optional[float] = None) -> bytes:
+        deadline = time.monotonic() + (timeout or 0)
+        with self._cond:
+            while len(self._buffer) < size and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            self._cond.notify_all()
+        return data
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+def _synthetic_chunks(size: int, checksum: List[int]) -> Any:
+    '''
+    Yield size bytes in chunks of 64 KiB, every chunk starting with its index so that
+    a packet delivered twice or out of order changes the CRC-32 kept in checksum[0].
+    '''
+    import zlib
+
+    pattern = bytes(range(256)) * 256
+    index = 0
+    while size > 0:
+        chunk = (index.to_bytes(8, "big") + pattern[8:])[:size]
+        checksum[0] = zlib.crc32(chunk, checksum[0])
+        size -= len(chunk)
+        index += 1
+        yield chunk
+
+
+def _peak_rss() -> int:
+    '''
+    Peak resident set size of the process in bytes, 0 where it cannot be read.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure_scale(mode: str, size: int, nak_every: int = 0, trace_bytes: int = SCALE_TRACE_BYTES) -> Dict[str, Any]:
+    '''
+    Send one synthetic file of size bytes through an in-memory link, the receiver
+    in a second thread, and return throughput, memory and the integrity checks.
+
+    Python allocations are traced until trace_bytes have been received, the
+    resident set size is watched over the whole file. Throughput is None when
+    the whole file was traced.
+
+    Every nak_every-th ACK of a data packet is turned into a NAK, so that the
+    sender repeats a packet the receiver already has and the receiver must drop
+    it as a duplicate, also after the sequence number has wrapped around.
+    '''
+    import tracemalloc
+    import zlib
+    from ymodem.Metrics import Metrics
+    from ymodem.Protocol import ProtocolType
+    from ymodem.Socket import ModemSocket
+    from ymodem.Stream import Source
+
+    protocol, options, packet_size, _, _ = SCALE_MODES[mode]
+    protocol_type = ProtocolType.XMODEM if protocol == "xmodem" else ProtocolType.YMODEM
+    packet_count = (size + packet_size - 1) // packet_size
+
+    to_receiver, to_sender = _MemoryPipe(), _MemoryPipe()
+    acks = [0]
+    naks = [0]
+
+    def receiver_write(data: Any, timeout: Optional[float] = None) -> int:
+        if data == b"\x06":
+            acks[0] += 1
+            # leave the first packets and the end of the file alone, a NAK there is not a lost ACK
+            if nak_every > 0 and 2 < acks[0] <= packet_count and acks[0] % nak_every == 0:
+                naks[0] += 1
+                data = b"\x15"
+        return to_sender.write(data, timeout)
+
+    sent_checksum = [0]
+    received = [0, 0]
+    # peak traced memory, end of tracing
+    traced = [0, 0.0]
+
+    def sink(info: Any) -> Callable[[bytes], None]:
+        def write(data: bytes) -> None:
+            received[0] = zlib.crc32(data, received[0])
+            received[1] += len(data)
+            if received[1] >= trace_bytes and tracemalloc.is_tracing():
+                traced[0] = tracemalloc.get_traced_memory()[1]
+                traced[1] = time.perf_counter()
+                tracemalloc.stop()
+        return write
+
+    metrics = Metrics()
+    sender = ModemSocket(to_sender.read, to_receiver.write, protocol_type, options, packet_size,
+                         metrics=metrics, metrics_port="memory")
+    receiver = ModemSocket(to_receiver.read, receiver_write, protocol_type, options, packet_size,
+                           metrics=metrics, metrics_port="memory")
+    source = Source("synthetic.bin", _synthetic_chunks(size, sent_checksum), size)
+
+    rss_before = _peak_rss()
+    tracemalloc.start()
+    results = {}
+    thread = threading.Thread(target=lambda: results.__setitem__("received", receiver.recv(sink)), daemon=True)
+    start = time.perf_counter()
+    thread.start()
+    try:
+        results["sent"] = sender.send([source])
+    finally:
+        thread.join(60)
+        to_receiver.close()
+        to_sender.close()
+        thread.join()
+    end = time.perf_counter()
+    throughput = None
+    if tracemalloc.is_tracing():
+        traced[0] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    elif received[1] > trace_bytes:
+        throughput = (received[1] - trace_bytes) / (end - traced[1]) / (1024 * 1024)
+
+    send_series = metrics.recorder("memory", "send")
+    return {
+        "ok": bool(results.get("sent")) and bool(results.get("received")),
+        "intact": received[1] == size and received[0] == sent_checksum[0],
+        "packets": send_series.packets,
+        "wrapped": packet_count // 256,
+        "naks": naks[0],
+        "repeated": send_series.retransmits.get("nak", 0),
+        "seconds": end - start,
+        "throughput": throughput,
+        "peak": traced[0],
+        "rss": max(0, _peak_rss() - rss_before),
+    }
+
+
+def check_scale(modes: List[str], size_mb: List[float], nak_every: int = 1000, trace_mb: float = SCALE_TRACE_BYTES / (1024 * 1024)) -> bool:
+    ok = True
+
+    print(f"{'mode':9} {'MB':>6} {'packets':>9} {'wraps':>6} {'naks':>5} {'MB/s':>6} {'peak KB':>8} {'rss MB':>7}  result")
+    for mode in modes:
+        _, _, _, min_throughput, peak_budget = SCALE_MODES[mode]
+        for mb in size_mb:
+            # YMODEM-G has no ACK to turn into a NAK
+            result = measure_scale(mode, int(mb * 1024 * 1024), 0 if "g" in SCALE_MODES[mode][1] else nak_every,
+                                   int(trace_mb * 1024 * 1024))
+
+            failures = []
+            if not result["ok"]:
+                failures.append("transfer failed")
+            if not result["intact"]:
+                failures.append("data corrupted")
+            if result["repeated"] != result["naks"]:
+                failures.append(f"{result['repeated']} packets repeated for {result['naks']} NAKs")
+            if result["throughput"] is not None and result["throughput"] < min_throughput:
+                failures.append(f"slower than {min_throughput} MB/s")
+            if result["peak"] > peak_budget:
+                failures.append(f"peak memory over {peak_budget // 1024} KB")
+            if result["rss"] > SCALE_RSS_BUDGET:
+                failures.append(f"RSS grew over {SCALE_RSS_BUDGET // (1024 * 1024)} MB")
+
+            print(f"{mode:9} {mb:6g} {result['packets']:9} {result['wrapped']:6} {result['naks']:5} "
+                  + ("     -" if result["throughput"] is None else f"{result['throughput']:6.2f}")
+                  + f" {result['peak'] / 1024:8.0f} {result['rss'] / (1024 * 1024):7.1f}  "
+                  + ("; ".join(failures) if failures else "OK"))
+            if failures:
+                ok = False
+
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='ymodem.Benchmark',
+        description='ymodem performance checks',
+    )
+    subparsers = parser.add_subparsers(title='Commands', dest='cmd', required=True)
+
+    importtime_argparser = subparsers.add_parser('importtime', help="Check the import time of the CLI")
+    importtime_argparser.add_argument("-m", "--module", type=str, default="ymodem.__main__", help="Module to import, default ymodem.__main__")
+    importtime_argparser.add_argument("--budget-ms", type=float, default=IMPORT_TIME_BUDGET_MS, help=f"Import time budget, default {IMPORT_TIME_BUDGET_MS} ms")
+    importtime_argparser.add_argument("-r", "--runs", type=int, default=5, help="Number of measurements, the best one is used, default 5")
+
+    syscalls_argparser = subparsers.add_parser('syscalls', help="Count the system calls per MB transferred over a pseudo terminal (Linux)")
+    syscalls_argparser.add_argument("-s", "--size-mb", type=float, default=1, help="Size of the transfer, default 1 MB")
+    syscalls_argparser.add_argument("-c", "--channel", nargs="+", choices=SYSCALL_CHANNELS, default=SYSCALL_CHANNELS,
+                                    help="Channels to measure, default all")
+
+    micro_argparser = subparsers.add_parser('micro', help="Time CRC, checksum, framing and filename packet code, compare with a baseline")
+    micro_argparser.add_argument("-n", "--iterations", type=int, default=1000, help="Calls per measurement, the best of 5 is used, default 1000")
+    micro_argparser.add_argument("--save", type=str, metavar="PATH", help="Write the results as JSON, e.g. to make a baseline")
+    micro_argparser.add_argument("--baseline", type=str, metavar="PATH", default=MICRO_BASELINE,
+                                 help="JSON results to compare with, fail on a regression, default the baseline of the package")
+    micro_argparser.add_argument("--no-baseline", dest="baseline", action="store_const", const=None, help="Only print the results")
+    micro_argparser.add_argument("--tolerance", type=float, default=MICRO_TOLERANCE,
+                                 help=f"Slowdown tolerated against the baseline, default {MICRO_TOLERANCE} ({MICRO_TOLERANCE:.0%})")
+
+    scale_argparser = subparsers.add_parser('scale', help="Stream large synthetic files in memory, check throughput, memory and integrity")
+    scale_argparser.add_argument("--size-mb", type=float, nargs='+', default=[1024], help="File sizes to send, default 1024")
+    scale_argparser.add_argument("--mode", type=str, nargs='+', choices=list(SCALE_MODES), default=list(SCALE_MODES),
+                                 help=f"Protocol modes, default {' '.join(SCALE_MODES)}")
+    scale_argparser.add_argument("--nak-every", type=int, default=1000,
+                                 help="Turn every n-th ACK into a NAK to make the sender repeat a packet, 0 to disable, default 1000")
+    scale_argparser.add_argument("--trace-mb", type=float, default=SCALE_TRACE_BYTES / (1024 * 1024),
+                                 help="MB traced with tracemalloc at the start of every file, default 16")
+
+    args = parser.parse_args(argv)
+
+    if args.cmd == 'importtime':
+        ok = check_import_time(args.module, args.budget_ms, runs=args.runs)
+    elif args.cmd == 'syscalls':
+        # the transfers are expected to succeed, keep their log quiet
+        logging.basicConfig(level=logging.ERROR)
+        ok = check_syscalls(args.channel, args.size_mb)
+    elif args.cmd == 'micro':
+        # the filename packet is parsed over and over, keep its log quiet
+        logging.basicConfig(level=logging.ERROR)
+        ok = check_micro(args.iterations, args.save, args.baseline, args.tolerance)
+    elif args.cmd == 'scale':
+        # the packets repeated on purpose are logged as warnings
+        logging.basicConfig(level=logging.ERROR)
+        ok = check_scale(args.mode, args.size_mb, args.nak_every, args.trace_mb)
+    else:
+        ok = False
+
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
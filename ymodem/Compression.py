@@ -0,0 +1,75 @@
+'''
+Transparent compression between two instances of this library.
+
+The sender offers a method in the filename packet, the receiver accepts it
+before requesting the data. The compressed stream is self-terminating, so the
+padding of the last packet is simply ignored by the decompressor.
+'''
+from typing import Any, List
+
+def available_methods() -> List[str]:
+    return ["zlib", "lzma"]
+
+
+def compression_levels(method: str) -> range:
+    '''
+    Levels accepted by a method: -1 (default) to 9 for zlib, presets 0 to 9 for lzma.
+    '''
+    return range(-1, 10) if method == "zlib" else range(0, 10)
+
+
+def _new_compressor(method: str, level: int) -> Any:
+    # imported on demand to keep them out of the package import time
+    if method == "zlib":
+        import zlib
+        return zlib.compressobj(level)
+    elif method == "lzma":
+        import lzma
+        return lzma.LZMACompressor(preset=level)
+    else:
+        raise ValueError(f"Invalid compression method specified: {method}")
+
+
+def _new_decompressor(method: str) -> Any:
+    if method == "zlib":
+        import zlib
+        return zlib.decompressobj()
+    elif method == "lzma":
+        import lzma
+        return lzma.LZMADecompressor()
+    else:
+        raise ValueError(f"Invalid compression method specified: {method}")
+
+
+class Compressor:
+    '''
+    Incremental compressor for the payload of sent packets.
+    '''
+    def __init__(self, method: str, level: int = 6):
+        if level not in compression_levels(method):
+            raise ValueError(f"Invalid compression level specified: {level}")
+        self._compressor = _new_compressor(method, level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class Decompressor:
+    '''
+    Incremental decompressor for the payload of received packets.
+    Data following the end of the compressed stream (padding) is discarded.
+    '''
+    def __init__(self, method: str):
+        self._decompressor = _new_decompressor(method)
+
+    @property
+    def eof(self) -> bool:
+        return self._decompressor.eof
+
+    def decompress(self, data: bytes) -> bytes:
+        if self._decompressor.eof:
+            return b""
+        return self._decompressor.decompress(data)
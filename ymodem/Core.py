@@ -0,0 +1,1569 @@
+'''
+Sans-I/O implementation of the XMODEM / YMODEM state machines.
+
+The cores never touch a port, a file or a clock. The caller feeds them the
+bytes read from the channel with receive_data() and reports the expiry of
+the current timer with timeout(). In return, data_to_send() gives the bytes
+to write to the channel and next_event() what happened to the files.
+
+    wait_time   seconds to wait for input before calling timeout(),
+                measured from the last change of timer
+    timer       incremented every time the core arms a new timer
+    read_size   number of bytes the core is waiting for
+    idle        the core waits for a call of the caller, not for input
+    done        the session is over, result tells whether it succeeded
+
+ModemSocket drives them over a read/write channel, the same cores can be
+driven by an event loop or fed from a capture for testing.
+'''
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+from ymodem.Compression import Compressor, Decompressor, available_methods
+from ymodem.CRC import calc_crc16, calc_checksum
+from ymodem.Digest import Digest, available_digests
+from ymodem.Platform import Platform
+from ymodem.Protocol import ProtocolType, ProtocolSubType, ProtocolStyleManagement, YMODEM
+from ymodem.Stream import FileInfo
+
+ACK = b'\x06'
+CAN = b'\x18'
+CRC = b'\x43'
+EOT = b'\x04'
+G   = b'\x67'
+NAK = b'\x15'
+SOH = b'\x01'
+STX = b'\x02'
+XON = b'\x11'
+XOFF = b'\x13'
+
+_psm = ProtocolStyleManagement()
+
+#############################################################################################
+#
+#                                         Packets
+#
+#############################################################################################
+
+def make_header(packet_size: int, sequence: int) -> bytearray:
+    assert packet_size in (128, 1024), packet_size
+    _bytes = []
+    if packet_size == 128:
+        _bytes.append(ord(SOH))
+    elif packet_size == 1024:
+        _bytes.append(ord(STX))
+    _bytes.extend([sequence, 0xff - sequence])
+    return bytearray(_bytes)
+
+
+def make_checksum(crc: int, data: Union[bytes, bytearray]) -> bytearray:
+    _bytes = []
+    if crc:
+        crc = calc_crc16(data)
+        _bytes.extend([crc >> 8, crc & 0xff])
+    else:
+        crc = calc_checksum(data)
+        _bytes.append(crc)
+    return bytearray(_bytes)
+
+
+def verify_checksum(crc: int, data: Union[bytes, bytearray]) -> Tuple[bool, bytes]:
+    '''
+    Split the checksum from the end of the packet and verify it.
+    Return the verification result and the payload.
+    '''
+    logger = logging.getLogger('ModemSocket')
+    if crc:
+        _checksum = bytearray(data[-2:])
+        remote_sum = (_checksum[0] << 8) + _checksum[1]
+        data = data[:-2]
+
+        local_sum = calc_crc16(data)
+        valid = bool(remote_sum == local_sum)
+        if not valid:
+            logger.debug("[Receiver]: CRC verification failed. Sender: %04x, Receiver: %04x.", remote_sum, local_sum)
+    else:
+        _checksum = bytearray([data[-1]])
+        remote_sum = _checksum[0]
+        data = data[:-1]
+
+        local_sum = calc_checksum(data)
+        valid = remote_sum == local_sum
+        if not valid:
+            logger.debug("[Receiver]: CRC verification failed. Sender: %02x, Receiver: %02x.", remote_sum, local_sum)
+    return valid, bytes(data)
+
+
+def _find_offer(extensions: List[bytes], prefix: bytes) -> Optional[str]:
+    '''
+    Value of the extension of the filename packet starting with prefix, None if there is none.
+    '''
+    for extension in extensions:
+        if extension.startswith(prefix):
+            return bytes.decode(extension[len(prefix):], "utf-8", "replace")
+    return None
+
+#############################################################################################
+#
+#                                         Events
+#
+#############################################################################################
+
+class Event:
+    __slots__ = ("task_index",)
+
+    def __init__(self, task_index: int):
+        self.task_index = task_index
+
+    def __repr__(self) -> str:
+        fields = []
+        for cls in type(self).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                fields.append(f"{name}={getattr(self, name)!r}")
+        return f"{type(self).__name__}({', '.join(fields)})"
+
+
+class FileHeader(Event):
+    '''
+    Receiver: the filename packet was received. The caller opens the sink and
+    answers with accept_file(), or with abort() if it cannot.
+    '''
+    __slots__ = ("info", "compression")
+
+    def __init__(self, task_index: int, info: FileInfo, compression: Optional[str] = None):
+        super().__init__(task_index)
+        self.info = info
+        self.compression = compression
+
+
+class FileStarted(Event):
+    '''
+    The data of the file starts to flow.
+    '''
+    __slots__ = ("info",)
+
+    def __init__(self, task_index: int, info: FileInfo):
+        super().__init__(task_index)
+        self.info = info
+
+
+class Progress(Event):
+    __slots__ = ("name", "total", "done")
+
+    def __init__(self, task_index: int, name: str, total: int, done: int):
+        super().__init__(task_index)
+        self.name = name
+        self.total = total
+        self.done = done
+
+
+class Retransmit(Event):
+    '''
+    A packet is sent again (sender) or requested again (receiver).
+    sequence is 0 for the filename packet and None for EOT, cause is one of
+    NAK, TIMEOUT, CHECKSUM and SEQUENCE, reason the message for humans.
+    '''
+    __slots__ = ("sequence", "reason", "cause")
+
+    NAK         = "nak"
+    TIMEOUT     = "timeout"
+    CHECKSUM    = "checksum"
+    SEQUENCE    = "sequence"
+
+    def __init__(self, task_index: int, sequence: Optional[int], reason: str, cause: str):
+        super().__init__(task_index)
+        self.sequence = sequence
+        self.reason = reason
+        self.cause = cause
+
+
+class Data(Event):
+    '''
+    Receiver: data of the file, without padding and decompressed.
+    '''
+    __slots__ = ("data",)
+
+    def __init__(self, task_index: int, data: bytes):
+        super().__init__(task_index)
+        self.data = data
+
+
+class FileEnd(Event):
+    '''
+    Receiver: EOT was received. The caller closes the sink and answers with
+    finish_file(), the file is only acknowledged once it is safely stored.
+    '''
+    __slots__ = ("name",)
+
+    def __init__(self, task_index: int, name: str):
+        super().__init__(task_index)
+        self.name = name
+
+
+class FileDone(Event):
+    '''
+    The file is complete. digest is the hex digest of its data if a digest
+    method is set, verified tells whether the peer reported the same digest
+    in the trailer exchange, None without one.
+    '''
+    __slots__ = ("name", "total", "done", "digest", "verified")
+
+    def __init__(self, task_index: int, name: str, total: int, done: int,
+                 digest: Optional[str] = None, verified: Optional[bool] = None):
+        super().__init__(task_index)
+        self.name = name
+        self.total = total
+        self.done = done
+        self.digest = digest
+        self.verified = verified
+
+#############################################################################################
+#
+#                                          Cores
+#
+#############################################################################################
+
+class _Core(ABC):
+    ROLE = ""
+
+    def __init__(self,
+                 protocol_type: int,
+                 protocol_subtype: Optional[int],
+                 protocol_features: int):
+        self.logger = logging.getLogger('ModemSocket')
+
+        self.protocol_type = protocol_type
+        self.protocol_subtype = protocol_subtype
+        self.protocol_features = protocol_features
+
+        self._state = None
+        self._input = bytearray()
+        self._output = []                   # type: List[bytes]
+        self._events = deque()              # type: Deque[Event]
+        self._wait_time = None              # type: Optional[float]
+        self._timer = 0
+        self._done = False
+        self._result = False
+        self._retries = 0
+        self._task_index = -1
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    @property
+    def result(self) -> bool:
+        return self._result
+
+    @property
+    def timer(self) -> int:
+        return self._timer
+
+    @property
+    def wait_time(self) -> Optional[float]:
+        return self._wait_time
+
+    @property
+    def read_size(self) -> int:
+        return 1
+
+    @property
+    @abstractmethod
+    def idle(self) -> bool:
+        pass
+
+    def data_to_send(self) -> bytes:
+        if not self._output:
+            return b""
+        data = b"".join(self._output)
+        self._output.clear()
+        return data
+
+    def buffers_to_send(self) -> List[bytes]:
+        '''
+        Same as data_to_send(), without joining the buffers, e.g. the header,
+        payload and checksum of a packet, for a gathered write.
+        '''
+        buffers = self._output
+        self._output = []
+        return buffers
+
+    def next_event(self) -> Optional[Event]:
+        if self._events:
+            return self._events.popleft()
+        return None
+
+    def receive_data(self, data: Union[bytes, bytearray]) -> None:
+        if self._done:
+            return
+        self._input += data
+        self._process()
+
+    def timeout(self) -> None:
+        if not self._done:
+            self._on_timeout()
+
+    def abort(self, message: str) -> None:
+        '''
+        4.1 Graceful Abort
+        The YAM and Professional-YAM X/YMODEM routines recognize a sequence of two
+        consecutive CAN (Hex 18) characters without modem errors (overrun,
+        framing, etc.) as a transfer abort command. This sequence is recognized
+        when is waiting for the beginning of a block or for an acknowledgement to
+        a block that has been sent. The check for two consecutive CAN characters
+        reduces the number of transfers aborted by line hits. YAM sends eight CAN
+        characters when it aborts an XMODEM, YMODEM, or ZMODEM protocol file
+        transfer. Pro-YAM then sends eight backspaces to delete the CAN
+        characters from the remote's keyboard input buffer, in case the remote had
+        already aborted the transfer and was awaiting a keyboarded command.
+        '''
+        if self._done:
+            return
+        self.logger.error(message)
+        self._write(CAN + CAN)
+        self.logger.debug(f"[{self.ROLE}]: CAN ->")
+        self._finish(False)
+
+    def _cancelled(self, result: bool) -> None:
+        self.logger.debug(f"[{self.ROLE}]: <- CAN")
+        self.logger.warning(f"[{self.ROLE}]: Received a request from the {'Receiver' if self.ROLE == 'Sender' else 'Sender'} to cancel the transmission, exit.")
+        self._finish(result)
+
+    def _finish(self, result: bool) -> None:
+        self._done = True
+        self._result = result
+        self._wait_time = None
+        self._input.clear()
+
+    def _write(self, *buffers: Union[bytes, bytearray]) -> None:
+        self._output.extend(buffers)
+
+    def _arm(self, wait_time: Optional[float]) -> None:
+        self._wait_time = wait_time
+        self._timer += 1
+
+    @abstractmethod
+    def _process(self) -> None:
+        pass
+
+    @abstractmethod
+    def _on_timeout(self) -> None:
+        pass
+
+
+class SenderCore(_Core):
+    '''
+    Sender state machine.
+
+    For every file, call start_file(), then feed the content with send_data()
+    while wants_data is set and call end_file() at the end of the data. Once
+    the core is idle again, start the next file or call end_batch().
+
+    A file given as a packet image (ymodem.Image) needs no feeding, its frames
+    are written as they are. Only the checksum is computed again if the
+    receiver asks for the other checksum mode, and only the filename packet is
+    built again if the image was made for another style.
+    '''
+    ROLE = "Sender"
+
+    # states
+    IDLE                = 0
+    WAIT_HEADER_REQUEST = 1
+    WAIT_HEADER_ACK     = 2
+    WAIT_DATA_REQUEST   = 3
+    SENDING             = 4
+    WAIT_EOT_ACK        = 5
+    WAIT_END_REQUEST    = 6
+    WAIT_TRAILER_ACK    = 7
+
+    # waiting for ACK, a NAK is retransmitted at once
+    RETRY_TIMEOUT       = 10
+
+    # YMODEM-G paused by XOFF, the stream resumes without XON after this many seconds
+    PAUSE_TIMEOUT       = 10
+
+    def __init__(self,
+                 protocol_type: int,
+                 protocol_subtype: Optional[int],
+                 protocol_features: int,
+                 packet_size: int,
+                 compression: Optional[str] = None,
+                 compression_level: int = 6,
+                 start_timeout: float = 60,
+                 digest: Optional[str] = None,
+                 digest_trailer: bool = False,
+                 xonxoff: bool = False):
+        super().__init__(protocol_type, protocol_subtype, protocol_features)
+        self._state = self.IDLE
+        if digest_trailer and not digest:
+            raise ValueError("A digest trailer requires a digest method")
+        self._digest_method = digest
+        self._digest_trailer = digest_trailer
+        # wait for the first request of the receiver
+        self._start_timeout = start_timeout
+        self._packet_size = packet_size
+        self._compression = compression
+        self._compression_level = compression_level
+        self._xonxoff = xonxoff
+
+        self._crc = None                    # type: Optional[int]
+        self._info = None                   # type: Optional[FileInfo]
+        self._offered = False
+        self._compressor = None             # type: Optional[Compressor]
+        self._pending = bytearray()
+        self._eof = False
+        self._sequence = 0
+        self._fed = 0
+        self._packed = 0
+        self._sent = 0
+        # (compressed bytes, file bytes given until then) of each output of the compressor
+        self._marks = deque()               # type: Deque[Tuple[int, int]]
+        self._compressed = 0
+        self._in_flight = None              # type: Optional[Tuple[bytes, ...]]
+        self._in_flight_done = 0
+        self._image = None                  # type: Optional[Any]
+        self._digest = None                 # type: Optional[Digest]
+        self._trailer_offered = False
+        self._trailer_accepted = False
+        self._verified = None               # type: Optional[bool]
+        self._paused = False
+
+    @property
+    def packet_size(self) -> int:
+        return self._packet_size
+
+    @property
+    def idle(self) -> bool:
+        return self._state == self.IDLE and not self._done
+
+    @property
+    def wants_data(self) -> bool:
+        return (self._state == self.SENDING and not self._eof and len(self._pending) < self._packet_size and self._image is None
+                and not self._paused)
+
+    @property
+    def awaiting_request(self) -> bool:
+        '''
+        Waiting for a C / G / NAK of the receiver. The driver passes all the
+        input that is already there to receive_data() at once, so that a run
+        of queued requests is seen as a whole.
+        '''
+        return self._state in (self.WAIT_HEADER_REQUEST, self.WAIT_DATA_REQUEST, self.WAIT_END_REQUEST) and not self._done
+
+    @property
+    def wants_input(self) -> bool:
+        '''
+        YMODEM-G with XON/XOFF: nothing waits for the receiver while the data
+        streams, so the input has to be looked at between two packets for an
+        XOFF. The driver reads what is there without waiting and passes it to
+        receive_data(), which also sends the next packet unless data is wanted.
+        '''
+        return self._xonxoff and self._streaming and self._state == self.SENDING and not self._paused and not self._done
+
+    @property
+    def _streaming(self) -> bool:
+        return self.protocol_type == ProtocolType.YMODEM and self.protocol_subtype == ProtocolSubType.YMODEM_G_FILE_TRANSMISSION
+
+    def receive_data(self, data: Union[bytes, bytearray]) -> None:
+        super().receive_data(data)
+        if self.wants_input and not self.wants_data:
+            self._pump()
+
+    def start_file(self, task_index: int, info: FileInfo, image: Optional[Any] = None) -> None:
+        '''
+        param image: PacketImage of the file, its frames are sent instead of the data given to send_data()
+        '''
+        assert self._state == self.IDLE, self._state
+        self._task_index = task_index
+        self._info = info
+        self._image = image
+        self._offered = False
+        self._compressor = None
+        self._pending.clear()
+        self._eof = False
+        self._fed = 0
+        self._packed = 0
+        self._sent = 0
+        self._marks.clear()
+        self._compressed = 0
+        self._in_flight = None
+        self._digest = Digest(self._digest_method) if self._digest_method else None
+        self._trailer_offered = False
+        self._trailer_accepted = False
+        self._verified = None
+        self._paused = False
+
+        '''
+        7.3.3 Sending_program_considerations
+
+        While waiting for transmission to begin, the sender has only a single very
+        long timeout, say one minute.
+        '''
+        if self.protocol_type == ProtocolType.YMODEM:
+            self._state = self.WAIT_HEADER_REQUEST
+        else:
+            self._state = self.WAIT_DATA_REQUEST
+        # nothing has been heard of the receiver before its first request
+        self._arm(self._start_timeout if self._crc is None else 60)
+        self._process()
+
+    def send_data(self, data: Union[bytes, bytearray]) -> None:
+        if self._state != self.SENDING or self._eof:
+            return
+        self._fed += len(data)
+        if self._digest:
+            self._digest.update(data)
+        if self._compressor:
+            data = self._compressor.compress(data)
+            self._mark(len(data))
+        self._pending += data
+        self._pump()
+
+    def end_file(self) -> None:
+        if self._state != self.SENDING or self._eof:
+            return
+        self.logger.debug("[Sender]: Reached EOF")
+        self._eof = True
+        if self._compressor:
+            data = self._compressor.flush()
+            self._mark(len(data))
+            self._pending += data
+        self._pump()
+
+    def _mark(self, size: int) -> None:
+        '''
+        The compressor holds back data, the bytes of the file are only counted
+        as done once the output that followed them is sent.
+        '''
+        if size:
+            self._compressed += size
+            self._marks.append((self._compressed, self._fed))
+
+    def end_batch(self) -> None:
+        '''
+        5. YMODEM Batch File Transmission
+
+        Transmission of a null pathname terminates batch file transmission.
+        '''
+        assert self._state == self.IDLE, self._state
+        if self.protocol_type != ProtocolType.YMODEM:
+            self._finish(True)
+        # nothing was sent (e.g. empty directory), the batch end packet still answers the receiver's request
+        elif self._crc is None:
+            self._state = self.WAIT_END_REQUEST
+            self._arm(self._start_timeout)
+            self._process()
+        else:
+            self._send_batch_end()
+
+    def _send_batch_end(self) -> None:
+        data = bytes(self._packet_size)
+        self._write(bytes(make_header(self._packet_size, 0)), data, bytes(make_checksum(self._crc, data)))
+        self.logger.debug("[Sender]: Batch end packet ->")
+        self._finish(True)
+
+    def _process(self) -> None:
+        while self._input and not self._done:
+            c = bytes(self._input[:1])
+            del self._input[:1]
+
+            if self._state in (self.WAIT_HEADER_REQUEST, self.WAIT_DATA_REQUEST, self.WAIT_END_REQUEST):
+                # a late sender finds every request queued, the last one tells the current mode of the receiver
+                if c in (NAK, CRC, G) and self._input[:1] in (NAK, CRC, G):
+                    continue
+                self._on_request(c)
+            elif self._state in (self.WAIT_HEADER_ACK, self.SENDING, self.WAIT_TRAILER_ACK, self.WAIT_EOT_ACK):
+                self._on_response(c)
+            else:
+                # keep the request of the receiver for the next file
+                self._input[:0] = c
+                return
+
+    def _on_request(self, c: bytes) -> None:
+        if c == CAN:
+            self._cancelled(True)
+            return
+        if c == YMODEM.COMPRESSION_ACCEPT and self._state == self.WAIT_DATA_REQUEST and self._offered:
+            self.logger.debug(f"[Sender]: <- Compression {self._compression} accepted")
+            self._compressor = Compressor(self._compression, self._compression_level)
+            return
+        if c == YMODEM.DIGEST_ACCEPT and self._state == self.WAIT_DATA_REQUEST and self._trailer_offered:
+            self.logger.debug("[Sender]: <- Digest trailer accepted")
+            self._trailer_accepted = True
+            return
+        if c not in (NAK, CRC, G):
+            return
+
+        if c == NAK:
+            self.logger.debug("[Sender]: <- NAK")
+            self._crc = 0
+        else:
+            self.logger.debug("[Sender]: <- CRC / G")
+            self._crc = 1
+        if self.protocol_type == ProtocolType.YMODEM:
+            self._follow_receiver_request(c)
+
+        if self._state == self.WAIT_HEADER_REQUEST:
+            self._send_header()
+        elif self._state == self.WAIT_DATA_REQUEST:
+            self._state = self.SENDING
+            self._sequence = 1
+            self._events.append(FileStarted(self._task_index, self._info))
+            self._pump()
+        else:
+            self._send_batch_end()
+
+    def _on_response(self, c: bytes) -> None:
+        if c == CAN:
+            self._cancelled(False)
+        elif c == XOFF and self._xonxoff and self._streaming and self._state == self.SENDING:
+            self.logger.debug("[Sender]: <- XOFF")
+            self._paused = True
+            self._arm(self.PAUSE_TIMEOUT)
+        elif c == XON and self._paused:
+            self.logger.debug("[Sender]: <- XON")
+            self._resume()
+        elif c == ACK:
+            self.logger.debug("[Sender]: <- ACK")
+            self._retries = 0
+            if self._state == self.WAIT_HEADER_ACK:
+                self._in_flight = None
+                self._state = self.WAIT_DATA_REQUEST
+                self._arm(60)
+            elif self._state == self.SENDING and self._in_flight is not None:
+                self._in_flight = None
+                self._sent = self._in_flight_done
+                self._events.append(Progress(self._task_index, self._info.name, self._info.length, self._sent))
+                self._pump()
+            elif self._state == self.WAIT_TRAILER_ACK:
+                self._verified = True
+                self._send_eot()
+            elif self._state == self.WAIT_EOT_ACK:
+                self._state = self.IDLE
+                self._arm(None)
+                self._events.append(FileDone(self._task_index, self._info.name, self._info.length, self._sent,
+                                             self._digest.hexdigest() if self._digest else None, self._verified))
+        elif c == YMODEM.DIGEST_MISMATCH and self._state == self.WAIT_TRAILER_ACK:
+            self.logger.error(f"[Sender]: The Receiver reported a different digest for {self._info.name}.")
+            self._verified = False
+            self._send_eot()
+        elif c == NAK:
+            if self._state in (self.WAIT_HEADER_ACK, self.WAIT_TRAILER_ACK, self.WAIT_EOT_ACK) or self._in_flight is not None:
+                self.logger.debug("[Sender]: <- NAK")
+                self._retransmit("NAK", Retransmit.NAK)
+
+    def _on_timeout(self) -> None:
+        if self._state in (self.WAIT_HEADER_REQUEST, self.WAIT_DATA_REQUEST):
+            self.abort("[Sender]: Waiting for command from Receiver has timed out, abort and exit!")
+        elif self._state == self.WAIT_END_REQUEST:
+            self.logger.warning("[Sender]: No request from Receiver for the batch end packet, exit.")
+            self._finish(False)
+        elif self._paused:
+            # rather than waiting forever for an XON that may have been lost
+            self.logger.warning(f"[Sender]: No XON from Receiver within {self.PAUSE_TIMEOUT} seconds, resume.")
+            self._resume()
+        elif self._state in (self.WAIT_HEADER_ACK, self.WAIT_TRAILER_ACK, self.WAIT_EOT_ACK) or self._in_flight is not None:
+            '''
+            7.3.3 Sending_program_considerations
+
+            In the current protocol, the sender has a
+            10 second timeout before retrying. I suggest NOT doing this, and letting
+            the protocol be completely receiver-driven. This will be compatible with
+            existing programs.
+            '''
+            self._retransmit("timeout", Retransmit.TIMEOUT)
+
+    def _retransmit(self, reason: str, cause: str) -> None:
+        '''
+        7.3.1 Common_to_Both_Sender_and_Receiver
+
+        All errors are retried 10 times.
+        '''
+        self._retries += 1
+        if self._retries >= 10:
+            self.abort("[Sender]: The number of retransmissions has reached the maximum limit, abort and exit!")
+            return
+
+        self.logger.warning("[Sender]: No ACK from Receiver, preparing to retransmit.")
+        if self._state == self.WAIT_HEADER_ACK:
+            self._events.append(Retransmit(self._task_index, 0, reason, cause))
+            self._write(*self._in_flight)
+            self.logger.debug("[Sender]: Filename packet ->")
+        elif self._state == self.WAIT_TRAILER_ACK:
+            self._events.append(Retransmit(self._task_index, None, reason, cause))
+            self._write(*self._in_flight)
+            self.logger.debug("[Sender]: Digest trailer ->")
+        elif self._state == self.WAIT_EOT_ACK:
+            self._events.append(Retransmit(self._task_index, None, reason, cause))
+            self._write(EOT)
+            self.logger.debug("[Sender]: EOT ->")
+        else:
+            sequence = self._in_flight[0][1]
+            self._events.append(Retransmit(self._task_index, sequence, reason, cause))
+            self._write(*self._in_flight)
+            self.logger.debug(f"[Sender]: Data packet {sequence} ->")
+        self._arm(self.RETRY_TIMEOUT)
+
+    def _send_header(self) -> None:
+        header = make_header(self._packet_size, 0)
+        self.logger.debug(f"[Sender]: {'SOH' if self._packet_size == 128 else 'STX'} ->")
+
+        # the filename packet of an image carries no offer
+        if (self._image is not None and self._image.features == self.protocol_features and self._image.crc == self._crc
+                and not self._digest_trailer):
+            packet = (self._image.frame(0), )
+            self._offered = False
+            self._trailer_offered = False
+        else:
+            data, self._offered = self._make_file_header(self._info)
+            self._trailer_offered = self._digest_trailer and b"\x00" + YMODEM.DIGEST_OFFER in data
+            packet = (bytes(header), data, bytes(make_checksum(self._crc, data)))
+        self._write(*packet)
+        self.logger.debug("[Sender]: Filename packet ->")
+
+        if self.protocol_subtype == ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION:
+            # expect for ACK and NAK
+            self._state = self.WAIT_HEADER_ACK
+            self._in_flight = packet
+            self._retries = 0
+            self._arm(self.RETRY_TIMEOUT)
+        # self.protocol_subtype == ProtocolSubType.YMODEM_G_FILE_TRANSMISSION
+        else:
+            self._state = self.WAIT_DATA_REQUEST
+            self._arm(60)
+
+    def _make_file_header(self, info: FileInfo) -> Tuple[bytes, bool]:
+        '''
+        Pathname
+
+        The pathname (conventionally, the file name) is sent as a null
+        terminated ASCII string. This is the filename format used by the
+        handle oriented MSDOS(TM) functions and C library fopen functions.
+        An assembly language example follows:
+        DB 'foo.bar',0
+        No spaces are included in the pathname. Normally only the file name
+        stem (no directory prefix) is transmitted unless the sender has
+        selected YAM's f option to send the full pathname. The source drive
+        (A:, B:, etc.) is not sent.
+        '''
+        # Python's handling is case compatible
+        data = info.name.encode("utf-8")
+
+        '''
+        Length
+
+        The file length and each of the succeeding fields are optional.[3]
+        The length field is stored in the block as a decimal string counting
+        the number of data bytes in the file. The file length does not
+        include any CPMEOF (^Z) or other garbage characters used to pad the
+        last block.
+        If the file being transmitted is growing during transmission, the
+        length field should be set to at least the final expected file
+        length, or not sent.
+        The receiver stores the specified number of characters, discarding
+        any padding added by the sender to fill up the last block.
+        '''
+        if self.protocol_features & YMODEM.USE_LENGTH_FIELD:
+            data += bytes(1)
+            data += str(info.length).encode("utf-8")
+
+        '''
+        Modification
+
+        Date The mod date is optional, and the filename and length
+        may be sent without requiring the mod date to be sent.
+        If the modification date is sent, a single space separates the
+        modification date from the file length.
+        The mod date is sent as an octal number giving the time the contents
+        of the file were last changed, measured in seconds from Jan 1 1970
+        Universal Coordinated Time (GMT). A date of 0 implies the
+        modification date is unknown and should be left as the date the file
+        is received.
+        This standard format was chosen to eliminate ambiguities arising from
+        transfers between different time zones.
+        '''
+        # Python 2+: 0123456
+        # Python 3+: 0o123456
+        if self.protocol_features & YMODEM.USE_DATE_FIELD:
+            mtime = oct(int(info.mtime))
+            if mtime.startswith("0o"):
+                data += (" " + mtime[2:]).encode("utf-8")
+            else:
+                data += (" " + mtime[1:]).encode("utf-8")
+
+        '''
+        Mode
+
+        If the file mode is sent, a single space separates the file mode
+        from the modification date. The file mode is stored as an octal
+        string. Unless the file originated from a Unix system, the file mode
+        is set to 0. rb(1) checks the file mode for the 0x8000 bit which
+        indicates a Unix type regular file. Files with the 0x8000 bit set
+        are assumed to have been sent from another Unix (or similar) system
+        which uses the same file conventions. Such files are not translated
+        in any way.
+        '''
+        if self.protocol_features & YMODEM.USE_MODE_FIELD:
+            if Platform.is_Linux():
+                data += (" " + oct(0x8000)).encode("utf-8")
+            else:
+                data += (" 0").encode("utf-8")
+
+        '''
+        Serial Number
+
+        If the serial number is sent, a single space separates the
+        serial number from the file mode. The serial number of the
+        transmitting program is stored as an octal string. Programs which do
+        not have a serial number should omit this field, or set it to 0. The
+        receiver's use of this field is optional.
+        '''
+        # This program does not set serial number
+        if self.protocol_features & YMODEM.USE_SN_FIELD:
+            data += (" 0").encode("utf-8")
+
+        # the offers follow the fields, an empty fields segment is written for the styles without any
+        if not self.protocol_features & YMODEM.USE_LENGTH_FIELD:
+            data += bytes(1)
+
+        offered = False
+        # the frames of an image cannot be compressed
+        if self._compression and self._image is None:
+            offer = b"\x00" + YMODEM.COMPRESSION_OFFER + self._compression.encode("utf-8")
+            if len(data) + len(offer) < self._packet_size:
+                data += offer
+                offered = True
+
+        if self._digest_trailer:
+            offer = b"\x00" + YMODEM.DIGEST_OFFER + self._digest_method.encode("utf-8")
+            if len(data) + len(offer) < self._packet_size:
+                data += offer
+
+        return data.ljust(self._packet_size, b"\x00"), offered
+
+    def _pump(self) -> None:
+        '''
+        Send the packets that the buffered data and the protocol allow:
+        one at a time in YMODEM / XMODEM, all of them in YMODEM-G.
+        '''
+        streaming = self._streaming
+
+        while self._state == self.SENDING and self._in_flight is None and not self._paused:
+            if self._image is None and len(self._pending) < self._packet_size and not self._eof:
+                # waiting for send_data()
+                return
+
+            if (self._image is not None and self._packed >= self._image.frame_count) or (self._image is None and not self._pending):
+                '''
+                2. YMODEM MINIMUM REQUIREMENTS
+
+                + At the end of each file, the sending program shall send EOT up to ten
+                times until it receives an ACK character. (This is part of the
+                XMODEM spec.)
+
+                7.3.3 Sending_program_considerations
+
+                When the sender has no more data, it sends an <eot>, and awaits an <ack>,
+                resending the <eot> if it doesn't get one. Again, the protocol could be
+                receiver-driven, with the sender only having the high-level 1-minute
+                timeout to abort.
+                '''
+                if self._trailer_accepted:
+                    self._send_trailer()
+                else:
+                    self._send_eot()
+                return
+
+            if self._image is not None:
+                packet, done = self._next_image_packet()
+            else:
+                packet, done = self._next_packet()
+            self._write(*packet)
+            self.logger.debug(f"[Sender]: Data packet {self._sequence} ->")
+            self._sequence = (self._sequence + 1) % 256
+
+            if streaming:
+                self._sent = done
+                self._events.append(Progress(self._task_index, self._info.name, self._info.length, self._sent))
+                # one packet, then the driver looks for an XOFF
+                if self._xonxoff:
+                    return
+            else:
+                # expect for ACK and NAK
+                self._in_flight = packet
+                self._in_flight_done = done
+                self._retries = 0
+                self._arm(self.RETRY_TIMEOUT)
+
+    def _resume(self) -> None:
+        self._paused = False
+        self._arm(60)
+        self._pump()
+
+    def _send_trailer(self) -> None:
+        hex_digest = self._digest.hexdigest().encode("ascii")
+        packet = (YMODEM.DIGEST_TRAILER, hex_digest, bytes(make_checksum(1, hex_digest)))
+        self._write(*packet)
+        self.logger.debug("[Sender]: Digest trailer ->")
+        # answered in YMODEM-G too
+        self._state = self.WAIT_TRAILER_ACK
+        self._in_flight = packet
+        self._retries = 0
+        self._arm(self.RETRY_TIMEOUT)
+
+    def _send_eot(self) -> None:
+        self._in_flight = None
+        self._write(EOT)
+        self.logger.debug("[Sender]: EOT ->")
+        self._state = self.WAIT_EOT_ACK
+        self._retries = 0
+        self._arm(self.RETRY_TIMEOUT)
+
+    def _next_packet(self) -> Tuple[Tuple[bytes, ...], int]:
+        data = bytes(self._pending[:self._packet_size])
+        del self._pending[:self._packet_size]
+
+        # progress is counted in bytes of the original file
+        self._packed += len(data)
+        if self._compressor:
+            done = self._sent
+            while self._marks and self._marks[0][0] <= self._packed:
+                done = self._marks.popleft()[1]
+        else:
+            done = self._packed
+
+        header = make_header(self._packet_size, self._sequence)
+        self.logger.debug(f"[Sender]: {'SOH' if self._packet_size == 128 else 'STX'} ->")
+        # fill with 1AH(^z)
+        data = data.ljust(self._packet_size, b"\x1a")
+        return (bytes(header), data, bytes(make_checksum(self._crc, data))), done
+
+    def _next_image_packet(self) -> Tuple[Tuple[Any, ...], int]:
+        # _packed counts the frames of an image
+        self._packed += 1
+        frame = self._image.frame(self._packed)
+        self.logger.debug(f"[Sender]: {'SOH' if self._image.packet_size == 128 else 'STX'} ->")
+        done = min(self._packed * self._image.packet_size, self._image.length)
+        if self._digest:
+            self._digest.update(self._image.payload(self._packed)[:done - (self._packed - 1) * self._image.packet_size])
+        if self._image.crc == self._crc:
+            packet = (frame, )
+        else:
+            payload = self._image.payload(self._packed)
+            packet = (frame[:3], payload, bytes(make_checksum(self._crc, payload)))
+        return packet, done
+
+    def _follow_receiver_request(self, c: bytes) -> None:
+        '''
+        The receiver starts YMODEM-G with G and a normal YMODEM batch with C or NAK.
+        Follow its choice if the style allows YMODEM-G.
+        '''
+        if c == G and self.protocol_features & YMODEM.ALLOW_YMODEM_G:
+            self.protocol_subtype = ProtocolSubType.YMODEM_G_FILE_TRANSMISSION
+        else:
+            self.protocol_subtype = ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION
+
+
+class ReceiverCore(_Core):
+    '''
+    Receiver state machine.
+
+    Answer FileHeader with accept_file() once the sink is open, store the
+    content of the Data events and answer FileEnd with finish_file() once
+    the sink is closed.
+
+    With wait_forever, the first filename packet is requested until a sender
+    answers instead of giving up after ten requests, for a receiver waiting
+    for batches.
+
+    poll_interval shortens the wait between two C / G requests, crc_requests
+    is the number of C requests before falling back to checksum mode, and
+    start_timeout bounds the wait for the first packet of the sender. A
+    request that is not answered is sent again until REQUEST_BUDGET seconds
+    have passed in the same mode.
+    '''
+    ROLE = "Receiver"
+
+    # 7.4 Programming Tips: first call it with a time of 10, then <nak> and try again, 10 times
+    REQUEST_INTERVAL    = 10
+    REQUEST_BUDGET      = 100
+
+    # states
+    REQUEST             = 0
+    WAIT_PACKET         = 1
+    PACKET              = 2
+    PURGE               = 3
+    AWAIT_ACCEPT        = 4
+    AWAIT_FINISH        = 5
+    TRAILER             = 6
+
+    # phases
+    HEADER_PHASE        = 0
+    DATA_PHASE          = 1
+
+    def __init__(self,
+                 protocol_type: int,
+                 protocol_subtype: Optional[int],
+                 protocol_features: int,
+                 style_id: str,
+                 protocol_type_options: List[str] = [],
+                 detect_style: bool = True,
+                 wait_forever: bool = False,
+                 poll_interval: Optional[float] = None,
+                 crc_requests: int = 10,
+                 start_timeout: Optional[float] = None,
+                 digest: Optional[str] = None):
+        super().__init__(protocol_type, protocol_subtype, protocol_features)
+        self._style_id = style_id
+        self._digest_method = digest
+        self._wait_forever = wait_forever
+        self._poll_interval = poll_interval or self.REQUEST_INTERVAL
+        self._crc_requests = crc_requests
+        # the daemon waits for its senders as long as it takes
+        self._start_timeout = None if wait_forever else start_timeout
+        self._heard = False
+        # seconds waited for the sender since the session started, and in the current request mode
+        self._start_waited = 0.0
+        self._request_waited = 0.0
+        self._session_style_id = style_id
+        self._protocol_type_options = protocol_type_options
+        self._detect_style = detect_style
+
+        self._phase = self.HEADER_PHASE
+        self._crc = 1
+        self._request = CRC
+        self._request_count = 0
+        self._packet_size = 128
+        self._packet_length = 0
+        self._info = FileInfo("")
+        self._compression = None            # type: Optional[str]
+        self._decompressor = None           # type: Optional[Decompressor]
+        # digest method of the trailer offered by the sender for the current file
+        self._trailer_method = None         # type: Optional[str]
+        self._digest = None                 # type: Optional[Digest]
+        self._verified = None               # type: Optional[bool]
+        self._sequence = 1
+        self._received = 0
+        self._success_packet_count = 0
+
+        if self.protocol_type == ProtocolType.YMODEM:
+            self._start_header_phase()
+        else:
+            # XMODEM has no filename packet
+            self._task_index = 0
+            self._state = self.AWAIT_ACCEPT
+            self._arm(None)
+            self._events.append(FileHeader(self._task_index, self._info))
+
+    @property
+    def read_size(self) -> int:
+        if self._state in (self.PACKET, self.TRAILER):
+            return max(self._packet_length - len(self._input), 1)
+        return 1
+
+    @property
+    def idle(self) -> bool:
+        return self._state in (self.AWAIT_ACCEPT, self.AWAIT_FINISH) and not self._done
+
+    @property
+    def awaiting_sender(self) -> bool:
+        '''
+        Nothing has been received from a sender yet in this session.
+        '''
+        return not self._heard and not self._done
+
+    @property
+    def _batch(self) -> bool:
+        return self.protocol_type == ProtocolType.XMODEM or self.protocol_subtype == ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION
+
+    def accept_file(self) -> None:
+        '''
+        5. YMODEM Batch File Transmission
+
+        After the filename block has been received,
+        it is ACK'ed if the write open is successful. If the file cannot be
+        opened for writing, the receiver cancels the transfer with CAN characters
+        as described above.
+        '''
+        assert self._state == self.AWAIT_ACCEPT, self._state
+        if self.protocol_type == ProtocolType.YMODEM:
+            self._write(ACK)
+            self.logger.debug("[Receiver]: ACK ->")
+            if self._compression:
+                self._decompressor = Decompressor(self._compression)
+                self._write(YMODEM.COMPRESSION_ACCEPT)
+                self.logger.debug(f"[Receiver]: Compression {self._compression} accepted ->")
+            if self._trailer_method:
+                self._write(YMODEM.DIGEST_ACCEPT)
+                self.logger.debug(f"[Receiver]: Digest trailer {self._trailer_method} accepted ->")
+
+        # the digest offered by the sender wins, so that the trailer can be compared
+        method = self._trailer_method or self._digest_method
+        self._digest = Digest(method) if method else None
+        self._verified = None
+
+        self._phase = self.DATA_PHASE
+        self._sequence = 1
+        self._received = 0
+        self._success_packet_count = 0
+        self._retries = 0
+        self._events.append(FileStarted(self._task_index, self._info))
+
+        '''
+        7.4 Programming Tips
+
+        + The character-receive subroutine should be called with a parameter
+        specifying the number of seconds to wait. The receiver should first
+        call it with a time of 10, then <nak> and try again, 10 times.
+        '''
+        self._request = CRC if self._batch else G
+        self._request_count = 0
+        self._request_waited = 0.0
+        self._send_request()
+        self._process()
+
+    def finish_file(self, stored: bool) -> None:
+        assert self._state == self.AWAIT_FINISH, self._state
+        if not stored:
+            self.abort("[Receiver]: Failed to write the file, abort and exit!")
+            return
+
+        self._write(ACK)
+        self.logger.debug("[Receiver]: ACK ->")
+        self._events.append(FileDone(self._task_index, self._info.name, self._info.length, self._received,
+                                     self._digest.hexdigest() if self._digest else None, self._verified))
+
+        if self.protocol_type == ProtocolType.YMODEM:
+            self._start_header_phase()
+            self._process()
+        else:
+            self._finish(True)
+
+    def _start_header_phase(self) -> None:
+        '''
+        5. YMODEM Batch File Transmission
+
+        As in the case of single a file transfer, the receiver initiates batch
+        file transmission by sending a "C" character (for CRC-16).
+
+        7.3.2 Receive_Program_Considerations
+
+        The receiver has a 10-second timeout. It sends a <nak> every time it
+        times out. The receiver's first timeout, which sends a <nak>, signals the
+        transmitter to start. Optionally, the receiver could send a <nak>
+        immediately, in case the sender was ready. This would save the initial 10
+        second timeout. However, the receiver MUST continue to timeout every 10
+        seconds in case the sender wasn't ready.
+        '''
+        self._phase = self.HEADER_PHASE
+        self._info = FileInfo("")
+        self._compression = None
+        self._decompressor = None
+        self._trailer_method = None
+        self._retries = 0
+        self._request = CRC if self._batch else G
+        self._request_count = 0
+        self._request_waited = 0.0
+        self._send_request()
+
+    def _send_request(self) -> None:
+        self._write(self._request)
+        self.logger.debug(f"[Receiver]: {'NAK' if self._request == NAK else 'CRC' if self._request == CRC else 'G'} ->")
+        self._request_count += 1
+        self._state = self.REQUEST
+
+        # a NAK queued while the sender was not listening yet would be taken for the NAK of its first packet
+        wait_time = self.REQUEST_INTERVAL if self._request == NAK else self._poll_interval
+        if self._start_timeout is not None and not self._heard:
+            wait_time = max(min(wait_time, self._start_timeout - self._start_waited), 0)
+        self._arm(wait_time)
+
+    def _process(self) -> None:
+        while self._input and not self._done:
+            if self._state in (self.REQUEST, self.WAIT_PACKET):
+                c = bytes(self._input[:1])
+                del self._input[:1]
+                self._on_start(c)
+
+            elif self._state in (self.PACKET, self.TRAILER):
+                if len(self._input) < self._packet_length:
+                    # one-second timeout for each character
+                    self._arm(1)
+                    return
+                packet = bytes(self._input[:self._packet_length])
+                del self._input[:self._packet_length]
+                if self._state == self.TRAILER:
+                    self._on_trailer(packet)
+                else:
+                    self._on_packet(packet)
+
+            elif self._state == self.PURGE:
+                self._input.clear()
+                # wait for the line to stay quiet
+                self._arm(1)
+
+            # waiting for the caller
+            else:
+                return
+
+    def _on_start(self, c: bytes) -> None:
+        if c == SOH or c == STX:
+            self._heard = True
+            if c == SOH:
+                self.logger.debug("[Receiver]: <- SOH")
+                self._packet_size = 128
+            else:
+                self.logger.debug("[Receiver]: <- STX")
+                self._packet_size = 1024
+
+            if self._state == self.REQUEST and self._phase == self.DATA_PHASE:
+                # the request character that started the data tells the checksum mode
+                self._crc = 0 if self._request == NAK else 1
+
+            # sequence, complement, payload and checksum
+            if self._phase == self.HEADER_PHASE:
+                self._packet_length = 2 + self._packet_size + 2
+            else:
+                self._packet_length = 2 + self._packet_size + 1 + self._crc
+
+            '''
+            7.3.2 Receive_Program_Considerations
+
+            Once into a receiving a block, the receiver goes into a one-second timeout
+            for each character and the checksum.
+            '''
+            self._state = self.PACKET
+            self._arm(1)
+
+        elif c == CAN:
+            self._cancelled(True)
+
+        elif c == YMODEM.DIGEST_TRAILER and self._phase == self.DATA_PHASE and self._trailer_method:
+            self.logger.debug("[Receiver]: <- Digest trailer")
+            # hex digest and CRC-16
+            self._packet_length = self._digest.size + 2
+            self._state = self.TRAILER
+            self._arm(1)
+
+        elif c == EOT and self._phase == self.DATA_PHASE:
+            self.logger.debug("[Receiver]: <- EOT")
+            if self._decompressor and not self._decompressor.eof:
+                self.logger.warning("[Receiver]: Compressed stream is incomplete.")
+            # the file is only confirmed once all of its data has reached the sink
+            self._state = self.AWAIT_FINISH
+            self._arm(None)
+            self._events.append(FileEnd(self._task_index, self._info.name))
+
+    def _on_trailer(self, packet: bytes) -> None:
+        valid, data = verify_checksum(1, packet)
+        if not valid:
+            self._on_error("Checksum failed.", self._sequence, Retransmit.CHECKSUM)
+            return
+
+        self._verified = bytes.decode(data, "ascii", "replace") == self._digest.hexdigest()
+        if self._verified:
+            self._write(ACK)
+            self.logger.debug("[Receiver]: ACK ->")
+        else:
+            self.logger.error(f"[Receiver]: The digest of {self._info.name} differs from the one of the Sender.")
+            self._write(YMODEM.DIGEST_MISMATCH)
+        self._state = self.WAIT_PACKET
+        self._arm(10)
+
+    def _on_packet(self, packet: bytes) -> None:
+        seq1 = packet[0]
+        seq2 = 0xff - packet[1]
+        if self._phase == self.HEADER_PHASE:
+            self._on_header_packet(seq1, seq2, packet[2:])
+        else:
+            self._on_data_packet(seq1, seq2, packet[2:])
+
+    def _on_header_packet(self, seq1: int, seq2: int, data: bytes) -> None:
+        if not seq1 == seq2 == 0:
+            self._on_error("Wrong sequence, drop the whole packet.", 0, Retransmit.SEQUENCE)
+            return
+
+        valid, data = verify_checksum(1, data)
+        if not valid:
+            self._on_error("Checksum failed.", 0, Retransmit.CHECKSUM)
+            return
+
+        parts = data.split(b"\x00")
+        file_name = bytes.decode(parts[0], "utf-8")
+
+        # batch end packet received
+        if not file_name:
+            self.logger.debug("[Receiver]: <- Batch end packet")
+            if self.protocol_subtype == ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION:
+                self._write(ACK)
+                self.logger.debug("[Receiver]: ACK ->")
+            self._finish(True)
+            return
+
+        # filename packet received
+        self.logger.debug("[Receiver]: <- Filename packet.")
+        self._task_index += 1
+        self.logger.debug(f"[Receiver]: File - {file_name}")
+
+        fields = self._parse_header_fields(bytes.decode(parts[1], "utf-8") if len(parts) > 1 else "")
+        # offers of this library follow the fields, each after a null byte
+        extensions = [part for part in parts[2:] if part]
+        self._compression = self._parse_compression_offer(extensions)
+        self._trailer_method = self._parse_digest_offer(extensions)
+        if self._trailer_method and not self._compression and YMODEM.USE_LENGTH_FIELD not in fields:
+            # the padding of the last packet would be stored and digested with the file
+            self.logger.warning(f"[Receiver]: No length for {file_name}, the file will not be verified.")
+            self._trailer_method = None
+
+        if self._detect_style:
+            self._adapt_to_sender_style(sum(fields))
+
+        if YMODEM.USE_LENGTH_FIELD in fields:
+            self.logger.debug(f"[Receiver]: Size - {fields[YMODEM.USE_LENGTH_FIELD]} bytes")
+        if YMODEM.USE_DATE_FIELD in fields:
+            self.logger.debug(f"[Receiver]: Mtime - {fields[YMODEM.USE_DATE_FIELD]} seconds")
+        if YMODEM.USE_MODE_FIELD in fields:
+            self.logger.debug(f"[Receiver]: Mode - {oct(fields[YMODEM.USE_MODE_FIELD])}")
+        if YMODEM.USE_SN_FIELD in fields:
+            self.logger.debug(f"[Receiver]: SN - {fields[YMODEM.USE_SN_FIELD]}")
+
+        self._info = FileInfo(file_name,
+                              fields.get(YMODEM.USE_LENGTH_FIELD, 0),
+                              fields.get(YMODEM.USE_DATE_FIELD, 0),
+                              fields.get(YMODEM.USE_MODE_FIELD, 0),
+                              fields.get(YMODEM.USE_SN_FIELD, 0))
+        self._state = self.AWAIT_ACCEPT
+        self._arm(None)
+        self._events.append(FileHeader(self._task_index, self._info, self._compression))
+
+    def _on_data_packet(self, seq1: int, seq2: int, data: bytes) -> None:
+        '''
+        7.3.2 Receive_Program_Considerations
+
+        Synchronizing: If a valid block number is received, it will be:
+        1) the expected one, in which case everything is fine;
+        2) a repeat of the previously received block. This should be considered OK,
+        and only indicates that the receivers <ack> got glitched, and the sender retransmitted;
+        3) any other block number indicates a fatal loss of synchronization, such as the rare case
+        of the sender getting a line-glitch that looked like an <ack>. Abort the transmission, sending a <can>
+        '''
+        if seq1 == seq2 == self._sequence:
+            valid, data = verify_checksum(self._crc, data)
+            if not valid:
+                self._on_error("Checksum failed.", self._sequence, Retransmit.CHECKSUM)
+                return
+
+            # Write the original data to the target file
+            self.logger.debug(f"[Receiver]: <- Data packet {self._sequence}")
+
+            valid_length = self._packet_size
+
+            if self._decompressor:
+                try:
+                    data = self._decompressor.decompress(data)
+                    valid_length = len(data)
+                except Exception:
+                    self.abort(f"[Receiver]: Failed to decompress data packet {self._sequence}, abort and exit!")
+                    return
+
+            '''
+            5. YMODEM Batch File Transmission
+
+            The receiver stores the specified number of characters, discarding
+            any padding added by the sender to fill up the last block.
+            '''
+            remaining_length = self._info.length - self._received
+            if (remaining_length > 0):
+                valid_length = min(valid_length, remaining_length)
+            data = data[:valid_length]
+
+            self._received += len(data)
+            if self._digest:
+                self._digest.update(data)
+            self._success_packet_count += 1
+            self._sequence = (self._sequence + 1) % 0x100
+
+            self._events.append(Data(self._task_index, data))
+            self._events.append(Progress(self._task_index, self._info.name, self._info.length, self._received))
+            self._confirm()
+
+        # invalid header: expired sequence
+        elif seq1 == seq2 == (self._sequence - 1) % 0x100 and self._success_packet_count > 0:
+            self.logger.warning("[Receiver]: Expired sequence, drop the whole packet.")
+            # confirm but no forward
+            self._confirm()
+
+        # invalid header: wrong sequence
+        else:
+            self._on_error("Wrong sequence, drop the whole packet.", self._sequence, Retransmit.SEQUENCE)
+
+    def _confirm(self) -> None:
+        if self._batch:
+            self._write(ACK)
+            self.logger.debug("[Receiver]: ACK ->")
+            self._retries = 0
+        self._state = self.WAIT_PACKET
+        self._arm(10)
+
+    def _on_error(self, message: str, sequence: int, cause: str) -> None:
+        self.logger.warning(f"[Receiver]: {message}")
+
+        '''
+        If an error is detected in a YMODEM-g transfer, the receiver aborts the
+        transfer with the multiple CAN abort sequence.
+        '''
+        if not self._batch:
+            self.abort("[Receiver]: An error occurred during the transfer process using YMODEM_G, abort and exit!")
+            return
+
+        '''
+        7.3.1 Common_to_Both_Sender_and_Receiver
+
+        All errors are retried 10 times.
+        '''
+        if self._retries >= 10:
+            self.abort("[Receiver]: The number of retransmissions has reached the maximum limit, abort and exit!")
+            return
+
+        '''
+        7.4 Programming Tips
+
+        + When the receiver wishes to <nak>, it should call a "PURGE"
+        subroutine, to wait for the line to clear. Recall the sender tosses
+        any characters in its UART buffer immediately upon completing sending
+        a block, to ensure no glitches were mis- interpreted.
+        '''
+        self.logger.warning("[Receiver]: Send a request for retransmission.")
+        self._events.append(Retransmit(self._task_index, sequence, message, cause))
+        self._retries += 1
+        self._state = self.PURGE
+        self._input.clear()
+        self._arm(1)
+
+    def _on_timeout(self) -> None:
+        if self._state == self.REQUEST:
+            self._request_waited += self._wait_time
+            if not self._heard:
+                self._start_waited += self._wait_time
+
+            if self._start_timeout is not None and not self._heard and self._start_waited >= self._start_timeout:
+                self.abort(f"[Receiver]: No response from Sender within {self._start_timeout} seconds, abort and exit!")
+            elif (self._request != NAK and self._phase == self.DATA_PHASE and self._batch and
+                  (self._request_count >= self._crc_requests or self._request_waited >= self.REQUEST_BUDGET)):
+                self.logger.warning("[Receiver]: No response in crc mode, try checksum mode...")
+                self._request = NAK
+                self._request_count = 0
+                self._request_waited = 0.0
+                self._send_request()
+            elif (self._request_waited < self.REQUEST_BUDGET or
+                  (not self._heard and (self._start_timeout is not None or
+                                        (self._wait_forever and self._phase == self.HEADER_PHASE)))):
+                self._send_request()
+            elif self._phase == self.DATA_PHASE:
+                self.abort("[Receiver]: No response in checksum mode, abort and exit!")
+            else:
+                self.abort("[Receiver]: Waiting for response from Sender has timed out, abort and exit!")
+
+        elif self._state in (self.PACKET, self.TRAILER):
+            self._input.clear()
+            self._on_error("Received data timed out.", 0 if self._phase == self.HEADER_PHASE else self._sequence, Retransmit.TIMEOUT)
+
+        elif self._state == self.PURGE:
+            # the line is clear
+            self._write(NAK)
+            self.logger.debug("[Receiver]: NAK ->")
+            self._state = self.WAIT_PACKET
+            self._arm(10)
+
+        elif self._state == self.WAIT_PACKET:
+            if self._batch and self._retries < 10:
+                self._retries += 1
+                self._events.append(Retransmit(self._task_index, 0 if self._phase == self.HEADER_PHASE else self._sequence, "timeout", Retransmit.TIMEOUT))
+                self._write(NAK)
+                self.logger.debug("[Receiver]: NAK ->")
+                self._arm(10)
+            else:
+                self.abort("[Receiver]: Waiting for response from Sender has timed out, abort and exit!")
+
+    def _parse_compression_offer(self, extensions: List[bytes]) -> Optional[str]:
+        '''
+        Return the compression method offered by the sender if it is supported.
+        '''
+        method = _find_offer(extensions, YMODEM.COMPRESSION_OFFER)
+        if method is None or method in available_methods():
+            return method
+        self.logger.warning(f"[Receiver]: Unsupported compression {method}, receive uncompressed.")
+        return None
+
+    def _parse_digest_offer(self, extensions: List[bytes]) -> Optional[str]:
+        '''
+        Return the digest method of the trailer offered by the sender if it is supported.
+        '''
+        method = _find_offer(extensions, YMODEM.DIGEST_OFFER)
+        if method is None or method in available_digests():
+            return method
+        self.logger.warning(f"[Receiver]: Unsupported digest {method}, the file will not be verified.")
+        return None
+
+    def _parse_header_fields(self, data: str) -> Dict[int, int]:
+        '''
+        Parse the optional fields following the pathname in the filename packet:
+        length (decimal), modification date, mode and serial number (octal).
+
+        With style detection, the fields present are deduced from the content of
+        the packet. Otherwise they are expected as the configured style sends them.
+        '''
+        tokens = data.split()
+
+        if self._detect_style:
+            layout = [YMODEM.USE_LENGTH_FIELD, YMODEM.USE_DATE_FIELD]
+            if len(tokens) > 3:
+                layout += [YMODEM.USE_MODE_FIELD, YMODEM.USE_SN_FIELD]
+            elif len(tokens) == 3:
+                layout.append(YMODEM.USE_MODE_FIELD if self._is_mode_field(tokens[2]) else YMODEM.USE_SN_FIELD)
+        else:
+            layout = [feature for feature in (YMODEM.USE_LENGTH_FIELD, YMODEM.USE_DATE_FIELD, YMODEM.USE_MODE_FIELD, YMODEM.USE_SN_FIELD)
+                      if self.protocol_features & feature]
+
+        fields = {}
+        for feature, token in zip(layout, tokens):
+            try:
+                fields[feature] = int(token, 10 if feature == YMODEM.USE_LENGTH_FIELD else 8)
+            except ValueError:
+                self.logger.warning(f"[Receiver]: Invalid header field: {token}, ignore the remaining fields.")
+                break
+        return fields
+
+    def _is_mode_field(self, token: str) -> bool:
+        '''
+        The third field is either the file mode (Unix rz/sz) or the serial number (Pro-YAM).
+        A Unix mode carries the file type bits, e.g. 0100000 for a regular file.
+        '''
+        try:
+            value = int(token, 8)
+        except ValueError:
+            return False
+        if token.startswith("0o") or value & 0o170000:
+            return True
+        return bool(self.protocol_features & YMODEM.USE_MODE_FIELD) and not (self.protocol_features & YMODEM.USE_SN_FIELD)
+
+    def _adapt_to_sender_style(self, header_features: int) -> None:
+        '''
+        Switch to the registered style closest to the fields sent by the peer,
+        so that YMODEM-G follows what the sender supports.
+        YMODEM-G is only used if it was requested in protocol_type_options.
+        '''
+        style_id = _psm.match_style(ProtocolType.YMODEM, header_features, self._style_id)
+        if not style_id or style_id == self._session_style_id:
+            return
+
+        features = _psm.get_available_style(style_id).get_protocol_features(ProtocolType.YMODEM)
+        self._session_style_id = style_id
+        self.protocol_features = features
+        if 'g' in self._protocol_type_options and features & YMODEM.ALLOW_YMODEM_G:
+            self.protocol_subtype = ProtocolSubType.YMODEM_G_FILE_TRANSMISSION
+        else:
+            self.protocol_subtype = ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION
+        self.logger.info(f"[Receiver]: Sender style detected: {style_id}")
@@ -0,0 +1,67 @@
+'''
+Whole-file digests computed while the data passes through send() and recv().
+
+Both ends update the digest with the original file data, before compression
+and without padding, so that the result is the digest of the file itself.
+When the sender offers a digest trailer in the filename packet and the
+receiver is also this library, the sender sends its digest after the last
+data packet and the receiver answers whether it matches its own.
+'''
+from typing import Any, List
+
+def available_digests() -> List[str]:
+    return ["crc32", "sha256", "blake2b"]
+
+
+def _new_hash(method: str) -> Any:
+    # imported on demand to keep them out of the package import time
+    if method == "sha256":
+        import hashlib
+        return hashlib.sha256()
+    elif method == "blake2b":
+        import hashlib
+        return hashlib.blake2b()
+    elif method == "crc32":
+        return _Crc32()
+    else:
+        raise ValueError(f"Invalid digest method specified: {method}")
+
+
+class _Crc32:
+    '''
+    zlib.crc32 behind the update() / hexdigest() interface of hashlib.
+    '''
+    digest_size = 4
+
+    def __init__(self):
+        import zlib
+        self._crc32 = zlib.crc32
+        self._value = 0
+
+    def update(self, data: Any) -> None:
+        self._value = self._crc32(data, self._value)
+
+    def hexdigest(self) -> str:
+        return f"{self._value:08x}"
+
+
+class Digest:
+    '''
+    Incremental digest of the data of one file.
+    '''
+    def __init__(self, method: str):
+        self.method = method
+        self._hash = _new_hash(method)
+
+    @property
+    def size(self) -> int:
+        '''
+        Length of hexdigest(), the size of the trailer payload.
+        '''
+        return self._hash.digest_size * 2
+
+    def update(self, data: Any) -> None:
+        self._hash.update(data)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
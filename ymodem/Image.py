@@ -0,0 +1,217 @@
+'''
+Precompiled packet images.
+
+An image holds the YMODEM filename packet and all data packets of one file,
+fully framed for a given style, packet size and checksum mode, so that the
+same file can be sent any number of times without framing it again. The
+sender maps the image and writes the frames straight from the mapping.
+
+Layout, little endian:
+
+    fixed header    _HEADER, see below
+    style id        utf-8
+    file name       utf-8
+    frames          frame 0 is the filename packet, 1..n the data packets
+    offset index    n + 1 unsigned 64-bit offsets of the frames
+
+Every frame is a complete packet: SOH/STX, sequence, complement, payload
+and CRC-16 or checksum.
+'''
+import mmap
+import os
+import struct
+import tempfile
+from typing import Any, Optional
+
+from ymodem.Core import SenderCore, _psm, make_checksum, make_header
+from ymodem.Protocol import ProtocolType, ProtocolSubType, XMODEM
+from ymodem.Stream import FileInfo
+
+MAGIC = b"YMODEMPK"
+VERSION = 1
+
+# magic, version, header size, packet size, crc, reserved, features, frame count, length, mtime,
+# index offset, style id length, name length
+_HEADER = struct.Struct("<8sHHHBBIIQdQHH")
+_OFFSET = struct.Struct("<Q")
+
+def pack(path: str,
+         image_path: str,
+         style_id: Optional[str] = None,
+         packet_size: int = 1024,
+         crc: bool = True,
+         name: Optional[str] = None) -> "PacketImage":
+    '''
+    Frame a file into a packet image.
+
+    param path: file to pack
+    param image_path: image to write, replaced atomically
+    param style_id: style of the filename packet, the default style of ModemSocket if None
+    param packet_size: 128 or 1024, 128 if the style does not allow 1K packets
+    param crc: CRC-16 frames if True, requested by a receiver sending C or G;
+               arithmetic checksum frames if False, requested with NAK
+    param name: file name sent in the filename packet, the base name of path if None
+    '''
+    if style_id is None:
+        style_id = _psm.get_available_styles()[2]
+    if style_id not in _psm.get_available_styles():
+        raise ValueError(f"Invalid style specified: {style_id}")
+    features = _psm.get_available_style(style_id).get_protocol_features(ProtocolType.YMODEM)
+
+    if packet_size not in [128, 1024]:
+        raise ValueError(f"Invalid packet size specified: {packet_size}")
+    if (features & XMODEM.ALLOW_1K_PACKET) == 0:
+        packet_size = 128
+
+    st = os.stat(path)
+    info = FileInfo(name or os.path.basename(path), st.st_size, st.st_mtime)
+    frame_count = (st.st_size + packet_size - 1) // packet_size
+    crc = 1 if crc else 0
+
+    # the filename packet is built by the sender itself, so that it is the same as the one sent by ModemSocket.send()
+    core = SenderCore(ProtocolType.YMODEM, ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION, features, packet_size)
+    header_data, _ = core._make_file_header(info)
+
+    style = style_id.encode("utf-8")
+    encoded_name = info.name.encode("utf-8")
+    header_size = _HEADER.size + len(style) + len(encoded_name)
+    frame_size = 3 + packet_size + (2 if crc else 1)
+    index_offset = header_size + (frame_count + 1) * frame_size
+
+    directory = os.path.dirname(os.path.abspath(image_path))
+    fd, temp_path = tempfile.mkstemp(prefix=".ymodem-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as image, open(path, "rb") as source:
+            image.write(_HEADER.pack(MAGIC, VERSION, header_size, packet_size, crc, 0, features, frame_count,
+                                     st.st_size, st.st_mtime, index_offset, len(style), len(encoded_name)))
+            image.write(style)
+            image.write(encoded_name)
+
+            image.write(make_header(packet_size, 0) + header_data + make_checksum(crc, header_data))
+            for sequence in range(1, frame_count + 1):
+                data = source.read(packet_size)
+                if len(data) < packet_size:
+                    # the file changed since stat()
+                    if sequence < frame_count or not data:
+                        raise ValueError(f"File changed while packing: {path}")
+                    # fill with 1AH(^z)
+                    data = data.ljust(packet_size, b"\x1a")
+                image.write(make_header(packet_size, sequence % 256) + data + make_checksum(crc, data))
+
+            image.write(b"".join(_OFFSET.pack(header_size + index * frame_size) for index in range(frame_count + 1)))
+        os.replace(temp_path, image_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+    return PacketImage(image_path)
+
+
+class PacketImage:
+    '''
+    A packet image mapped in memory, as written by pack().
+
+    frame() and payload() return memoryviews of the mapping, nothing is
+    copied. Pass the image to ModemSocket.send() in place of a file path.
+    '''
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse()
+        except Exception:
+            self._map.close()
+            raise
+        self._view = memoryview(self._map)
+
+    def _parse(self) -> None:
+        if len(self._map) < _HEADER.size:
+            raise ValueError(f"Invalid packet image: {self.path}")
+        (magic, version, header_size, self._packet_size, self._crc, _, self._features, self._frame_count,
+         self._length, self._mtime, index_offset, style_length, name_length) = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"Invalid packet image: {self.path}")
+        if version != VERSION:
+            raise ValueError(f"Unsupported packet image version {version}: {self.path}")
+
+        position = _HEADER.size
+        self._style_id = bytes(self._map[position:position + style_length]).decode("utf-8")
+        position += style_length
+        self._name = bytes(self._map[position:position + name_length]).decode("utf-8")
+
+        self._frame_size = 3 + self._packet_size + (2 if self._crc else 1)
+        if index_offset + (self._frame_count + 1) * _OFFSET.size > len(self._map):
+            raise ValueError(f"Truncated packet image: {self.path}")
+        self._index_offset = index_offset
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def length(self) -> int:
+        return self._length
+
+    @property
+    def mtime(self) -> float:
+        return self._mtime
+
+    @property
+    def style_id(self) -> str:
+        return self._style_id
+
+    @property
+    def features(self) -> int:
+        return self._features
+
+    @property
+    def packet_size(self) -> int:
+        return self._packet_size
+
+    @property
+    def crc(self) -> int:
+        return self._crc
+
+    @property
+    def frame_count(self) -> int:
+        '''
+        Number of data packets, the filename packet not included.
+        '''
+        return self._frame_count
+
+    def offset(self, index: int) -> int:
+        return _OFFSET.unpack_from(self._map, self._index_offset + index * _OFFSET.size)[0]
+
+    def frame(self, index: int) -> memoryview:
+        '''
+        Complete packet, 0 for the filename packet and 1..frame_count for the data.
+        '''
+        if not 0 <= index <= self._frame_count:
+            raise IndexError(f"Frame {index} out of range")
+        offset = self.offset(index)
+        return self._view[offset:offset + self._frame_size]
+
+    def payload(self, index: int) -> memoryview:
+        '''
+        Data of a packet without header and checksum, to frame it again for another checksum mode.
+        '''
+        return self.frame(index)[3:3 + self._packet_size]
+
+    def close(self) -> None:
+        if self._view is None:
+            return
+        self._view.release()
+        self._view = None
+        try:
+            self._map.close()
+        except BufferError:
+            # frames are still referenced, the mapping goes away with them
+            pass
+
+    def __enter__(self) -> "PacketImage":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
@@ -0,0 +1,87 @@
+'''
+Checkpoint journal of a send batch.
+
+A line is appended for every file once its EOT has been acknowledged. When
+a batch is sent again with the same journal, files already recorded with
+the same path, size and modification time are skipped, so that a batch
+interrupted by a crash only resends what remains.
+
+Each record is one JSON line written with a single write() on a descriptor
+opened with O_APPEND and synced to disk before the next file starts. A
+record cut short by a crash is ignored when the journal is read back.
+'''
+import json
+import logging
+import os
+from typing import Set, Tuple
+
+
+class BatchJournal:
+    '''
+    param path: journal file, created if it does not exist
+    param resume: keep the recorded files and skip them, otherwise the journal starts empty
+    '''
+    def __init__(self, path: str, resume: bool = False):
+        self.logger = logging.getLogger('ModemSocket')
+
+        self.path = path
+        self._delivered = set()             # type: Set[Tuple[str, int, float]]
+        complete = 0
+        if resume:
+            complete = self._load()
+
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+        if not resume:
+            flags |= os.O_TRUNC
+        self._fd = os.open(path, flags, 0o644)
+        # drop a record cut short, the next one would be appended to it
+        if resume and os.fstat(self._fd).st_size > complete:
+            os.ftruncate(self._fd, complete)
+
+    @staticmethod
+    def _key(path: str, size: int, mtime: float) -> Tuple[str, int, float]:
+        return os.path.abspath(path), size, mtime
+
+    def _load(self) -> int:
+        '''
+        Read the recorded files, return the size of the complete records.
+        '''
+        try:
+            with open(self.path, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return 0
+
+        lines = content.split(b"\n")
+        # the last element is empty unless the final record was cut short
+        for line in lines[:-1]:
+            try:
+                record = json.loads(line)
+                self._delivered.add(self._key(record["path"], record["size"], record["mtime"]))
+            except (ValueError, KeyError, TypeError):
+                self.logger.warning(f"[Sender]: Ignored a damaged record of the journal {self.path}")
+        return len(content) - len(lines[-1])
+
+    def __len__(self) -> int:
+        return len(self._delivered)
+
+    def delivered(self, path: str, size: int, mtime: float) -> bool:
+        return self._key(path, size, mtime) in self._delivered
+
+    def record(self, path: str, size: int, mtime: float) -> None:
+        key = self._key(path, size, mtime)
+        line = json.dumps({"path": key[0], "size": size, "mtime": mtime}, ensure_ascii=False) + "\n"
+        os.write(self._fd, line.encode("utf-8"))
+        os.fsync(self._fd)
+        self._delivered.add(key)
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __enter__(self) -> "BatchJournal":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
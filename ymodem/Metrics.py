@@ -0,0 +1,329 @@
+'''
+Metrics of the transfers of a ModemSocket, e.g. for a flashing station
+that runs for days.
+
+The counters are fed from the packet loop of send(), recv() and serve()
+and labelled by port and direction. Updating them costs a few additions
+per packet, rendering happens only when a scraper asks for it:
+
+    metrics = Metrics()
+    metrics.serve_http("127.0.0.1", 9464)           # /metrics and /metrics.json
+    metrics.start_textfile("/var/lib/node_exporter/ymodem.prom")
+    modem = ModemSocket(read, write, metrics=metrics, metrics_port="/dev/ttyUSB0")
+
+The text output follows the Prometheus exposition format, version 0.0.4.
+'''
+from bisect import bisect_left
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ymodem.Core import Event, FileDone, Progress, Retransmit
+
+# upper bounds of the ACK latency buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name, help, attribute of _Series
+_COUNTERS = [
+    ("ymodem_wire_bytes_written_total",     "Bytes written to the channel, framing included",           "bytes_written"),
+    ("ymodem_wire_bytes_read_total",        "Bytes read from the channel, framing included",            "bytes_read"),
+    ("ymodem_file_bytes_total",             "Bytes of file data sent or received",                      "file_bytes"),
+    ("ymodem_packets_total",                "Data packets sent or accepted",                            "packets"),
+    ("ymodem_files_total",                  "Files transferred completely",                             "files"),
+    ("ymodem_batches_total",                "Batches transferred successfully",                         "batches"),
+    ("ymodem_crc_failures_total",           "Packets dropped for a wrong CRC or checksum",              "crc_failures"),
+    ("ymodem_timeouts_total",               "Protocol timeouts",                                        "timeouts"),
+    ("ymodem_aborts_total",                 "Transfers aborted or cancelled",                           "aborts"),
+]
+
+_GAUGES = [
+    ("ymodem_throughput_bytes_per_second",  "File data rate of the current transfer",                   "throughput"),
+    ("ymodem_transfer_active",              "1 while a transfer is running",                            "active"),
+    ("ymodem_last_transfer_timestamp_seconds", "End of the last transfer, unix time",                   "last_transfer"),
+]
+
+# the throughput gauge is recomputed at most once per window, in seconds
+THROUGHPUT_WINDOW = 1.0
+
+class _Series:
+    '''
+    Metrics of one port and direction. Only the thread running the
+    transfer writes to it.
+    '''
+    def __init__(self, port: str, direction: str):
+        self.port = port
+        self.direction = direction
+
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.file_bytes = 0
+        self.packets = 0
+        self.files = 0
+        self.batches = 0
+        self.crc_failures = 0
+        self.timeouts = 0
+        self.aborts = 0
+        self.retransmits = {}           # type: Dict[str, int]
+
+        self.throughput = 0.0
+        self.active = 0
+        self.last_transfer = 0.0
+
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+
+        self._last_write = 0.0
+        self._awaiting_reply = False
+        self._latency = None            # type: Optional[float]
+        self._task_index = -1
+        self._task_done = 0
+        self._window_start = 0.0
+        self._window_bytes = 0
+
+    def start(self) -> None:
+        self.active = 1
+        self.throughput = 0.0
+        self._task_index = -1
+        self._window_start = time.monotonic()
+        self._window_bytes = self.file_bytes
+
+    def stop(self) -> None:
+        self.active = 0
+        self.throughput = 0.0
+        self.last_transfer = time.time()
+
+    def wrote(self, size: int) -> None:
+        self.bytes_written += size
+        self._last_write = time.monotonic()
+        self._awaiting_reply = True
+
+    def read(self, size: int) -> None:
+        self.bytes_read += size
+        # the first bytes after a write are the answer of the peer
+        if self._awaiting_reply:
+            self._latency = time.monotonic() - self._last_write
+            self._awaiting_reply = False
+
+    def timeout(self) -> None:
+        self.timeouts += 1
+
+    def finish(self, result: bool) -> None:
+        if result:
+            self.batches += 1
+        else:
+            self.aborts += 1
+
+    def event(self, event: Event) -> None:
+        if isinstance(event, Progress):
+            self.packets += 1
+            if event.task_index != self._task_index:
+                self._task_index = event.task_index
+                self._task_done = 0
+            self.file_bytes += event.done - self._task_done
+            self._task_done = event.done
+
+            # a packet is acknowledged by the data just read, YMODEM-G packets are never
+            if self._latency is not None and self.direction == "send":
+                self.latency_counts[bisect_left(LATENCY_BUCKETS, self._latency)] += 1
+                self.latency_sum += self._latency
+            self._latency = None
+
+            now = time.monotonic()
+            if now - self._window_start >= THROUGHPUT_WINDOW:
+                self.throughput = (self.file_bytes - self._window_bytes) / (now - self._window_start)
+                self._window_start = now
+                self._window_bytes = self.file_bytes
+            return
+
+        self._latency = None
+        if isinstance(event, Retransmit):
+            self.retransmits[event.cause] = self.retransmits.get(event.cause, 0) + 1
+            if event.cause == Retransmit.CHECKSUM:
+                self.crc_failures += 1
+        elif isinstance(event, FileDone):
+            self.files += 1
+
+class Metrics:
+    '''
+    Registry of the metrics of one or more ModemSockets, exported as
+    Prometheus text, JSON, a text file for the node_exporter textfile
+    collector or a local HTTP endpoint.
+    '''
+    def __init__(self):
+        self.logger = logging.getLogger('ModemSocket')
+
+        self._lock = threading.Lock()
+        self._series = {}               # type: Dict[Tuple[str, str], _Series]
+        self._server = None             # type: Any
+        self._writer = None             # type: Optional[threading.Thread]
+        self._writer_stop = threading.Event()
+        self._textfile = None           # type: Optional[str]
+
+    def recorder(self, port: str, direction: str) -> _Series:
+        '''
+        Series of a port and direction ("send" or "receive"), created on first use.
+        '''
+        key = (port, direction)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(port, direction)
+            return series
+
+    def _snapshot(self) -> List[_Series]:
+        with self._lock:
+            return sorted(self._series.values(), key=lambda series: (series.port, series.direction))
+
+    def render(self) -> str:
+        '''
+        Prometheus text exposition format.
+        '''
+        lines = []
+        series_list = self._snapshot()
+
+        def labels(series: _Series, extra: str = "") -> str:
+            port = series.port.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            return f'{{port="{port}",direction="{series.direction}"{extra}}}'
+
+        for kind, table in (("counter", _COUNTERS), ("gauge", _GAUGES)):
+            for name, help_text, attribute in table:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for series in series_list:
+                    lines.append(f"{name}{labels(series)} {getattr(series, attribute)}")
+
+        lines.append("# HELP ymodem_retransmits_total Packets sent or requested again, by cause")
+        lines.append("# TYPE ymodem_retransmits_total counter")
+        for series in series_list:
+            for cause, count in sorted(series.retransmits.items()):
+                cause_labels = labels(series, f',cause="{cause}"')
+                lines.append(f"ymodem_retransmits_total{cause_labels} {count}")
+
+        name = "ymodem_ack_latency_seconds"
+        lines.append(f"# HELP {name} Time from a data packet to its ACK or NAK, observed by senders")
+        lines.append(f"# TYPE {name} histogram")
+        for series in series_list:
+            counts = list(series.latency_counts)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, counts):
+                cumulative += count
+                bucket_labels = labels(series, f',le="{bound}"')
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            cumulative += counts[-1]
+            bucket_labels = labels(series, ',le="+Inf"')
+            lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{labels(series)} {series.latency_sum}")
+            lines.append(f"{name}_count{labels(series)} {cumulative}")
+
+        return "\n".join(lines) + "\n"
+
+    def render_json(self) -> str:
+        result = []
+        for series in self._snapshot():
+            entry = {"port": series.port, "direction": series.direction}
+            for table in (_COUNTERS, _GAUGES):
+                for _, _, attribute in table:
+                    entry[attribute] = getattr(series, attribute)
+            entry["retransmits"] = dict(series.retransmits)
+            counts = list(series.latency_counts)
+            entry["ack_latency_seconds"] = {
+                "buckets": {str(bound): count for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), counts)},
+                "sum": series.latency_sum,
+                "count": sum(counts),
+            }
+            result.append(entry)
+        return json.dumps({"series": result})
+
+    def write_textfile(self, path: str) -> None:
+        '''
+        Write render() to path atomically, the scraper never sees a partial file.
+        '''
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(prefix=".ymodem-", suffix=".prom", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def start_textfile(self, path: str, interval: float = 5.0) -> None:
+        '''
+        Rewrite the text file every interval seconds until close().
+        '''
+        self._textfile = path
+        self._writer_stop.clear()
+
+        def run() -> None:
+            while not self._writer_stop.wait(interval):
+                try:
+                    self.write_textfile(path)
+                except OSError as err:
+                    self.logger.warning(f"[Metrics]: Cannot write {path}: {err}")
+
+        self._writer = threading.Thread(target=run, name="ymodem-metrics-writer", daemon=True)
+        self._writer.start()
+
+    def serve_http(self, host: str = "127.0.0.1", port: int = 9464) -> Tuple[str, int]:
+        '''
+        Serve /metrics (Prometheus text) and /metrics.json from a background thread until close().
+
+        return: the address actually bound, port 0 picks a free one
+        '''
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                path = self.path.split("?", 1)[0]
+                if path in ("/", "/metrics"):
+                    body, content_type = metrics.render(), "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/metrics.json":
+                    body, content_type = metrics.render_json(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="ymodem-metrics-http", daemon=True).start()
+        return self._server.server_address[:2]
+
+    def close(self) -> None:
+        '''
+        Stop the HTTP endpoint and the text file writer, the text file is written a last time.
+        '''
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._writer is not None:
+            self._writer_stop.set()
+            self._writer.join()
+            self._writer = None
+            try:
+                self.write_textfile(self._textfile)
+            except OSError as err:
+                self.logger.warning(f"[Metrics]: Cannot write {self._textfile}: {err}")
+
+    def __enter__(self) -> "Metrics":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
@@ -0,0 +1,132 @@
+'''
+Threads decoupling the port from the protocol loop during YMODEM-G reception.
+
+YMODEM-G has no flow control at the protocol level, the sender streams
+continuously. ChannelReader only drains the port into a large buffer, the
+protocol loop deframes and verifies packets from that buffer, and AsyncWriter
+moves the sink I/O to a third thread, so that no stall reaches the UART.
+'''
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional, Union
+
+
+class ChannelReader:
+    '''
+    Drain a read(size, timeout) function into a buffer on a dedicated thread.
+    read() has the same signature and serves the data from the buffer.
+    A ConnectionError of the channel stops the thread and is raised by read()
+    once the buffer is empty.
+    '''
+    def __init__(self,
+                 read: Callable[[int, Optional[float]], Any],
+                 chunk_size: int = 4096,
+                 poll_timeout: float = 0.02):
+        self.logger = logging.getLogger('ModemSocket')
+
+        self._read = read
+        self._chunk_size = chunk_size
+        self._poll_timeout = poll_timeout
+
+        self._buffer = bytearray()
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._peak_depth = 0
+        self._error = None
+
+    @property
+    def peak_depth(self) -> int:
+        '''
+        Largest number of bytes waiting in the buffer since start().
+        '''
+        return self._peak_depth
+
+    def start(self) -> None:
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="ymodem-reader", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def read(self, size: int, timeout: Optional[float] = 1) -> bytes:
+        deadline = time.monotonic() + (timeout or 0)
+        with self._condition:
+            while len(self._buffer) < size and self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            if not self._buffer and self._error:
+                raise self._error
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
+
+    def _run(self) -> None:
+        while self._running:
+            try:
+                data = self._read(self._chunk_size, self._poll_timeout)
+            except ConnectionError as err:
+                with self._condition:
+                    self._error = err
+                    self._running = False
+                    self._condition.notify_all()
+                break
+            except Exception:
+                self.logger.warning("[Modem]: Read timeout!")
+                data = None
+            if not data:
+                continue
+            with self._condition:
+                self._buffer += data
+                if len(self._buffer) > self._peak_depth:
+                    self._peak_depth = len(self._buffer)
+                self._condition.notify_all()
+
+
+class AsyncWriter:
+    '''
+    Perform the write() and close() calls of a sink on a dedicated thread.
+    An error of the sink is raised by the next write() or by close().
+    '''
+    def __init__(self, stream: Any, max_pending: int = 1024):
+        self._stream = stream
+        self._queue = queue.Queue(max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="ymodem-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, data: Union[bytes, bytearray]) -> None:
+        if self._error:
+            raise self._error
+        self._queue.put(data)
+
+    def close(self) -> None:
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._stream.close()
+        if self._error:
+            raise self._error
+
+    def _run(self) -> None:
+        while True:
+            data = self._queue.get()
+            if data is None:
+                break
+            if self._error:
+                continue
+            try:
+                self._stream.write(data)
+            except Exception as err:
+                self._error = err
@@ -0,0 +1,77 @@
+import time
+from typing import Callable, Optional
+
+class ProgressDispatcher:
+    '''
+    Merge the per-packet progress updates of send() and recv() and forward
+    them to the user callback at most once per interval (seconds) or once
+    per step (bytes). With neither limit set, every update is forwarded.
+
+    The final update of a task is never dropped: the first update that
+    completes the task is forwarded at once, a later one by flush() at the
+    end of the file.
+    '''
+    def __init__(self,
+                 callback: Optional[Callable[[int, str, int, int], None]] = None,
+                 interval: float = 0,
+                 step: int = 0):
+        self._callback = callback if callable(callback) else None
+        self._interval = interval
+        self._step = step
+
+        self._last_time = 0.0
+        self._last_done = 0
+        self._pending = None
+        self._dirty = False
+        self._completed = False
+
+    @property
+    def enabled(self) -> bool:
+        return self._callback is not None
+
+    def update(self, task_index: int, task_name: str, total: int, done: int) -> None:
+        if self._callback is None:
+            return
+
+        if self._pending is None or self._pending[0] != task_index:
+            # first update of a new task
+            self._last_time = 0.0
+            self._last_done = 0
+            self._completed = False
+        elif self._completed and done == self._last_done:
+            # already forwarded as complete
+            return
+
+        self._pending = (task_index, task_name, total, done)
+        self._dirty = True
+
+        if total > 0 and done >= total and not self._completed:
+            self._completed = True
+            self._dispatch()
+            return
+
+        if self._step and done - self._last_done >= self._step:
+            self._dispatch()
+            return
+
+        if self._interval:
+            if time.perf_counter() - self._last_time >= self._interval:
+                self._dispatch()
+            return
+
+        if not self._step:
+            self._dispatch()
+
+    def flush(self) -> None:
+        '''
+        Forward the merged update that has not been delivered yet, if any.
+        '''
+        if self._callback is not None and self._dirty:
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        task_index, task_name, total, done = self._pending
+        self._last_time = time.perf_counter()
+        self._last_done = done
+        self._dirty = False
+        self._callback(task_index, task_name, total, done)
@@ -1,8 +1,6 @@
 from enum import IntEnum
 from typing import Any, List, Optional
 
-from ordered_set import OrderedSet
-
 from ymodem.Version import Version
 
 class ProtocolType(IntEnum):
@@ -210,6 +208,28 @@ class YMODEM:
     ALLOW_1K_PACKET     = 0b00010000
     ALLOW_YMODEM_G      = 0b00100000
 
+    # Optional fields of the filename packet
+    HEADER_FIELDS       = USE_LENGTH_FIELD | USE_DATE_FIELD | USE_MODE_FIELD | USE_SN_FIELD
+
+    #########################################
+    #
+    #                Extension
+    #
+    #########################################
+
+    # Understood only by this library, ignored by other programs.
+    # The sender appends the offer to the filename packet after a null byte,
+    # the receiver accepts it with a single character before requesting the data.
+    COMPRESSION_OFFER   = b'compress='
+    COMPRESSION_ACCEPT  = b'Z'
+    # The digest trailer is offered and accepted the same way. The sender sends
+    # DIGEST_TRAILER, the hex digest and its CRC-16 after the last data packet,
+    # the receiver answers ACK if it matches its own digest, DIGEST_MISMATCH if not.
+    DIGEST_OFFER        = b'digest='
+    DIGEST_ACCEPT       = b'V'
+    DIGEST_TRAILER      = b'\x1e'
+    DIGEST_MISMATCH     = b'!'
+
     @classmethod
     def features(cls) -> List[int]:
         return [
@@ -245,14 +265,21 @@ class _ProtocolStyle:
     
 class ProtocolStyle:
     def __init__(self, name: str):
+        # imported here to keep it out of the package import time
+        from ordered_set import OrderedSet
+
         self._name = name
-        self._id = self._name.upper().replace(' ', '_').replace('/', '_').replace('-', '_')
+        self._id = self.make_id(name)
         self._registered_versions = OrderedSet()
         self._deprecated_versions = set()
         self._target_version = None
         self._cores = {}
         self._enabled = True
 
+    @staticmethod
+    def make_id(name: str) -> str:
+        return name.upper().replace(' ', '_').replace('/', '_').replace('-', '_')
+
     @property
     def id(self) -> str:
         return self._id
@@ -343,6 +370,8 @@ class ProtocolStyle:
 
 class ProtocolStyleManagement:
     def __init__(self):
+        # style id -> (name, XMODEM features, YMODEM features), styles are built on first use
+        self._style_definitions = {}
         self._registered_styles = {}
         self.register_all()
 
@@ -364,50 +393,74 @@ class ProtocolStyleManagement:
         |KMD/IMP    | ?      | no   | no   | no  | yes    | no       |
         |___________|________|______|______|_____|________|__________|
         '''
-        p = ProtocolStyle("Unix rz/sz")
+        self.register("Unix rz/sz",
+                      XMODEM.USE_CHECKSUM | XMODEM.USE_CRC | XMODEM.ALLOW_1K_PACKET,
+                      YMODEM.USE_LENGTH_FIELD | YMODEM.USE_DATE_FIELD | YMODEM.USE_MODE_FIELD | YMODEM.ALLOW_1K_PACKET)
+
+        self.register("VMS rb/sb",
+                      XMODEM.USE_CHECKSUM | XMODEM.USE_CRC | XMODEM.ALLOW_1K_PACKET,
+                      YMODEM.USE_LENGTH_FIELD | YMODEM.ALLOW_1K_PACKET)
+
+        self.register("Pro-YAM",
+                      XMODEM.USE_CHECKSUM | XMODEM.USE_CRC | XMODEM.ALLOW_1K_PACKET,
+                      YMODEM.USE_LENGTH_FIELD | YMODEM.USE_DATE_FIELD | YMODEM.USE_SN_FIELD | YMODEM.ALLOW_1K_PACKET | YMODEM.ALLOW_YMODEM_G)
+
+        self.register("CP/M YAM",
+                      XMODEM.USE_CHECKSUM | XMODEM.USE_CRC | XMODEM.ALLOW_1K_PACKET,
+                      YMODEM.ALLOW_1K_PACKET)
+
+        self.register("KMD/IMP",
+                      XMODEM.USE_CHECKSUM | XMODEM.USE_CRC | XMODEM.ALLOW_1K_PACKET,
+                      YMODEM.ALLOW_1K_PACKET)
+
+    def register(self, name: str, xmodem_features: int, ymodem_features: int) -> str:
+        style_id = ProtocolStyle.make_id(name)
+        self._style_definitions[style_id] = (name, xmodem_features, ymodem_features)
+        self._registered_styles.pop(style_id, None)
+        return style_id
+
+    def _build_style(self, style_id: str) -> ProtocolStyle:
+        name, xmodem_features, ymodem_features = self._style_definitions[style_id]
+        p = ProtocolStyle(name)
         p.register(["1.0.0"])
         p.select()
-        p.update_protocol_features(ProtocolType.XMODEM, XMODEM.USE_CHECKSUM | XMODEM.USE_CRC | XMODEM.ALLOW_1K_PACKET)
-        p.update_protocol_features(ProtocolType.YMODEM, YMODEM.USE_LENGTH_FIELD | YMODEM.USE_DATE_FIELD | YMODEM.USE_MODE_FIELD | YMODEM.ALLOW_1K_PACKET)
-        self._registered_styles[p.id] = p
+        p.update_protocol_features(ProtocolType.XMODEM, xmodem_features)
+        p.update_protocol_features(ProtocolType.YMODEM, ymodem_features)
+        self._registered_styles[style_id] = p
+        return p
 
-        p = ProtocolStyle("VMS rb/sb")
-        p.register(["1.0.0"])
-        p.select()
-        p.update_protocol_features(ProtocolType.XMODEM, XMODEM.USE_CHECKSUM | XMODEM.USE_CRC | XMODEM.ALLOW_1K_PACKET)
-        p.update_protocol_features(ProtocolType.YMODEM, YMODEM.USE_LENGTH_FIELD | YMODEM.ALLOW_1K_PACKET)
-        self._registered_styles[p.id] = p
-
-        p = ProtocolStyle("Pro-YAM")
-        p.register(["1.0.0"])
-        p.select()
-        p.update_protocol_features(ProtocolType.XMODEM, XMODEM.USE_CHECKSUM | XMODEM.USE_CRC | XMODEM.ALLOW_1K_PACKET)
-        p.update_protocol_features(ProtocolType.YMODEM, YMODEM.USE_LENGTH_FIELD | YMODEM.USE_DATE_FIELD | YMODEM.USE_SN_FIELD | YMODEM.ALLOW_1K_PACKET | YMODEM.ALLOW_YMODEM_G)
-        self._registered_styles[p.id] = p
-
-        p = ProtocolStyle("CP/M YAM")
-        p.register(["1.0.0"])
-        p.select()
-        p.update_protocol_features(ProtocolType.XMODEM, XMODEM.USE_CHECKSUM | XMODEM.USE_CRC | XMODEM.ALLOW_1K_PACKET)
-        p.update_protocol_features(ProtocolType.YMODEM, YMODEM.ALLOW_1K_PACKET)
-        self._registered_styles[p.id] = p
-
-        p = ProtocolStyle("KMD/IMP")
-        p.register(["1.0.0"])
-        p.select()
-        p.update_protocol_features(ProtocolType.XMODEM, XMODEM.USE_CHECKSUM | XMODEM.USE_CRC | XMODEM.ALLOW_1K_PACKET)
-        p.update_protocol_features(ProtocolType.YMODEM, YMODEM.ALLOW_1K_PACKET)
-        self._registered_styles[p.id] = p
-
-    def get_available_styles(self) -> List[ProtocolStyle]:
+    def get_available_styles(self) -> List[str]:
         available_programs = []
 
-        for style_id, style in self._registered_styles.items():
-            if style.is_available():
+        for style_id in self._style_definitions:
+            style = self._registered_styles.get(style_id)
+            # styles that have not been built yet keep their default state (enabled)
+            if style is None or style.is_available():
                 available_programs.append(style_id)
 
         return available_programs
 
     def get_available_style(self, id) -> ProtocolStyle:
         if id in self.get_available_styles():
-            return self._registered_styles[id]
\ No newline at end of file
+            style = self._registered_styles.get(id)
+            if style is None:
+                style = self._build_style(id)
+            return style
+
+    def match_style(self, protocol_type: int, header_features: int, preferred: Optional[str] = None) -> Optional[str]:
+        '''
+        Find the available style whose filename packet fields are closest to
+        the fields actually sent by the peer. Ties are resolved in favour of
+        the preferred style, then in registration order.
+        '''
+        best_id = None
+        best_distance = -1
+
+        for style_id in self.get_available_styles():
+            features = self.get_available_style(style_id).get_protocol_features(protocol_type)
+            distance = bin((features ^ header_features) & YMODEM.HEADER_FIELDS).count("1")
+            if best_distance < 0 or distance < best_distance or (distance == best_distance and style_id == preferred):
+                best_id = style_id
+                best_distance = distance
+
+        return best_id
\ No newline at end of file
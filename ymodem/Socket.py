@@ -1,22 +1,24 @@
 from abc import ABC, abstractmethod
+import itertools
 import logging
-import math
 import os
 import time
-from typing import Any, Callable, List, Optional, Union
-
-from ymodem.CRC import calc_crc16, calc_checksum
-from ymodem.Platform import Platform
-from ymodem.Protocol import ProtocolType, ProtocolSubType, ProtocolStyleManagement, XMODEM, YMODEM
-
-ACK = b'\x06'
-CAN = b'\x18'
-CRC = b'\x43'
-EOT = b'\x04'
-G   = b'\x67'
-NAK = b'\x15'
-SOH = b'\x01'
-STX = b'\x02'
+from typing import Any, Callable, Generator, Iterator, List, Optional, Union
+
+from ymodem.Batch import scan_paths
+from ymodem.Compression import available_methods, compression_levels
+from ymodem.Digest import available_digests
+from ymodem.Core import (ACK, CAN, CRC, EOT, G, NAK, SOH, STX, Data, Event, FileDone, FileEnd, FileHeader, Progress,
+                         ReceiverCore, SenderCore, _psm)
+from ymodem.Pipeline import AsyncWriter, ChannelReader
+from ymodem.Progress import ProgressDispatcher
+from ymodem.Protocol import ProtocolType, ProtocolSubType, XMODEM, YMODEM
+from ymodem.Stream import CallbackSink, FileInfo, Sink, Source, open_sink
+
+# never: leave the output queue to the driver
+# packet: wait until every packet has left the port
+# turnaround: wait only before waiting for an answer of the peer
+FLUSH_POLICIES = ["never", "packet", "turnaround"]
 
 class Channel(ABC):
 
@@ -28,21 +30,82 @@ class Channel(ABC):
     def write(self, *arg, **kwargs):
         pass
 
-_psm = ProtocolStyleManagement()
-
 class ModemSocket(Channel):
+    STOP_POLL_INTERVAL = 1
+    # fast handshake: seconds between two C / G requests, and C requests before falling back to checksum mode
+    FAST_POLL_INTERVAL = 0.2
+    FAST_CRC_REQUESTS = 3
+    # requests of the receiver taken at once by a sender waiting for one
+    QUEUED_REQUESTS_SIZE = 256
+
     def __init__(self, 
                  read: Callable[[int, Optional[float]], Any], 
                  write: Callable[[Union[bytes, bytearray], Optional[float]], Any], 
                  protocol_type: int = ProtocolType.YMODEM, 
                  protocol_type_options: List[str] = [],
                  packet_size: int = 1024,
-                 style_id: int = _psm.get_available_styles()[2]):
+                 style_id: int = _psm.get_available_styles()[2],
+                 progress_interval: float = 0,
+                 progress_step: int = 0,
+                 detect_style: bool = True,
+                 compression: Optional[str] = None,
+                 compression_level: int = 6,
+                 threaded_g_receive: bool = True,
+                 flush: Optional[Callable[[], Any]] = None,
+                 flush_policy: str = "turnaround",
+                 writev: Optional[Callable[[List[bytes], Optional[float]], Any]] = None,
+                 metrics: Optional[Any] = None,
+                 metrics_port: str = "",
+                 fast_handshake: bool = False,
+                 start_timeout: Optional[float] = None,
+                 digest: Optional[str] = None,
+                 digest_trailer: bool = False,
+                 xonxoff: bool = False):
 
         self.logger = logging.getLogger('ModemSocket')
 
         self._read = read
         self._write = write
+        self._writev = writev
+        self._flush = flush
+        if flush_policy not in FLUSH_POLICIES:
+            raise ValueError(f"Invalid flush policy specified: {flush_policy}")
+        self._flush_policy = flush_policy
+        self._progress_interval = progress_interval
+        self._progress_step = progress_step
+        self._detect_style = detect_style
+        if compression and compression not in available_methods():
+            raise ValueError(f"Invalid compression method specified: {compression}")
+        # checked before the transfer, the compressor is only created once the receiver has accepted
+        if compression and compression_level not in compression_levels(compression):
+            raise ValueError(f"Invalid compression level specified: {compression_level}")
+        self._compression = compression
+        self._compression_level = compression_level
+        self._threaded_g_receive = threaded_g_receive
+        self._fast_handshake = fast_handshake
+        if start_timeout is not None and start_timeout <= 0:
+            raise ValueError(f"Invalid start timeout specified: {start_timeout}")
+        self._start_timeout = start_timeout
+        if digest and digest not in available_digests():
+            raise ValueError(f"Invalid digest method specified: {digest}")
+        if digest_trailer and not digest:
+            raise ValueError("digest_trailer requires a digest method")
+        self._digest = digest
+        self._digest_trailer = digest_trailer
+        self._xonxoff = xonxoff
+        self._reader = None         # type: Optional[ChannelReader]
+        # set when the channel reports that the connection is gone, e.g. a TCP peer closed it
+        self._disconnected = False
+        # number of stop() calls since the transfer started
+        self._stop_requests = 0
+        # peak number of bytes buffered by the reader thread during the last YMODEM-G reception
+        self.read_buffer_peak = 0
+        # FileDone event of every file of the last send(), recv() or batch of serve(), with its digest
+        self.results = []           # type: List[FileDone]
+        # ymodem.Metrics.Metrics fed during the transfers, labelled with metrics_port
+        self._metrics = metrics
+        self._metrics_port = metrics_port
+        self._recorder = None       # type: Any
         self.set_protocol(protocol_type, protocol_type_options, style_id, packet_size)
         
     '''
@@ -53,7 +116,12 @@ class ModemSocket(Channel):
     '''
     def read(self, size: int, timeout: float = 1) -> Any:
         try:
+            if self._reader:
+                return self._reader.read(size, timeout)
             return self._read(size, timeout)
+        except ConnectionError as err:
+            self._lose_connection(err)
+            return None
         except Exception:
             self.logger.warning("[Modem]: Read timeout!")
             return None
@@ -61,9 +129,44 @@ class ModemSocket(Channel):
     def write(self, data: Union[bytes, bytearray], timeout: float = 1) -> Any:
         try:
             return self._write(data, timeout)
+        except ConnectionError as err:
+            self._lose_connection(err)
+            return None
+        except Exception:
+            self.logger.warning("[Modem]: Write timeout!")
+            return None
+
+    def writev(self, buffers: List[bytes], timeout: float = 1) -> Any:
+        '''
+        Write several buffers, e.g. header, payload and checksum of a packet,
+        with a single gathered write if the channel supports it.
+        '''
+        if not self._writev:
+            return self.write(b"".join(buffers), timeout)
+        try:
+            return self._writev(buffers, timeout)
+        except ConnectionError as err:
+            self._lose_connection(err)
+            return None
         except Exception:
             self.logger.warning("[Modem]: Write timeout!")
             return None
+
+    def _lose_connection(self, err: ConnectionError) -> None:
+        if not self._disconnected:
+            self.logger.error(f"[Modem]: Connection lost: {err}")
+        self._disconnected = True
+
+    def flush(self) -> None:
+        '''
+        Wait until the written data has left the port (tcdrain on POSIX).
+        '''
+        if not self._flush:
+            return
+        try:
+            self._flush()
+        except Exception:
+            self.logger.warning("[Modem]: Flush timeout!")
     
     def set_protocol(self, 
                      protocol_type: int, 
@@ -74,10 +177,12 @@ class ModemSocket(Channel):
             raise ValueError(f"Invalid mode specified: {protocol_type}")
         
         self.protocol_type = protocol_type
+        self._protocol_type_options = protocol_type_options
 
         if style_id not in _psm.get_available_styles():
             raise ValueError(f"Invalid style specified: {style_id}")        
         style = _psm.get_available_style(style_id)
+        self._style_id = style_id
 
         self._protocol_features = style.get_protocol_features(self.protocol_type)
 
@@ -92,949 +197,534 @@ class ModemSocket(Channel):
                 self.protocol_subtype = ProtocolSubType.YMODEM_G_FILE_TRANSMISSION
             else:
                 self.protocol_subtype = ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION
+        else:
+            self.protocol_subtype = None
     
     def send(self, 
-             paths: List[str], 
-             callback: Optional[Callable[[int, str, int, int], None]] = None
+             paths: List[Union[str, Source, Any]], 
+             callback: Optional[Callable[[int, str, int, int], None]] = None,
+             include: Optional[List[str]] = None,
+             exclude: Optional[List[str]] = None,
+             order: Optional[str] = None,
+             journal: Optional[str] = None,
+             resume_batch: bool = False
              ) -> bool:
         '''
         Send files
 
-        param paths: List of file paths to be sent
-        param retry: Number of retries when communication error occur
-        param timeout: read/write timeout
-        param callback: 
+        param paths: List of file paths, directory paths (sent recursively with relative names),
+                     Source objects (in-memory buffers, file objects, generators) or packet images
+                     (ymodem.Image.PacketImage, their frames are sent as they are) to be sent
+        param callback: progress callback, rate limited by progress_interval / progress_step
+        param include: glob patterns of the files to send
+        param exclude: glob patterns of the files and directories to skip
+        param order: None to keep the given order, "size" to send the smallest files first
+        param journal: path of a checkpoint journal recording every file (path, size, mtime)
+                       once its EOT has been acknowledged
+        param resume_batch: skip the files already recorded in the journal instead of starting it again
+        '''
+        return _drain(self.iter_send(paths, callback, include, exclude, order, journal, resume_batch))
+
+    def iter_send(self, 
+                  paths: List[Union[str, Source, Any]], 
+                  callback: Optional[Callable[[int, str, int, int], None]] = None,
+                  include: Optional[List[str]] = None,
+                  exclude: Optional[List[str]] = None,
+                  order: Optional[str] = None,
+                  journal: Optional[str] = None,
+                  resume_batch: bool = False
+                  ) -> Generator[Event, None, bool]:
+        '''
+        Send files like send(), as a generator of the events of the transfer:
+        FileStarted, Progress, Retransmit and FileDone.
+
+        The transfer only advances while the generator is iterated, so the
+        caller can update a UI between two events without a callback.
+        Closing the generator cancels the transfer and aborts the receiver.
+        The generator returns the result of send().
         '''
+        if order not in (None, "size"):
+            raise ValueError(f"Invalid order specified: {order}")
+        if resume_batch and not journal:
+            raise ValueError("resume_batch requires a journal")
+        self._stop_requests = 0
+        return self._iter_send(paths, callback, include, exclude, order, journal, resume_batch)
+
+    def _iter_send(self, 
+                   paths: List[Union[str, Source, Any]], 
+                   callback: Optional[Callable[[int, str, int, int], None]],
+                   include: Optional[List[str]],
+                   exclude: Optional[List[str]],
+                   order: Optional[str],
+                   journal: Optional[str],
+                   resume_batch: bool
+                   ) -> Generator[Event, None, bool]:
         # XYMODEM process
         if self.protocol_type == ProtocolType.XMODEM or self.protocol_type == ProtocolType.YMODEM:
 
-            tasks = []      # type: List[_TransmissionTask]
-            stream = None   # type: BufferedReader
+            # features adopted from the receiver only last for one session
+            core = SenderCore(self.protocol_type, self.protocol_subtype, self._protocol_features, self._packet_size,
+                              self._compression, self._compression_level,
+                              self._start_timeout if self._start_timeout is not None else 60,
+                              self._digest, self._digest_trailer, self._xonxoff)
+            progress = ProgressDispatcher(callback, self._progress_interval, self._progress_step)
+            self.results = []
+
+            batch_journal = None
+            if journal:
+                from ymodem.Journal import BatchJournal
+                batch_journal = BatchJournal(journal, resume_batch)
+            task = None         # type: Optional[_TransmissionTask]
+
+            def on_event(event: Event) -> None:
+                if isinstance(event, Progress):
+                    progress.update(event.task_index, event.name, event.total, event.done)
+                elif isinstance(event, FileDone):
+                    progress.flush()
+                    self._file_done(event, "Sender")
+                    # only files on disk can be identified again by a later run,
+                    # a file the receiver stored with a different digest has to be sent again
+                    if batch_journal is not None and task.key_path and event.verified is not False:
+                        batch_journal.record(task.key_path, task.total, task.mtime)
+
+            # Files are discovered while the batch is being sent, unless they have to be sorted first
+            tasks = _iter_tasks(paths, include, exclude)     # type: Iterator[_TransmissionTask]
+
+            if order == "size":
+                tasks = iter(sorted(tasks, key=lambda task: task.total))
 
             # XMODEM and XMODEM_1K only supports single file transfer
             if self.protocol_type == ProtocolType.XMODEM:
-                if len(paths) > 0:
-                    paths = paths[:1]
+                tasks = itertools.islice(tasks, 1)
 
-            #############################################################################################
-            #
-            #                                 XYMODEM common processing
-            #
-            #############################################################################################
-            for path in paths:
-                if os.path.isfile(path):
-                    tasks.append(_TransmissionTask(path))
+            self._start_recording("send")
+            try:
+                for task_index, task in enumerate(tasks):
 
-            for task_index, task in enumerate(tasks):
+                    if batch_journal is not None and task.key_path and batch_journal.delivered(task.key_path, task.total, task.mtime):
+                        self.logger.info(f"[Sender]: {task.name} was already delivered, skip.")
+                        continue
 
-                try:
-                    stream = open(task.path, "rb")
-                except IOError:
-                    self.logger.error(f"[Sender]: Cannot open the file: {task.path}, skip.")
-                    continue
+                    if task.image:
+                        core.start_file(task_index, FileInfo(task.name, task.total, task.mtime), task.image)
+                        yield from self._run(core, on_event)
+                        if core.done:
+                            return self._result(core)
+                        continue
 
-                if self.protocol_type == ProtocolType.YMODEM:
-                    '''
-                    7.3.3 Sending_program_considerations
-
-                    While waiting for transmission to begin, the sender has only a single very
-                    long timeout, say one minute.
-                    '''
-
-                    c = self._read_and_wait([NAK, CRC, G, CAN], 60)
-
-                    if c:
-                        if c == CAN:
-                            self.logger.debug("[Sender]: <- CAN")
-                            self.logger.warning("[Sender]: Received a request from the Receiver to cancel the transmission, exit.")
-                            if stream:
-                                stream.close()
-                            return True
-                    else:
-                        self.logger.error("[Sender]: Waiting for command from Receiver has timed out, abort and exit!")
-                        self._abort()
-                        self.logger.debug("[Sender]: CAN ->")
-                        if stream:
-                            stream.close()
-                        return False
-                    
-                    if c == NAK:
-                        self.logger.debug("[Sender]: <- NAK")
-                        crc = 0
-                    else:
-                        self.logger.debug("[Sender]: <- CRC / G")
-                        crc = 1
-                    
-                    header = self._make_send_header(self._packet_size, 0)
-                    self.logger.debug(f"[Sender]: {'SOH' if self._packet_size == 128 else 'STX'} ->")
-
-                    '''
-                    Pathname 
-                    
-                    The pathname (conventionally, the file name) is sent as a null
-                    terminated ASCII string. This is the filename format used by the
-                    handle oriented MSDOS(TM) functions and C library fopen functions.
-                    An assembly language example follows:
-                    DB 'foo.bar',0
-                    No spaces are included in the pathname. Normally only the file name
-                    stem (no directory prefix) is transmitted unless the sender has
-                    selected YAM's f option to send the full pathname. The source drive
-                    (A:, B:, etc.) is not sent.
-                    '''
-                    # Python's handling is case compatible
-                    data = task.name.encode("utf-8")
-                    
-                    '''
-                    Length 
-
-                    The file length and each of the succeeding fields are optional.[3]
-                    The length field is stored in the block as a decimal string counting
-                    the number of data bytes in the file. The file length does not
-                    include any CPMEOF (^Z) or other garbage characters used to pad the
-                    last block.
-                    If the file being transmitted is growing during transmission, the
-                    length field should be set to at least the final expected file
-                    length, or not sent.
-                    The receiver stores the specified number of characters, discarding
-                    any padding added by the sender to fill up the last block.
-                    '''
-                    if self._protocol_features & YMODEM.USE_LENGTH_FIELD:
-                        data += bytes(1)
-                        data += str(task.total).encode("utf-8")
-
-                    '''
-                    Modification 
-                    
-                    Date The mod date is optional, and the filename and length
-                    may be sent without requiring the mod date to be sent.
-                    If the modification date is sent, a single space separates the
-                    modification date from the file length.
-                    The mod date is sent as an octal number giving the time the contents
-                    of the file were last changed, measured in seconds from Jan 1 1970
-                    Universal Coordinated Time (GMT). A date of 0 implies the
-                    modification date is unknown and should be left as the date the file
-                    is received.
-                    This standard format was chosen to eliminate ambiguities arising from
-                    transfers between different time zones.
-                    '''
-                    # Python 2+: 0123456
-                    # Python 3+: 0o123456
-                    if self._protocol_features & YMODEM.USE_DATE_FIELD:
-                        mtime = oct(int(task.mtime))
-                        if mtime.startswith("0o"):
-                            data += (" " + mtime[2:]).encode("utf-8")
-                        else:
-                            data += (" " + mtime[1:]).encode("utf-8")
-
-                    '''
-                    Mode 
-
-                    If the file mode is sent, a single space separates the file mode
-                    from the modification date. The file mode is stored as an octal
-                    string. Unless the file originated from a Unix system, the file mode
-                    is set to 0. rb(1) checks the file mode for the 0x8000 bit which
-                    indicates a Unix type regular file. Files with the 0x8000 bit set
-                    are assumed to have been sent from another Unix (or similar) system
-                    which uses the same file conventions. Such files are not translated
-                    in any way.
-                    '''
-                    if self._protocol_features & YMODEM.USE_MODE_FIELD:
-                        if Platform.is_Linux():
-                            data += (" " + oct(0x8000)).encode("utf-8")
-                        else:
-                            data += (" 0").encode("utf-8")
-
-                    '''
-                    Serial Number 
-                    
-                    If the serial number is sent, a single space separates the
-                    serial number from the file mode. The serial number of the
-                    transmitting program is stored as an octal string. Programs which do
-                    not have a serial number should omit this field, or set it to 0. The
-                    receiver's use of this field is optional.
-                    '''
-                    # This program does not set serial number
-                    if self._protocol_features & YMODEM.USE_SN_FIELD:
-                        data += (" 0").encode("utf-8")
-
-                    data = data.ljust(self._packet_size, b"\x00")
-                    checksum = self._make_send_checksum(crc, data)
-                    
-                    retries = 0
-                    while True:
-                        if self.protocol_subtype == ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION:
-                            if retries < 10:
-                                self.write(header + data + checksum)
-                                self.logger.debug("[Sender]: Filename packet ->")
-
-                                '''
-                                7.3.3 Sending_program_considerations
-
-                                In the current protocol, the sender has a
-                                10 second timeout before retrying. I suggest NOT doing this, and letting
-                                the protocol be completely receiver-driven. This will be compatible with
-                                existing programs.
-                                '''
-                                # expect for ACK and NAK, but only distinguish between ack and other characters
-                                c = self._read_and_wait([ACK])
-                                if c:
-                                    self.logger.debug("[Sender]: <- ACK")
-                                    break
-                                else:
-                                    self.logger.warning("[Sender]: No ACK from Receiver, preparing to retransmit.")
-                                    retries += 1
-                            else:
-                                self.logger.error("[Sender]: The number of retransmissions has reached the maximum limit, abort and exit!")
-                                self._abort()
-                                self.logger.debug("[Sender]: CAN ->")
-                                if stream:
-                                    stream.close()
-                                return False
-                        # self.protocol_subtype == ProtocolSubType.YMODEM_G_FILE_TRANSMISSION
-                        else:
-                            self.write(header + data + checksum)
-                            self.logger.debug("[Sender]: Filename packet ->")
-                            break
-
-                #############################################################################################
-                #
-                #                                 XYMODEM common processing
-                #
-                #############################################################################################
-                           
-                c = self._read_and_wait([NAK, CRC, G, CAN], 60)
-
-                if c:
-                    if c == CAN:
-                        self.logger.debug("[Sender]: <- CAN")
-                        self.logger.warning("[Sender]: Received a request from the Receiver to cancel the transmission, exit.")
-                        if stream:
-                            stream.close()
-                        return True
-                else:
-                    self.logger.error("[Sender]: Waiting for command from Receiver has timed out, abort and exit!")
-                    self._abort()
-                    self.logger.debug("[Sender]: CAN ->")
-                    if stream:
-                        stream.close()
-                    return True
-                
-                if c == NAK:
-                    self.logger.debug("[Sender]: <- NAK")
-                    crc = 0
-                else:
-                    self.logger.debug("[Sender]: <- CRC / G")
-                    crc = 1
+                    try:
+                        stream = task.source.open() if task.source else open(task.path, "rb")
+                    except IOError:
+                        self.logger.error(f"[Sender]: Cannot open the file: {task.path or task.name}, skip.")
+                        continue
 
-                sequence = 1
-                task.success_packet_count = 0
-                while True:
                     try:
-                        data = stream.read(self._packet_size)
-                    except Exception:
-                        self.logger.error("[Sender]: Failed to read file, abort and exit!")
-                        self._abort()
-                        self.logger.debug("[Sender]: CAN ->")
-                        if stream:
-                            stream.close()
-                        return False
-
-                    if not data:
-                        self.logger.debug("[Sender]: Reached EOF")
-                        if stream:
-                            stream.close()
-                        break
-
-                    header = self._make_send_header(self._packet_size, sequence)
-                    self.logger.debug(f"[Sender]: {'SOH' if self._packet_size == 128 else 'STX'} ->")
-                    # fill with 1AH(^z)
-                    data_length = len(data)
-                    data = data.ljust(self._packet_size, b"\x1a")
-                    checksum = self._make_send_checksum(crc, data)
-
-                    retries = 0
-                    while True:
-                        if self.protocol_type == ProtocolType.XMODEM or self.protocol_subtype == ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION:
-                            if retries < 10:
-                                self.write(header + data + checksum)
-                                self.logger.debug(f"[Sender]: Data packet {sequence} ->")
-
-                                # expect for ACK and NAK, but only distinguish between ack and other characters
-                                c = self._read_and_wait([ACK])
-                                if c:
-                                    self.logger.debug("[Sender]: <- ACK")
-                                    task.sent += data_length
-                                    task.success_packet_count += 1
-                                    if callable(callback):
-                                        callback(task_index, task.name, task.total, task.sent)
-                                    break
-                                else:
-                                    self.logger.warning("[Sender]: No ACK from Receiver, preparing to retransmit.")
-                                    retries += 1
-                            else:
-                                self.logger.error("[Sender]: The number of retransmissions has reached the maximum limit, abort and exit!")
-                                self._abort()
-                                self.logger.debug("[Sender]: CAN ->")
-                                if stream:
-                                    stream.close()
-                                return False
-                        # self.protocol_subtype == ProtocolSubType.YMODEM_G_FILE_TRANSMISSION
-                        else:
-                            self.write(header + data + checksum)
-                            self.logger.debug(f"[Sender]: Data packet {sequence} ->")
-                            task.sent += self._packet_size
-                            task.success_packet_count += 1
-                            if callable(callback):
-                                callback(task_index, task.name, task.total, task.sent)
-                            # 500 microseconds, high success rate delay
-                            # self._delay(0.0005)
-                            break
-
-                    sequence = (sequence + 1) % 256
-
-                '''
-                2. YMODEM MINIMUM REQUIREMENTS
-
-                + At the end of each file, the sending program shall send EOT up to ten
-                times until it receives an ACK character. (This is part of the
-                XMODEM spec.)
-
-                7.3.3 Sending_program_considerations
-
-                When the sender has no more data, it sends an <eot>, and awaits an <ack>,
-                resending the <eot> if it doesn't get one. Again, the protocol could be
-                receiver-driven, with the sender only having the high-level 1-minute
-                timeout to abort.
-                '''
-                retries = 0
-                while True:
-                    if retries < 10:
-                        c = self._write_and_wait(EOT, [ACK])
-                        self.logger.debug("[Sender]: EOT ->")
-
-                        if c:
-                            self.logger.debug("[Sender]: <- ACK")
-                            break
-                        else:
-                            self.logger.warning("[Sender]: No ACK from Receiver, preparing to retransmit.")
-                            retries += 1
-                    else:
-                        self.logger.error("[Sender]: The number of retransmissions has reached the maximum limit, abort and exit!")
-                        self._abort()
-                        return False
-                    
-            '''
-            5. YMODEM Batch File Transmission
-
-            Transmission of a null pathname terminates batch file transmission.
-            '''
-
-            if self.protocol_type == ProtocolType.YMODEM:
-                header = self._make_send_header(self._packet_size, 0)
-                data = bytearray().ljust(self._packet_size, b"\x00")
-                checksum = self._make_send_checksum(crc, data)
-                self.write(header + data + checksum)
-                self.logger.debug("[Sender]: Batch end packet ->")
+                        core.start_file(task_index, FileInfo(task.name, task.total, task.mtime))
+                        yield from self._run(core, on_event, lambda: self._feed(core, stream))
+                    finally:
+                        stream.close()
 
-            return True
+                    if core.done:
+                        return self._result(core)
+
+                core.end_batch()
+                yield from self._run(core, on_event)
+                return self._result(core)
+            finally:
+                self._stop_recording()
+                if batch_journal is not None:
+                    batch_journal.close()
+
+    def _feed(self, core: SenderCore, stream: Any) -> None:
+        try:
+            data = stream.read(core.packet_size)
+        except Exception as err:
+            core.abort(f"[Sender]: Failed to read file: {err}, abort and exit!")
+            return
+        if data:
+            core.send_data(data)
+        else:
+            core.end_file()
 
     def recv(self, 
-             path: str, 
+             path: Union[str, Callable[[FileInfo], Any]], 
              callback: Optional[Callable[[int, str, int, int], None]] = None
              ) -> bool:
+        '''
+        Receive files
 
-        # XYMODEM process
-        if self.protocol_type == ProtocolType.XMODEM or self.protocol_type == ProtocolType.YMODEM:
+        param path: folder path for storing the received files, or a sink factory called with
+                    the FileInfo of each file and returning a writable object, a Sink or a
+                    callable receiving each chunk of data
+        param callback: progress callback, rate limited by progress_interval / progress_step
+        '''
+        return _drain(self.iter_recv(path, callback))
 
-            # task index
-            task_index = -1
-
-            while True:
-
-                task = _TransmissionTask()
-                
-                if self.protocol_type == ProtocolType.YMODEM:
-                    '''
-                    5. YMODEM Batch File Transmission
-
-                    As in the case of single a file transfer, the receiver initiates batch
-                    file transmission by sending a "C" character (for CRC-16).
-
-                    7.3.2 Receive_Program_Considerations
-
-                    The receiver has a 10-second timeout. It sends a <nak> every time it
-                    times out. The receiver's first timeout, which sends a <nak>, signals the
-                    transmitter to start. Optionally, the receiver could send a <nak>
-                    immediately, in case the sender was ready. This would save the initial 10
-                    second timeout. However, the receiver MUST continue to timeout every 10
-                    seconds in case the sender wasn't ready.
-                    '''
-                    for _ in range(10):
-                        if self.protocol_subtype == ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION:
-                            c = self._write_and_wait(CRC, [SOH, STX, CAN], 10)
-                            self.logger.debug("[Receiver]: CRC ->")
-                        # self.protocol_subtype == ProtocolSubType.YMODEM_G_FILE_TRANSMISSION:
-                        else:
-                            c = self._write_and_wait(G, [SOH, STX, CAN], 10)
-                            self.logger.debug("[Receiver]: G ->")
-                        if c:
-                            break
-
-                    retries = 0
-                    while True:
-                        if c:
-                            if c == CAN:
-                                self.logger.debug("[Receiver]: <- CAN")
-                                self.logger.warning("[Receiver]: Received a request from the Sender to cancel the transmission, exit.")
-                                return True
-                            else:
-                                pass
-                        else:
-                            self.logger.error("[Receiver]: Waiting for response from Sender has timed out, abort and exit!")
-                            self._abort()
-                            self.logger.debug("[Receiver]: CAN ->")
-                            return False
-                        
-                        if c == SOH:
-                            self.logger.debug("[Receiver]: <- SOH")
-                            packet_size = 128
-                        else: 
-                            self.logger.debug("[Receiver]: <- STX")
-                            packet_size = 1024
-
-                        seq1 = self.read(1)
-                        if seq1:
-                            seq1 = ord(seq1)
-                            seq2 = self.read(1)
-                            if seq2:
-                                seq2 = 0xff - ord(seq2)
-                        else:
-                            seq2 = None
-
-                        received = False
-
-                        if seq1 == seq2 == 0:
-                            data = self.read(packet_size + 2)
-
-                            if data and len(data) == (packet_size + 2):
-                                
-                                valid, data = self._verify_recv_checksum(1, data)
-
-                                if valid:
-
-                                    file_name = bytes.decode(data.split(b"\x00")[0], "utf-8")
-                                    
-                                    # batch end packet received
-                                    if not file_name:
-                                        self.logger.debug("[Receiver]: <- Batch end packet")
-                                        if self.protocol_subtype == ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION:
-                                            self.write(ACK)
-                                            self.logger.debug("[Receiver]: ACK ->")
-                                        return True
-
-                                    # filename packet received
-                                    else:
-                                        self.logger.debug("[Receiver]: <- Filename packet.")
-
-                                    task_index += 1
-                                    task.name = file_name
-                                    self.logger.debug(f"[Receiver]: File - {task.name}")
-
-                                    data = bytes.decode(data.split(b"\x00")[1], "utf-8")
-
-                                    if self._protocol_features & YMODEM.USE_LENGTH_FIELD:
-                                        space_index = data.find(" ")
-                                        task.total = int(data if space_index == -1 else data[:space_index])
-                                        self.logger.debug(f"[Receiver]: Size - {task.total} bytes")
-                                        data = data[space_index + 1:]
-
-                                    if self._protocol_features & YMODEM.USE_DATE_FIELD:
-                                        space_index = data.find(" ")
-                                        task.mtime = int(data if space_index == -1 else data[:space_index], 8)
-                                        self.logger.debug(f"[Receiver]: Mtime - {task.mtime} seconds")
-                                        data = data[space_index + 1:]
-
-                                    if self._protocol_features & YMODEM.USE_MODE_FIELD:
-                                        space_index = data.find(" ")
-                                        task.mode = int(data if space_index == -1 else data[:space_index])
-                                        self.logger.debug(f"[Receiver]: Mode - {task.mode}")
-                                        data = data[space_index + 1:]
-
-                                    if self._protocol_features & YMODEM.USE_SN_FIELD:
-                                        space_index = data.find(" ")
-                                        task.sn = int(data if space_index == -1 else data[:space_index])
-                                        self.logger.debug(f"[Receiver]: SN - {task.sn}")
-
-                                    received = True
-
-                                # broken packet
-                                else:
-                                    self.logger.warning("[Receiver]: Checksum failed.")
-                            
-                            # timeout received data
-                            else:
-                                self.logger.warning("[Receiver]: Received data timed out.")
-
-                        # invalid header: wrong sequence
-                        else:
-                            # skip this packet
-                            self.logger.warning("[Receiver]: Wrong sequence, drop the whole packet.")
-                            self.read(packet_size + 2)
-
-                        '''
-                        5. YMODEM Batch File Transmission
-
-                        If the filename block is received with a CRC or other error, a
-                        retransmission is requested. After the filename block has been received,
-                        it is ACK'ed if the write open is successful. If the file cannot be
-                        opened for writing, the receiver cancels the transfer with CAN characters
-                        as described above.
-                        '''
-                        if self.protocol_subtype == ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION and not received:
-                            '''
-                            7.3.1 Common_to_Both_Sender_and_Receiver
-
-                            All errors are retried 10 times.
-                            '''
-                            if retries < 10:
-                                self.logger.warning("[Receiver]: Send a request for retransmission.")
-
-                                '''
-                                7.4 Programming Tips
-                                
-                                + When the receiver wishes to <nak>, it should call a "PURGE"
-                                subroutine, to wait for the line to clear. Recall the sender tosses
-                                any characters in its UART buffer immediately upon completing sending
-                                a block, to ensure no glitches were mis- interpreted.
-                                '''
-                                self._purge()
-                                c = self._write_and_wait(NAK, [SOH, STX, CAN])
-                                self.logger.debug("[Receiver]: NAK ->")
-                                retries += 1
-                            else:
-                                self.logger.error("[Receiver]: The number of retransmissions has reached the maximum limit, abort and exit!")
-                                self._abort()
-                                self.logger.debug("[Receiver]: CAN ->")
-                                return False
-                        elif self.protocol_subtype == ProtocolSubType.YMODEM_G_FILE_TRANSMISSION and not received:
-                            '''
-                            If an error is detected in a YMODEM-g transfer, the receiver aborts the
-                            transfer with the multiple CAN abort sequence.
-                            '''
-                            self.logger.error("[Receiver]: An error occurred during the transfer process using YMODEM_G, abort and exit!")
-                            self._abort()
-                            self.logger.debug("[Receiver]: CAN ->")
-                            return False
-                        else:
-                            p = os.path.join(path, task.name)
-
-                            '''
-                            5. YMODEM Batch File Transmission
-
-                            After the filename block has been received,
-                            it is ACK'ed if the write open is successful. If the file cannot be
-                            opened for writing, the receiver cancels the transfer with CAN characters
-                            as described above.
-                            '''
-                            try:
-                                stream = open(p, "wb+")
-                                if self.protocol_type == ProtocolType.YMODEM:
-                                    self.write(ACK)
-                                    self.logger.debug("[Receiver]: ACK ->")
-                                break
-                            except IOError:
-                                self.logger.error(f"[Receiver]: Cannot open the save path: {p}, abort and exit!")
-                                self._abort()
-                                self.logger.debug("[Receiver]: CAN ->")
-                                if stream:
-                                    stream.close()
-                                return False
-
-                #############################################################################################
-                #
-                #                                 XYMODEM common processing
-                #
-                #############################################################################################
-                '''
-                7.4 Programming Tips
-
-                + The character-receive subroutine should be called with a parameter
-                specifying the number of seconds to wait. The receiver should first
-                call it with a time of 10, then <nak> and try again, 10 times.
-                '''
-                for _ in range(10):
-                    if self.protocol_type == ProtocolType.XMODEM or self.protocol_subtype == ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION:
-                        c = self._write_and_wait(CRC, [SOH, STX, CAN], 10)
-                        self.logger.debug("[Receiver]: CRC ->")
-                    elif self.protocol_subtype == ProtocolSubType.YMODEM_G_FILE_TRANSMISSION:
-                        c = self._write_and_wait(G, [SOH, STX, CAN], 10)
-                        self.logger.debug("[Receiver]: G ->")
-                    if c:
-                        if c == CAN:
-                            self.logger.debug("[Receiver]: <- CAN")
-                            self.logger.warning("[Receiver]: Received a request from the Sender to cancel the transmission, exit.")
-                            if stream:
-                                stream.close()
-                            return True
-                        else:
-                            # YMODEM enter here
-                            crc = 1
-                            break
-                
-                if (self.protocol_type == ProtocolType.XMODEM or self.protocol_subtype == ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION) and not c:
-                    self.logger.warning("[Receiver]: No response in crc mode, try checksum mode...")
-                    for _ in range(10):
-                        c = self._write_and_wait(NAK, [SOH, STX, CAN], 10)
-                        self.logger.debug(f"[Receiver]: received {c}")
-                        if c:
-                            if c == CAN:
-                                self.logger.debug("[Receiver]: <- CAN")
-                                self.logger.warning("[Receiver]: Received a request from the Sender to cancel the transmission, exit.")
-                                if stream:
-                                    stream.close()
-                                return True
-                            else:
-                                crc = 0
-                                break
-
-                if not c:
-                    self.logger.error("[Receiver]: No response in checksum mode, abort and exit!")
-                    self._abort()
-                    self.logger.debug("[Receiver]: CAN ->")
-                    if stream:
-                        stream.close()
-                    return False
-
-                retries = 0
-                sequence = 1
-                task.success_packet_count = 0
-                while True:
-                    if c == SOH:
-                        self.logger.debug("[Receiver]: <- SOH")
-                        packet_size = 128
-                    elif c == STX: 
-                        self.logger.debug("[Receiver]: <- STX")
-                        packet_size = 1024
-                    elif c == CAN:
-                        self.logger.debug("[Receiver]: <- CAN")
-                        if stream:
-                            stream.close()
-                        return True
-                    elif c == EOT:
-                        self.logger.debug("[Receiver]: <- EOT")
-                        self.write(ACK)
-                        self.logger.debug("[Receiver]: ACK ->")
-                        if stream:
-                            stream.close()
-                        break
-
-                    seq1 = self.read(1)
-                    if seq1:
-                        seq1 = ord(seq1)
-                        seq2 = self.read(1)
-                        if seq2:
-                            seq2 = 0xff - ord(seq2)
-                    else:
-                        seq2 = None
-
-                    '''
-                    7.3.2 Receive_Program_Considerations
-                    
-                    Synchronizing: If a valid block number is received, it will be: 
-                    1) the expected one, in which case everything is fine;
-                    2) a repeat of the previously received block. This should be considered OK, 
-                    and only indicates that the receivers <ack> got glitched, and the sender retransmitted; 
-                    3) any other block number indicates a fatal loss of synchronization, such as the rare case
-                    of the sender getting a line-glitch that looked like an <ack>. Abort the transmission, sending a <can>
-                    '''
-
-                    # default no confirm and no forward
-                    received = False
-                    forward = False
-
-                    if (seq1 == seq2 == sequence):
-                        data = self.read(packet_size + 1 + crc)
-
-                        if data and len(data) == (packet_size + 1 + crc):
-
-                            valid, data = self._verify_recv_checksum(crc, data)
-
-                            # Write the original data to the target file
-                            if valid:
-                                self.logger.debug(f"[Receiver]: <- Data packet {sequence}")
-
-                                valid_length = packet_size
-
-                                '''
-                                5. YMODEM Batch File Transmission
-
-                                The receiver stores the specified number of characters, discarding
-                                any padding added by the sender to fill up the last block.
-                                '''
-                                remaining_length = task.total - task.received
-                                if (remaining_length > 0):
-                                    valid_length = min(valid_length, remaining_length)
-                                data = data[:valid_length]
-
-                                task.received += len(data)
-                                task.success_packet_count += 1
-
-                                try:
-                                    stream.write(data)
-                                except Exception:
-                                    self.logger.error(f"[Receiver]: Failed to write data packet {sequence} to file, abort and exit!")
-                                    self._abort()
-                                    self.logger.debug("[Receiver]: CAN ->")
-                                    if stream:
-                                        stream.close()
-                                    return False
-
-                                if callable(callback):
-                                    callback(task_index, task.name, task.total, task.received)
-
-                                # confirm and forward
-                                received = True
-                                forward = True
-
-                            # broken packet
-                            else:
-                                self.logger.warning("[Receiver]: Checksum failed.")
-                        
-                        # timeout received data
-                        else:
-                            self.logger.warning("[Receiver]: Received data timed out.")
-
-                    # invalid header: expired sequence
-                    elif 0 <= seq1 <= task.success_packet_count:
-                        self.logger.warning("[Receiver]: Expired sequence, drop the whole packet.")
-                        self.read(packet_size + 1 + crc)
-
-                        # confirm but no forward
-                        received = True
-
-                    # invalid header: wrong sequence
-                    else:
-                        # skip this packet
-                        self.logger.warning("[Receiver]: Wrong sequence, drop the whole packet.")
-                        self.read(packet_size + 1 + crc)
-
-                    if (self.protocol_type == ProtocolType.XMODEM or self.protocol_subtype == ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION) and not received:
-                        if retries < 10:
-                            # retransmisstion
-                            self.logger.warning("[Receiver]: Send a request for retransmission.")
-                            self._purge()
-                            c = self._write_and_wait(NAK, [SOH, STX, CAN])
-                            self.logger.debug("[Receiver]: NAK ->")
-                            retries += 1
-                        else:
-                            self.logger.error("[Receiver]: The number of retransmissions has reached the maximum limit, abort and exit!")
-                            self._abort()
-                            self.logger.debug("[Receiver]: CAN ->")
-                            if stream:
-                                stream.close()
-                            return False
-                    elif self.protocol_subtype == ProtocolSubType.YMODEM_G_FILE_TRANSMISSION and not received:
-                        self.logger.error("[Receiver]: An error occurred during the transfer process using YMODEM_G, abort and exit!")
-                        self._abort()
-                        self.logger.debug("[Receiver]: CAN ->")
-                        return False
-                    else:
-                        if forward:
-                            sequence = (sequence + 1) % 0x100
-                        if self.protocol_type == ProtocolType.XMODEM or self.protocol_subtype == ProtocolSubType.YMODEM_BATCH_FILE_TRANSMISSION:
-                            c = self._write_and_wait(ACK, [SOH, STX, CAN, EOT])
-                            self.logger.debug("[Receiver]: ACK ->")
-                            retries = 0
-                        else:
-                            c = self._read_and_wait([SOH, STX, CAN, EOT])
-                        
-
-    def _abort(self) -> None:
+    def iter_recv(self, 
+                  path: Union[str, Callable[[FileInfo], Any]], 
+                  callback: Optional[Callable[[int, str, int, int], None]] = None
+                  ) -> Generator[Event, None, bool]:
+        '''
+        Receive files like recv(), as a generator of the events of the transfer:
+        FileHeader, FileStarted, Data, Progress, Retransmit, FileEnd and FileDone.
+
+        The files are written to path as with recv(), Data only reports what
+        was written. The transfer only advances while the generator is iterated,
+        closing it cancels the transfer and aborts the sender. The generator
+        returns the result of recv().
         '''
-        4.1 Graceful Abort
-        The YAM and Professional-YAM X/YMODEM routines recognize a sequence of two
-        consecutive CAN (Hex 18) characters without modem errors (overrun,
-        framing, etc.) as a transfer abort command. This sequence is recognized
-        when is waiting for the beginning of a block or for an acknowledgement to
-        a block that has been sent. The check for two consecutive CAN characters
-        reduces the number of transfers aborted by line hits. YAM sends eight CAN
-        characters when it aborts an XMODEM, YMODEM, or ZMODEM protocol file
-        transfer. Pro-YAM then sends eight backspaces to delete the CAN
-        characters from the remote's keyboard input buffer, in case the remote had
-        already aborted the transfer and was awaiting a keyboarded command.
+        self._stop_requests = 0
+        return self._recv_batch(path, callback)
+
+    def serve(self, 
+              path: str, 
+              callback: Optional[Callable[[int, str, int, int], None]] = None,
+              batch_directories: bool = True
+              ) -> int:
         '''
-        for _ in range(2):
-            self.write(CAN)
+        Receive batch after batch on the open channel until stop() is called.
 
-    def _purge(self) -> None:
-        while True:
-            c = self.read(1)
-            if not c:
-                break
+        param path: folder path for storing the received files
+        param callback: progress callback, rate limited by progress_interval / progress_step
+        param batch_directories: store every batch in its own folder, named after the time its
+                                 first file arrived, instead of directly in path
+        return: number of batches received successfully
 
-    def _delay(self, duration):
-        start_time = time.perf_counter()
-        while True:
-            t = time.perf_counter() - start_time
-            if t > duration:
+        A failed batch is logged and the next one is awaited. Nothing is kept
+        from one batch to the next, memory use does not grow with uptime.
+        '''
+        self._stop_requests = 0
+        batches = 0
+        while not self._stop_requests:
+            directory = None
+
+            def open_file(info: FileInfo) -> Sink:
+                nonlocal directory
+                # created by the first file, waiting for a sender leaves no empty folder behind
+                if directory is None:
+                    directory = path
+                    if batch_directories:
+                        directory = os.path.join(path, f"{time.strftime('%Y%m%d-%H%M%S')}-{batches + 1}")
+                    os.makedirs(directory, exist_ok=True)
+                stream = self._open_file(directory, info)
+                return CallbackSink(stream.write, stream.close)
+
+            if _drain(self._recv_batch(open_file, callback, wait_forever=True)):
+                batches += 1
+                self.logger.info(f"[Receiver]: Batch {batches} received{' into ' + directory if directory else ''}")
+            elif directory is not None:
+                self.logger.error(f"[Receiver]: Batch failed, partial files kept in {directory}")
+            # no more batches can arrive
+            if self._disconnected:
                 break
+        return batches
 
-    def _read_and_wait(self, 
-                        wait_chars: List[str],
-                        wait_time: int = 1
-                        ) -> Optional[str]:
-        start_time = time.perf_counter()
-        while True:
-            t = time.perf_counter() - start_time
-            if t > wait_time:
-                return None
-            c = self.read(1)
-            if c in wait_chars:
-                return c
-    
-    def _write_and_wait(self, 
-                        write_char: str, 
-                        wait_chars: List[str],
-                        wait_time: int = 1
-                        ) -> Optional[str]:
-        start_time = time.perf_counter()
-        self.write(write_char)
-        while True:
-            t = time.perf_counter() - start_time
-            if t > wait_time:
-                return None
-            c = self.read(1)
-            if c in wait_chars:
-                return c
-            
-    def _make_send_header(self, packet_size, sequence):
-        assert packet_size in (128, 1024), packet_size
-        _bytes = []
-        if packet_size == 128:
-            _bytes.append(ord(SOH))
-        elif packet_size == 1024:
-            _bytes.append(ord(STX))
-        _bytes.extend([sequence, 0xff - sequence])
-        return bytearray(_bytes)
-
-    def _make_send_checksum(self, crc, data):
-        _bytes = []
-        if crc:
-            crc = calc_crc16(data)
-            _bytes.extend([crc >> 8, crc & 0xff])
-        else:
-            crc = calc_checksum(data)
-            _bytes.append(crc)
-        return bytearray(_bytes)
-
-    def _verify_recv_checksum(self, crc, data):
-        if crc:
-            _checksum = bytearray(data[-2:])
-            remote_sum = (_checksum[0] << 8) + _checksum[1]
-            data = data[:-2]
-
-            local_sum = calc_crc16(data)
-            valid = bool(remote_sum == local_sum)
-            if not valid:
-                self.logger.debug("[Receiver]: CRC verification failed. Sender: %04x, Receiver: %04x.", remote_sum, local_sum)
-        else:
-            _checksum = bytearray([data[-1]])
-            remote_sum = _checksum[0]
-            data = data[:-1]
-
-            local_sum = calc_checksum(data)
-            valid = remote_sum == local_sum
-            if not valid:
-                self.logger.debug("[Receiver]: CRC verification failed. Sender: %02x, Receiver: %02x.", remote_sum, local_sum)
-        return valid, data
-    
+    def stop(self) -> None:
+        '''
+        Ask a running send(), recv() or serve() to return, e.g. from a signal handler.
 
-class _TransmissionTask:
-    def __init__(self, path: Optional[str] = None):
-        self._path = path or ""
-        self._name = os.path.basename(path) if path else ""
-        self._mtime = os.path.getmtime(path) if path else 0
-        self._mode = 0
-        self._sn = 0
-
-        self._total_length = os.path.getsize(path) if path else 0
-        self._sent_length = 0
-        self._received_length = 0
-        self._total_packet_count = -1
-        self._success_packet_count = -1
+        Waiting for a sender ends at once, a batch in progress is completed
+        first. A second call cancels the batch in progress.
+        '''
+        self._stop_requests += 1
+
+    def _recv_batch(self, 
+                    path: Union[str, Callable[[FileInfo], Any]], 
+                    callback: Optional[Callable[[int, str, int, int], None]] = None,
+                    wait_forever: bool = False
+                    ) -> Generator[Event, None, bool]:
+        # YMODEM-G: a dedicated thread drains the port, the sink is written on another one
+        if self.protocol_type == ProtocolType.YMODEM and 'g' in self._protocol_type_options and self._threaded_g_receive:
+            self._reader = ChannelReader(self._read)
+            self._reader.start()
+
+        self._start_recording("receive")
+        try:
+            return (yield from self._recv(path, callback, wait_forever))
+        finally:
+            self._stop_recording()
+            if self._reader:
+                self._reader.stop()
+                self.read_buffer_peak = self._reader.peak_depth
+                self.logger.debug(f"[Receiver]: Peak read buffer depth - {self.read_buffer_peak} bytes")
+                self._reader = None
+
+    def _recv(self, 
+              path: Union[str, Callable[[FileInfo], Any]], 
+              callback: Optional[Callable[[int, str, int, int], None]] = None,
+              wait_forever: bool = False
+              ) -> Generator[Event, None, bool]:
 
-    @property
-    def path(self) -> str:
-        return self._path
+        # XYMODEM process
+        if self.protocol_type == ProtocolType.XMODEM or self.protocol_type == ProtocolType.YMODEM:
 
-    @property
-    def name(self) -> str:
-        return self._name
-    
-    @name.setter
-    def name(self, v: str):
-        self._name = v
+            # features adopted from the sender only last for one session
+            core = ReceiverCore(self.protocol_type, self.protocol_subtype, self._protocol_features, self._style_id,
+                                self._protocol_type_options, self._detect_style, wait_forever,
+                                self.FAST_POLL_INTERVAL if self._fast_handshake else None,
+                                self.FAST_CRC_REQUESTS if self._fast_handshake else 10,
+                                self._start_timeout, self._digest)
+            progress = ProgressDispatcher(callback, self._progress_interval, self._progress_step)
+            self.results = []
+            stream = None
+            name = ""
+
+            def on_event(event: Event) -> None:
+                nonlocal stream, name
+                if isinstance(event, Data):
+                    try:
+                        stream.write(event.data)
+                    except Exception:
+                        core.abort(f"[Receiver]: Failed to write the data of {name} to file, abort and exit!")
+                elif isinstance(event, Progress):
+                    progress.update(event.task_index, event.name, event.total, event.done)
+                elif isinstance(event, FileHeader):
+                    name = event.info.name
+                    try:
+                        stream = self._open_sink(path, event.info)
+                        if self._reader:
+                            stream = AsyncWriter(stream)
+                    except Exception:
+                        core.abort(f"[Receiver]: Cannot open the sink of {event.info.name}, abort and exit!")
+                        return
+                    core.accept_file()
+                elif isinstance(event, FileEnd):
+                    stored = self._close_stream(stream)
+                    stream = None
+                    core.finish_file(stored)
+                elif isinstance(event, FileDone):
+                    progress.flush()
+                    self._file_done(event, "Receiver")
+
+            try:
+                yield from self._run(core, on_event)
+            finally:
+                self._close_stream(stream)
+            return self._result(core)
+
+    def _file_done(self, event: FileDone, role: str) -> None:
+        self.results.append(event)
+        if event.digest:
+            verified = "" if event.verified is None else ", verified" if event.verified else ", digest MISMATCH"
+            self.logger.info(f"[{role}]: {event.name} - {event.digest}{verified}")
+
+    def _result(self, core: Union[SenderCore, ReceiverCore]) -> bool:
+        '''
+        A file whose digest differs between both ends fails the session.
+        '''
+        return core.result and all(result.verified is not False for result in self.results)
+
+    def _start_recording(self, direction: str) -> None:
+        if self._metrics is not None:
+            self._recorder = self._metrics.recorder(self._metrics_port, direction)
+            self._recorder.start()
+
+    def _stop_recording(self) -> None:
+        if self._recorder is not None:
+            self._recorder.stop()
+            self._recorder = None
+
+    def _run(self, 
+             core: Union[SenderCore, ReceiverCore], 
+             on_event: Callable[[Event], None], 
+             feed: Optional[Callable[[], None]] = None
+             ) -> Generator[Event, None, None]:
+        '''
+        Drive a protocol core over the channel until it is done, or idle
+        waiting for the next file, yielding every event once on_event has
+        handled it.
+        '''
+        timer = None
+        deadline = 0.0
+        unflushed = False
+        self._disconnected = False
+        recorder = self._recorder
+        while True:
+            buffers = core.buffers_to_send()
+            if buffers:
+                self.writev(buffers)
+                if recorder is not None:
+                    recorder.wrote(sum(map(len, buffers)))
+                if self._flush_policy == "packet":
+                    self.flush()
+                else:
+                    unflushed = True
 
-    @property
-    def total(self) -> int:
-        return self._total_length
-    
-    @total.setter
-    def total(self, v: int):
-        self._total_length = v
+            event = core.next_event()
+            if event is not None:
+                if recorder is not None:
+                    recorder.event(event)
+                on_event(event)
+                try:
+                    yield event
+                except GeneratorExit:
+                    # the caller closed the generator, let the peer know before leaving
+                    if not core.done:
+                        core.abort("[Modem]: Cancelled, abort and exit!")
+                        self.writev(core.buffers_to_send())
+                        self.flush()
+                        if recorder is not None:
+                            recorder.finish(False)
+                    raise
+                continue
+
+            if core.done or core.idle:
+                if core.done and recorder is not None:
+                    recorder.finish(core.result)
+                return
+
+            if self._disconnected:
+                core.abort("[Modem]: Connection lost, abort and exit!")
+                continue
+
+            if self._stop_requests:
+                # nobody to notify while no sender has shown up
+                if isinstance(core, ReceiverCore) and core.awaiting_sender:
+                    self.logger.info("[Modem]: Stopped")
+                    return
+                if self._stop_requests > 1:
+                    core.abort("[Modem]: Stopped, abort and exit!")
+                    continue
 
-    @property
-    def sent(self) -> int:
-        return self._sent_length
-    
-    @sent.setter
-    def sent(self, v: int):
-        self._sent_length = v
+            if isinstance(core, SenderCore) and core.wants_input:
+                # YMODEM-G with XON/XOFF: take what the receiver sent, without waiting
+                data = self.read(core.read_size, 0)
+                if data and recorder is not None:
+                    recorder.read(len(data))
+                core.receive_data(data or b"")
+                if not (feed and core.wants_data):
+                    continue
 
-    @property
-    def received(self) -> int:
-        return self._received_length
-    
-    @received.setter
-    def received(self, v: int):
-        self._received_length = v
+            if feed and core.wants_data:
+                feed()
+                continue
+
+            # turnaround: the peer only answers once the data has left the port
+            if unflushed and self._flush_policy == "turnaround":
+                self.flush()
+                unflushed = False
+
+            if core.timer != timer:
+                timer = core.timer
+                deadline = time.monotonic() + core.wait_time
+
+            # wake up at least every STOP_POLL_INTERVAL to notice stop()
+            remaining = deadline - time.monotonic()
+            data = self.read(core.read_size, min(remaining, self.STOP_POLL_INTERVAL)) if remaining > 0 else None
+            if data:
+                if isinstance(core, SenderCore) and core.awaiting_request:
+                    # requests queued while the sender was not listening yet
+                    queued = self.read(self.QUEUED_REQUESTS_SIZE, 0)
+                    if queued:
+                        data += queued
+                if recorder is not None:
+                    recorder.read(len(data))
+                core.receive_data(data)
+            elif time.monotonic() >= deadline:
+                # a daemon waiting for the next sender is not timing out
+                if recorder is not None and not (isinstance(core, ReceiverCore) and core.awaiting_sender):
+                    recorder.timeout()
+                core.timeout()
+
+    def _open_sink(self, path: Union[str, Callable[[FileInfo], Any]], info: FileInfo) -> Any:
+        '''
+        5. YMODEM Batch File Transmission
 
-    @property
-    def mtime(self) -> int:
-        return self._mtime
+        After the filename block has been received,
+        it is ACK'ed if the write open is successful.
+        '''
+        if callable(path):
+            return open_sink(path(info))
+        return self._open_file(path, info)
+
+    def _open_file(self, path: str, info: FileInfo) -> Any:
+        # the pathname may contain directories, never let it escape the destination folder
+        parts = [part for part in info.name.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+        if not parts:
+            raise ValueError(f"Invalid pathname: {info.name}")
+        p = os.path.join(path, *parts)
+        if len(parts) > 1:
+            os.makedirs(os.path.dirname(p), exist_ok=True)
+        return open(p, "wb+")
+
+    def _close_stream(self, stream: Any) -> bool:
+        if not stream:
+            return True
+        try:
+            stream.close()
+            return True
+        except Exception as err:
+            self.logger.error(f"[Receiver]: Failed to close the sink: {err}")
+            return False
     
-    @mtime.setter
-    def mtime(self, v: int):
-        self._mtime = v
 
-    @property
-    def mode(self) -> int:
-        return self._mode
-    
-    @mode.setter
-    def mode(self, v: int):
-        self._mode = v
+def _drain(events: Generator[Event, None, bool]) -> bool:
+    '''
+    Run a transfer generator to its end and return its result.
+    '''
+    while True:
+        try:
+            next(events)
+        except StopIteration as stop:
+            return stop.value
+
+
+def _iter_tasks(paths: List[Union[str, Source, Any]],
+                include: Optional[List[str]] = None,
+                exclude: Optional[List[str]] = None
+                ) -> Iterator["_TransmissionTask"]:
+    for path in paths:
+        if isinstance(path, Source):
+            yield _TransmissionTask(source=path)
+        elif isinstance(path, (str, os.PathLike)):
+            for file_path, name, st in scan_paths([path], include, exclude):
+                yield _TransmissionTask(file_path, name, st)
+        else:
+            # not imported at the top to keep mmap out of the import path
+            from ymodem.Image import PacketImage
 
-    @property
-    def sn(self) -> int:
-        return self._sn
-    
-    @sn.setter
-    def sn(self, v: int):
-        self._sn = v
+            if not isinstance(path, PacketImage):
+                raise TypeError(f"Unsupported item to send: {type(path).__name__}, wrap in-memory data in Source(name, data)")
+            yield _TransmissionTask(image=path)
 
-    @property
-    def total_packet_count(self) -> int:
-        return self._total_packet_count
-    
-    @total_packet_count.setter
-    def total_packet_count(self, v: int):
-        self._total_packet_count = v
+
+class _TransmissionTask:
+    __slots__ = ("path", "source", "image", "name", "mtime", "total")
+
+    def __init__(self, 
+                 path: Optional[str] = None, 
+                 name: Optional[str] = None,
+                 st: Optional[os.stat_result] = None,
+                 source: Optional[Source] = None,
+                 image: Optional[Any] = None):
+        self.path = path or ""              # type: str
+        self.source = source                # type: Optional[Source]
+        self.image = image                  # type: Optional[Any]
+        if path and not st:
+            st = os.stat(path)
+
+        if image:
+            self.name = image.name
+            self.mtime = image.mtime
+            self.total = image.length
+        elif source:
+            self.name = source.name         # type: str
+            self.mtime = source.mtime       # type: float
+            self.total = source.size        # type: int
+        elif path:
+            self.name = name or os.path.basename(path)
+            self.mtime = st.st_mtime
+            self.total = st.st_size
+        else:
+            self.name = ""
+            self.mtime = 0
+            self.total = 0
 
     @property
-    def success_packet_count(self) -> int:
-        return self._success_packet_count
-    
-    @success_packet_count.setter
-    def success_packet_count(self, v: int):
-        self._success_packet_count = v
+    def key_path(self) -> str:
+        '''
+        Path identifying the task in a checkpoint journal, empty for sources that are not files.
+        '''
+        if self.image:
+            return self.image.path
+        return self.path
@@ -0,0 +1,267 @@
+from abc import ABC, abstractmethod
+import io
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+
+class Source:
+    '''
+    Data to be sent by ModemSocket.send() without going through a file on disk.
+
+    param name: file name sent in the filename packet
+    param data: bytes, bytearray or memoryview, a readable binary file object,
+                or an iterable of byte chunks such as a generator
+    param size: number of bytes to send, required for iterables and for file
+                objects that cannot seek
+    param mtime: modification time in seconds since the epoch, 0 if unknown
+    '''
+    def __init__(self,
+                 name: str,
+                 data: Union[bytes, bytearray, memoryview, io.RawIOBase, io.BufferedIOBase, Iterable[bytes]],
+                 size: Optional[int] = None,
+                 mtime: float = 0):
+        if not name:
+            raise ValueError("Source requires a name")
+
+        self._name = name
+        self._data = data
+        self._mtime = mtime
+
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            if size is None:
+                size = memoryview(data).nbytes
+        elif hasattr(data, "read"):
+            if size is None:
+                size = self._remaining_size(data)
+        elif not hasattr(data, "__iter__"):
+            raise TypeError(f"Unsupported source data type: {type(data).__name__}")
+
+        if size is None:
+            raise ValueError(f"Source {name} requires an explicit size")
+        self._size = size
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def mtime(self) -> float:
+        return self._mtime
+
+    def open(self) -> Any:
+        '''
+        Return a reader whose read(size) returns exactly size bytes until the
+        end of the data. Closing the reader never closes the caller's object.
+
+        Reading stops at the size of the source, as announced in the filename
+        packet. The reader raises ValueError when the data ends before it, or
+        when the chunks of an iterable run past it.
+        '''
+        if isinstance(self._data, (bytes, bytearray, memoryview)):
+            reader = _BufferReader(self._data)
+        elif hasattr(self._data, "read"):
+            reader = _FileReader(self._data)
+        else:
+            return _SizedReader(_ChunkReader(iter(self._data)), self._name, self._size, strict=True)
+        return _SizedReader(reader, self._name, self._size)
+
+    @staticmethod
+    def _remaining_size(stream: Any) -> Optional[int]:
+        try:
+            if not stream.seekable():
+                return None
+            position = stream.tell()
+            size = stream.seek(0, io.SEEK_END) - position
+            stream.seek(position)
+            return size
+        except (AttributeError, OSError):
+            return None
+
+
+class _SizedReader:
+    '''
+    Cut the reads of another reader off at size bytes. With strict, data
+    left behind the size is an error too, e.g. a generator yielding more
+    than announced.
+    '''
+    def __init__(self, reader: Any, name: str, size: int, strict: bool = False):
+        self._reader = reader
+        self._name = name
+        self._size = size
+        self._remaining = size
+        self._strict = strict
+
+    def read(self, size: int) -> bytes:
+        size = min(size, self._remaining)
+        if size <= 0:
+            if self._strict and self._reader.read(1):
+                raise ValueError(f"Source {self._name} has more data than its size of {self._size} bytes")
+            return b""
+        data = self._reader.read(size)
+        self._remaining -= len(data)
+        if len(data) < size:
+            raise ValueError(f"Source {self._name} ended {self._remaining} bytes before its size of {self._size} bytes")
+        return data
+
+    def close(self) -> None:
+        self._reader.close()
+
+
+class _BufferReader:
+    def __init__(self, data: Union[bytes, bytearray, memoryview]):
+        self._view = memoryview(data).cast("B")
+        self._position = 0
+
+    def read(self, size: int) -> bytes:
+        data = self._view[self._position:self._position + size].tobytes()
+        self._position += len(data)
+        return data
+
+    def close(self) -> None:
+        self._view.release()
+
+
+class _FileReader:
+    def __init__(self, stream: Any):
+        self._stream = stream
+
+    def read(self, size: int) -> bytes:
+        data = self._stream.read(size)
+        if not data or len(data) == size:
+            return data or b""
+
+        # raw streams may return short reads before the end of file
+        chunks = [data]
+        remaining = size - len(data)
+        while remaining > 0:
+            data = self._stream.read(remaining)
+            if not data:
+                break
+            chunks.append(data)
+            remaining -= len(data)
+        return b"".join(chunks)
+
+    def close(self) -> None:
+        pass
+
+
+class _ChunkReader:
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._buffer = bytearray()
+
+    def read(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self) -> None:
+        close = getattr(self._chunks, "close", None)
+        if callable(close):
+            close()
+
+
+class FileInfo:
+    '''
+    Metadata parsed from the filename packet, passed to the sink factory of
+    ModemSocket.recv(). Fields the sender did not send are 0.
+    '''
+    def __init__(self, name: str, length: int = 0, mtime: int = 0, mode: int = 0, sn: int = 0):
+        self._name = name
+        self._length = length
+        self._mtime = mtime
+        self._mode = mode
+        self._sn = sn
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def length(self) -> int:
+        return self._length
+
+    @property
+    def mtime(self) -> int:
+        return self._mtime
+
+    @property
+    def mode(self) -> int:
+        return self._mode
+
+    @property
+    def sn(self) -> int:
+        return self._sn
+
+
+class Sink(ABC):
+    '''
+    Streaming consumer of a received file.
+
+    write() is called with the payload of every packet as it arrives, with the
+    padding of the last packet already removed. close() is called once when
+    the file is complete or the transfer is aborted.
+    '''
+    @abstractmethod
+    def write(self, data: bytes) -> Any:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class CallbackSink(Sink):
+    '''
+    Sink forwarding the received data to callbacks.
+    '''
+    def __init__(self,
+                 on_data: Callable[[bytes], Any],
+                 on_close: Optional[Callable[[], Any]] = None):
+        self._on_data = on_data
+        self._on_close = on_close
+
+    def write(self, data: bytes) -> Any:
+        return self._on_data(data)
+
+    def close(self) -> None:
+        if callable(self._on_close):
+            self._on_close()
+
+
+def open_sink(target: Any) -> Any:
+    '''
+    Adapt the object returned by a sink factory to the write()/close() interface
+    used by the receiver.
+
+    Sink objects are closed at the end of the file. Other writable objects such
+    as BytesIO belong to the caller and are only flushed. A plain callable is
+    called with each received chunk.
+    '''
+    if isinstance(target, Sink):
+        return target
+    elif hasattr(target, "write"):
+        return _BorrowedWriter(target)
+    elif callable(target):
+        return CallbackSink(target)
+    else:
+        raise TypeError(f"Unsupported sink type: {type(target).__name__}")
+
+
+class _BorrowedWriter:
+    def __init__(self, stream: Any):
+        self._stream = stream
+
+    def write(self, data: bytes) -> Any:
+        return self._stream.write(data)
+
+    def close(self) -> None:
+        flush = getattr(self._stream, "flush", None)
+        if callable(flush):
+            flush()
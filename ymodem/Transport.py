@@ -0,0 +1,752 @@
+import errno
+import logging
+import os
+import socket
+import time
+from typing import Any, List, Optional, Union
+
+from ymodem.Platform import Platform
+from ymodem.Socket import Channel
+
+def _writev_fd(fd: int, buffers: List[Union[bytes, bytearray]], timeout: Optional[float]) -> int:
+    '''
+    Write all buffers to a file descriptor with os.writev, waiting with poll()
+    while a non-blocking descriptor cannot take more.
+    '''
+    import select
+
+    views = [memoryview(buffer) for buffer in buffers if len(buffer)]
+    total = sum(len(view) for view in views)
+    deadline = None
+    written = 0
+    while views:
+        try:
+            n = os.writev(fd, views)
+            written += n
+            # drop what has been written, the kernel may accept part of a buffer
+            while views and n >= len(views[0]):
+                n -= len(views[0])
+                views.pop(0)
+            if n:
+                views[0] = views[0][n:]
+            continue
+        except BlockingIOError:
+            pass
+        except OSError as err:
+            if err.errno != errno.EAGAIN:
+                raise
+
+        # the output queue is full, wait until it drains
+        now = time.monotonic()
+        if deadline is None:
+            deadline = now + (timeout or 0)
+        remaining = deadline - now
+        poller = select.poll()
+        poller.register(fd, select.POLLOUT)
+        if remaining <= 0 or not poller.poll(remaining * 1000):
+            raise TimeoutError(f"Write timeout, {written} of {total} bytes written")
+    return written
+
+
+class TermiosChannel(Channel):
+    '''
+    Serial port channel driving a tty file descriptor directly with termios,
+    without pyserial. Linux only.
+
+    The descriptor is non-blocking and waits are done with poll(), so a read
+    costs no more than one poll and one read system call. Data is read ahead
+    in large chunks and the many single byte reads of the protocol are served
+    from that buffer.
+
+    The kernel buffers of a tty cannot be enlarged from user space: unlike
+    the pipe of StdioChannel (F_SETPIPE_SZ) or the socket of TcpChannel
+    (SO_RCVBUF), the tty layer has no setting for them. read_ahead is the
+    larger buffer instead, it empties the kernel buffer in one call as soon
+    as data arrives.
+
+    param rtscts: RTS/CTS hardware flow control
+    param xonxoff: software flow control, True in both directions like pyserial,
+                   "output" to only stop sending on XOFF of the peer (IXON),
+                   "input" to only send XOFF when the input buffer is full (IXOFF).
+                   A receiver should use "input": with IXON the tty also removes
+                   the XON/XOFF bytes from the received data
+    '''
+    # Linux serial_struct (linux/serial.h)
+    TIOCGSERIAL         = 0x541E
+    TIOCSSERIAL         = 0x541F
+    ASYNC_LOW_LATENCY   = 1 << 13
+
+    def __init__(self,
+                 port: str,
+                 baudrate: int = 115200,
+                 bytesize: int = 8,
+                 parity: str = "N",
+                 stopbits: int = 1,
+                 low_latency: bool = False,
+                 read_ahead: int = 65536,
+                 rtscts: bool = False,
+                 xonxoff: Union[bool, str] = False):
+        if not Platform.is_Linux():
+            raise OSError("TermiosChannel is only available on Linux")
+
+        self.logger = logging.getLogger('ModemSocket')
+
+        self.port = port
+        self.baudrate = baudrate
+        self.bytesize = bytesize
+        self.parity = parity
+        self.stopbits = stopbits
+        self.low_latency = low_latency
+        self.read_ahead = read_ahead
+        if xonxoff not in (False, True, "output", "input"):
+            raise ValueError(f"Invalid xonxoff specified: {xonxoff}")
+        self.rtscts = rtscts
+        self.xonxoff = xonxoff
+
+        self._fd = -1
+        self._poller = None
+        self._buffer = bytearray()
+
+    @property
+    def is_open(self) -> bool:
+        return self._fd >= 0
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def open(self) -> None:
+        import select
+
+        self._fd = os.open(self.port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            self._configure()
+            if self.low_latency:
+                self._set_low_latency()
+        except Exception:
+            os.close(self._fd)
+            self._fd = -1
+            raise
+
+        self._poller = select.poll()
+        self._poller.register(self._fd, select.POLLIN)
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+            self._poller = None
+            self._buffer.clear()
+
+    def read(self, size: int, timeout: Optional[float] = 1) -> bytes:
+        deadline = None
+        while len(self._buffer) < size:
+            try:
+                data = os.read(self._fd, max(self.read_ahead, size - len(self._buffer)))
+            except BlockingIOError:
+                data = None
+            if data:
+                self._buffer += data
+                continue
+
+            # wait for more data
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now + (timeout or 0)
+            remaining = deadline - now
+            if remaining <= 0 or not self._poller.poll(remaining * 1000):
+                break
+
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def write(self, data: Union[bytes, bytearray], timeout: Optional[float] = 1) -> int:
+        return self.writev([data], timeout)
+
+    def writev(self, buffers: List[Union[bytes, bytearray]], timeout: Optional[float] = 1) -> int:
+        '''
+        Gathered write of several buffers with os.writev, e.g. the header,
+        payload and checksum of a packet, without joining them first.
+        '''
+        return _writev_fd(self._fd, buffers, timeout)
+
+    def flush(self) -> None:
+        '''
+        Wait until all written data has been transmitted (tcdrain).
+        '''
+        import termios
+
+        termios.tcdrain(self._fd)
+
+    def _configure(self) -> None:
+        import termios
+
+        speed = getattr(termios, f"B{self.baudrate}", None)
+        if speed is None:
+            raise ValueError(f"Invalid baudrate specified: {self.baudrate}")
+
+        sizes = {5: termios.CS5, 6: termios.CS6, 7: termios.CS7, 8: termios.CS8}
+        if self.bytesize not in sizes:
+            raise ValueError(f"Invalid bytesize specified: {self.bytesize}")
+        if self.parity not in ("N", "E", "O"):
+            raise ValueError(f"Invalid parity specified: {self.parity}")
+        if self.stopbits not in (1, 2):
+            raise ValueError(f"Invalid stopbits specified: {self.stopbits}")
+
+        iflag, oflag, cflag, lflag, ispeed, ospeed, cc = termios.tcgetattr(self._fd)
+
+        # raw mode, same as cfmakeraw()
+        iflag &= ~(termios.IGNBRK | termios.BRKINT | termios.PARMRK | termios.ISTRIP | termios.INLCR | termios.IGNCR | termios.ICRNL
+                   | termios.IXON | termios.IXOFF | termios.IXANY)
+        oflag &= ~termios.OPOST
+        lflag &= ~(termios.ECHO | termios.ECHONL | termios.ICANON | termios.ISIG | termios.IEXTEN)
+        cflag &= ~(termios.CSIZE | termios.PARENB | termios.PARODD | termios.CSTOPB | getattr(termios, "CRTSCTS", 0))
+        cflag |= sizes[self.bytesize] | termios.CLOCAL | termios.CREAD
+
+        if self.parity == "E":
+            cflag |= termios.PARENB
+        elif self.parity == "O":
+            cflag |= termios.PARENB | termios.PARODD
+        if self.stopbits == 2:
+            cflag |= termios.CSTOPB
+
+        if self.rtscts:
+            cflag |= termios.CRTSCTS
+        if self.xonxoff in (True, "output"):
+            iflag |= termios.IXON
+        if self.xonxoff in (True, "input"):
+            iflag |= termios.IXOFF
+
+        # never block in read(), poll() does the waiting
+        cc[termios.VMIN] = 0
+        cc[termios.VTIME] = 0
+
+        termios.tcsetattr(self._fd, termios.TCSANOW, [iflag, oflag, cflag, lflag, speed, speed, cc])
+        termios.tcflush(self._fd, termios.TCIOFLUSH)
+
+    def _set_low_latency(self) -> None:
+        import array
+        import fcntl
+
+        buf = array.array('i', [0] * 32)
+        try:
+            fcntl.ioctl(self._fd, self.TIOCGSERIAL, buf)
+            # flags is the fifth int of serial_struct
+            buf[4] |= self.ASYNC_LOW_LATENCY
+            fcntl.ioctl(self._fd, self.TIOCSSERIAL, buf)
+        except OSError as err:
+            self.logger.warning(f"[Modem]: Cannot set ASYNC_LOW_LATENCY on {self.port}: {err}")
+
+
+class SerialChannel(Channel):
+    '''
+    Channel adapter around an open pyserial port.
+
+    Assigning serial.timeout or serial.write_timeout reconfigures the port
+    with a full tcsetattr round-trip, and the protocol asks for a different
+    timeout on almost every read. The adapter keeps the port on a fixed poll
+    timeout and waits for its own deadline instead, a timeout is only applied
+    to the port when it differs from the current one.
+    '''
+    def __init__(self, serial_io: Any, poll_interval: float = 0.05):
+        self.logger = logging.getLogger('ModemSocket')
+
+        self._serial = serial_io
+        self._poll_interval = poll_interval
+        # values currently applied to the port
+        self._timeout = serial_io.timeout
+        self._write_timeout = serial_io.write_timeout
+
+    @property
+    def is_open(self) -> bool:
+        return self._serial.is_open
+
+    def close(self) -> None:
+        self._serial.close()
+
+    def read(self, size: int, timeout: Optional[float] = 1) -> bytes:
+        if timeout is not None and timeout <= 0:
+            # non-blocking, only what is already there
+            waiting = self._serial.in_waiting
+            return self._serial.read(min(size, waiting)) if waiting else b""
+
+        self._set_timeout(self._poll_interval)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        data = self._serial.read(size)
+        while len(data) < size and (deadline is None or time.monotonic() < deadline):
+            data += self._serial.read(size - len(data))
+        return data
+
+    def write(self, data: Union[bytes, bytearray], timeout: Optional[float] = 1) -> Optional[int]:
+        if timeout != self._write_timeout:
+            self._serial.write_timeout = timeout
+            self._write_timeout = timeout
+        return self._serial.write(data)
+
+    def flush(self) -> None:
+        self._serial.flush()
+
+    def _set_timeout(self, timeout: Optional[float]) -> None:
+        if timeout != self._timeout:
+            self._serial.timeout = timeout
+            self._timeout = timeout
+
+
+class TcpChannel(Channel):
+    '''
+    Channel over a TCP connection, e.g. to a serial device server or ser2net.
+
+    Nagle's algorithm is disabled so that the single byte answers of the
+    protocol are not held back, and the socket buffers are enlarged to keep a
+    YMODEM-G stream flowing. Reads are served from a read-ahead buffer like
+    TermiosChannel.
+
+    With telnet, the stream is a Telnet session (RFC 854): IAC bytes of the
+    data are doubled, commands of the peer are removed from the data and the
+    BINARY and SUPPRESS-GO-AHEAD options are negotiated. With rfc2217, the
+    serial settings of the remote port are also set (RFC 2217 COM-PORT-OPTION),
+    including its flow control if rtscts or xonxoff is given.
+    '''
+    # Telnet commands and options (RFC 854, 856, 858, 2217)
+    IAC                 = 255
+    DONT                = 254
+    DO                  = 253
+    WONT                = 252
+    WILL                = 251
+    SB                  = 250
+    SE                  = 240
+    BINARY              = 0
+    SGA                 = 3
+    COM_PORT_OPTION     = 44
+
+    SET_BAUDRATE        = 1
+    SET_DATASIZE        = 2
+    SET_PARITY          = 3
+    SET_STOPSIZE        = 4
+    SET_CONTROL         = 5
+
+    # SET_CONTROL values
+    FLOW_XONXOFF        = 2
+    FLOW_HARDWARE       = 3
+
+    # Telnet receive states
+    _DATA, _COMMAND, _OPTION, _SUBNEGOTIATION, _SUBNEGOTIATION_IAC = range(5)
+
+    def __init__(self,
+                 host: str,
+                 port: int,
+                 telnet: bool = False,
+                 rfc2217: bool = False,
+                 baudrate: int = 115200,
+                 bytesize: int = 8,
+                 parity: str = "N",
+                 stopbits: int = 1,
+                 rtscts: bool = False,
+                 xonxoff: bool = False,
+                 connect_timeout: Optional[float] = 10,
+                 buffer_size: int = 1 << 20,
+                 read_ahead: int = 65536):
+        self.logger = logging.getLogger('ModemSocket')
+
+        self.host = host
+        self.port = port
+        self.telnet = telnet or rfc2217
+        self.rfc2217 = rfc2217
+        self.baudrate = baudrate
+        self.bytesize = bytesize
+        self.parity = parity
+        self.stopbits = stopbits
+        self.rtscts = rtscts
+        self.xonxoff = xonxoff
+        self.connect_timeout = connect_timeout
+        self.buffer_size = buffer_size
+        self.read_ahead = read_ahead
+
+        self._sock = None
+        self._timeout = None
+        self._buffer = bytearray()
+        self._eof = False
+        self._state = self._DATA
+        self._command = 0
+        # options in effect, ours and the peer's
+        self._local_options = set()
+        self._remote_options = set()
+
+    @classmethod
+    def from_socket(cls, sock: Any, telnet: bool = False, **kwargs: Any) -> "TcpChannel":
+        '''
+        Wrap an already connected socket, e.g. an accepted connection or one end of a socketpair.
+        '''
+        address = sock.getpeername() if sock.family != getattr(socket, "AF_UNIX", None) else ("", 0)
+        channel = cls(address[0], address[1], telnet=telnet, **kwargs)
+        channel._setup(sock)
+        return channel
+
+    @property
+    def is_open(self) -> bool:
+        return self._sock is not None
+
+    @property
+    def gathered_writes(self) -> bool:
+        '''
+        writev() sends the buffers with a single sendmsg() call, which Windows does not have.
+        '''
+        return hasattr(self._sock, "sendmsg")
+
+    def fileno(self) -> int:
+        return self._sock.fileno() if self._sock else -1
+
+    def open(self) -> None:
+        self._setup(socket.create_connection((self.host, self.port), self.connect_timeout))
+
+    def close(self, linger: float = 1) -> None:
+        '''
+        Close gracefully: the last bytes of the peer, e.g. the request answering
+        a YMODEM-G batch end packet, are drained first. Closing with unread data
+        resets the connection, and a reset can discard data not yet delivered to
+        the other side of a device server.
+        '''
+        if not self._sock:
+            return
+        try:
+            self._sock.shutdown(socket.SHUT_WR)
+            deadline = time.monotonic() + linger
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._sock.settimeout(remaining)
+                if not self._sock.recv(self.read_ahead):
+                    break
+        except OSError:
+            pass
+        finally:
+            self._sock.close()
+            self._sock = None
+            self._buffer.clear()
+
+    def read(self, size: int, timeout: Optional[float] = 1) -> bytes:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while len(self._buffer) < size and not self._eof:
+            remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+            self._set_timeout(remaining)
+            try:
+                data = self._sock.recv(max(self.read_ahead, size - len(self._buffer)))
+            except (socket.timeout, BlockingIOError):
+                break
+            if not data:
+                self._eof = True
+                break
+            self._buffer += self._decode(data) if self.telnet else data
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+
+        # what was received before the peer closed the connection is delivered first
+        if self._eof and not self._buffer:
+            raise ConnectionResetError(f"Connection closed by {self.host}:{self.port}")
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def write(self, data: Union[bytes, bytearray], timeout: Optional[float] = 1) -> int:
+        return self.writev([data], timeout)
+
+    def writev(self, buffers: List[Union[bytes, bytearray]], timeout: Optional[float] = 1) -> int:
+        '''
+        Gathered write of several buffers with sendmsg(), without joining them first.
+        Where sendmsg() does not exist (Windows), the buffers are joined and sent with sendall().
+        '''
+        if self.telnet:
+            buffers = [bytes(buffer).replace(b"\xff", b"\xff\xff") for buffer in buffers]
+        if not hasattr(self._sock, "sendmsg"):
+            data = b"".join(buffers)
+            self._set_timeout(timeout)
+            try:
+                self._sock.sendall(data)
+            except (socket.timeout, BlockingIOError):
+                raise TimeoutError(f"Write timeout, {len(data)} bytes not all written")
+            return len(data)
+        views = [memoryview(buffer) for buffer in buffers if len(buffer)]
+        total = sum(len(view) for view in views)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        written = 0
+        while views:
+            remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+            self._set_timeout(remaining)
+            try:
+                n = self._sock.sendmsg(views)
+            except (socket.timeout, BlockingIOError):
+                raise TimeoutError(f"Write timeout, {written} of {total} bytes written")
+            written += n
+            # drop what has been sent, the kernel may accept part of a buffer
+            while views and n >= len(views[0]):
+                n -= len(views[0])
+                views.pop(0)
+            if n:
+                views[0] = views[0][n:]
+        return written
+
+    def flush(self) -> None:
+        '''
+        Nothing to do, Nagle's algorithm is disabled and data is sent immediately.
+        '''
+        pass
+
+    def _setup(self, sock: Any) -> None:
+        if sock.family in (socket.AF_INET, getattr(socket, "AF_INET6", None)):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, self.buffer_size)
+            except OSError as err:
+                self.logger.warning(f"[Modem]: Cannot set the socket buffer size: {err}")
+        sock.settimeout(None)
+        self._sock = sock
+        self._timeout = None
+        self._eof = False
+
+        if self.telnet:
+            self._negotiate()
+
+    def _set_timeout(self, timeout: Optional[float]) -> None:
+        # settimeout() makes no system call unless the socket switches between blocking and not
+        if timeout != self._timeout:
+            self._sock.settimeout(timeout)
+            self._timeout = timeout
+
+    def _send_command(self, *command: int) -> None:
+        self._sock.sendall(bytes((self.IAC, ) + command))
+
+    def _negotiate(self) -> None:
+        for option in (self.BINARY, self.SGA):
+            # requested options count as in effect, the answer of the peer is then an acknowledgment
+            self._local_options.add(option)
+            self._remote_options.add(option)
+            self._send_command(self.WILL, option)
+            self._send_command(self.DO, option)
+
+        if self.rfc2217:
+            parities = {"N": 1, "O": 2, "E": 3}
+            if self.parity not in parities:
+                raise ValueError(f"Invalid parity specified: {self.parity}")
+            if self.stopbits not in (1, 2):
+                raise ValueError(f"Invalid stopbits specified: {self.stopbits}")
+
+            self._local_options.add(self.COM_PORT_OPTION)
+            self._send_command(self.WILL, self.COM_PORT_OPTION)
+            self._subnegotiate(self.SET_BAUDRATE, self.baudrate.to_bytes(4, "big"))
+            self._subnegotiate(self.SET_DATASIZE, bytes([self.bytesize]))
+            self._subnegotiate(self.SET_PARITY, bytes([parities[self.parity]]))
+            self._subnegotiate(self.SET_STOPSIZE, bytes([self.stopbits]))
+            # the flow control of the remote port is left as configured unless asked for
+            if self.rtscts:
+                self._subnegotiate(self.SET_CONTROL, bytes([self.FLOW_HARDWARE]))
+            elif self.xonxoff:
+                self._subnegotiate(self.SET_CONTROL, bytes([self.FLOW_XONXOFF]))
+
+    def _subnegotiate(self, command: int, value: bytes) -> None:
+        value = value.replace(b"\xff", b"\xff\xff")
+        self._sock.sendall(bytes([self.IAC, self.SB, self.COM_PORT_OPTION, command]) + value
+                           + bytes([self.IAC, self.SE]))
+
+    def _decode(self, data: bytes) -> bytes:
+        # fast path, no command in the data
+        if self._state == self._DATA and b"\xff" not in data:
+            return data
+
+        out = bytearray()
+        i = 0
+        while i < len(data):
+            if self._state == self._DATA:
+                j = data.find(b"\xff", i)
+                if j < 0:
+                    out += data[i:]
+                    break
+                out += data[i:j]
+                self._state = self._COMMAND
+                i = j + 1
+                continue
+
+            byte = data[i]
+            i += 1
+            if self._state == self._COMMAND:
+                if byte == self.IAC:
+                    out.append(self.IAC)
+                    self._state = self._DATA
+                elif byte in (self.DO, self.DONT, self.WILL, self.WONT):
+                    self._command = byte
+                    self._state = self._OPTION
+                elif byte == self.SB:
+                    self._state = self._SUBNEGOTIATION
+                else:
+                    # NOP, GA, ... carry nothing for a binary stream
+                    self._state = self._DATA
+            elif self._state == self._OPTION:
+                self._answer(self._command, byte)
+                self._state = self._DATA
+            elif self._state == self._SUBNEGOTIATION:
+                # the answers of the server to the COM-PORT-OPTION commands are not needed
+                if byte == self.IAC:
+                    self._state = self._SUBNEGOTIATION_IAC
+            elif self._state == self._SUBNEGOTIATION_IAC:
+                self._state = self._DATA if byte == self.SE else self._SUBNEGOTIATION
+        return bytes(out)
+
+    def _answer(self, command: int, option: int) -> None:
+        # answer only changes of state, an acknowledgment is never answered (RFC 854)
+        supported = (self.BINARY, self.SGA, self.COM_PORT_OPTION) if self.rfc2217 else (self.BINARY, self.SGA)
+        if command == self.DO:
+            if option in supported and option not in self._local_options:
+                self._local_options.add(option)
+                self._send_command(self.WILL, option)
+            elif option not in supported:
+                self._send_command(self.WONT, option)
+        elif command == self.DONT:
+            if option in self._local_options:
+                self._local_options.discard(option)
+                self._send_command(self.WONT, option)
+        elif command == self.WILL:
+            if option in (self.BINARY, self.SGA) and option not in self._remote_options:
+                self._remote_options.add(option)
+                self._send_command(self.DO, option)
+            elif option not in (self.BINARY, self.SGA):
+                self._send_command(self.DONT, option)
+        elif command == self.WONT:
+            if option in self._remote_options:
+                self._remote_options.discard(option)
+                self._send_command(self.DONT, option)
+
+
+class StdioChannel(Channel):
+    '''
+    Channel over the standard input and output of the process, like sz/rz.
+    POSIX only.
+
+    Suited to transfers through an ssh session, a container exec or a pty
+    owned by another program. A terminal is switched to raw mode for the
+    duration of the transfer and restored by close(). The descriptors are
+    used directly, unbuffered, and read in large chunks. Nothing else may be
+    written to the standard output, diagnostics belong on the standard error.
+    '''
+    # Linux fcntl F_SETPIPE_SZ
+    F_SETPIPE_SZ        = 1031
+
+    def __init__(self,
+                 read_fd: int = 0,
+                 write_fd: int = 1,
+                 raw: Optional[bool] = None,
+                 read_ahead: int = 65536,
+                 pipe_size: int = 1 << 20):
+        if Platform.is_Windows():
+            raise OSError("StdioChannel is not available on Windows")
+
+        self.logger = logging.getLogger('ModemSocket')
+
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+        # None: raw mode for the descriptors that are terminals
+        self.raw = raw
+        self.read_ahead = read_ahead
+        self.pipe_size = pipe_size
+
+        self._opened = False
+        self._eof = False
+        self._poller = None
+        self._buffer = bytearray()
+        # (fd, attributes) to restore on close
+        self._saved_modes = []
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened
+
+    def open(self) -> None:
+        import select
+
+        for fd in dict.fromkeys((self.read_fd, self.write_fd)):
+            if self.raw or (self.raw is None and os.isatty(fd)):
+                self._set_raw(fd)
+        if Platform.is_Linux():
+            self._set_pipe_size(self.write_fd)
+
+        self._poller = select.poll()
+        self._poller.register(self.read_fd, select.POLLIN)
+        self._opened = True
+        self._eof = False
+
+    def close(self) -> None:
+        import termios
+
+        if not self._opened:
+            return
+        while self._saved_modes:
+            fd, mode = self._saved_modes.pop()
+            try:
+                # let the output drain before the terminal gets its line discipline back
+                termios.tcsetattr(fd, termios.TCSADRAIN, mode)
+            except termios.error as err:
+                self.logger.warning(f"[Modem]: Cannot restore the terminal mode: {err}")
+        self._poller = None
+        self._buffer.clear()
+        self._opened = False
+
+    def read(self, size: int, timeout: Optional[float] = 1) -> bytes:
+        # the descriptors stay blocking, they may share the open file with the terminal of the
+        # user, so poll() tells when a read returns at once
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while len(self._buffer) < size and not self._eof:
+            if deadline is None:
+                ready = self._poller.poll()
+            else:
+                ready = self._poller.poll(max(deadline - time.monotonic(), 0) * 1000)
+            if not ready:
+                break
+            data = os.read(self.read_fd, max(self.read_ahead, size - len(self._buffer)))
+            if not data:
+                self._eof = True
+                break
+            self._buffer += data
+
+        # what was received before the input was closed is delivered first
+        if self._eof and not self._buffer:
+            raise ConnectionResetError("Standard input closed")
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def write(self, data: Union[bytes, bytearray], timeout: Optional[float] = 1) -> int:
+        return self.writev([data], timeout)
+
+    def writev(self, buffers: List[Union[bytes, bytearray]], timeout: Optional[float] = 1) -> int:
+        '''
+        Gathered write of several buffers with os.writev, without joining them first.
+        '''
+        return _writev_fd(self.write_fd, buffers, timeout)
+
+    def flush(self) -> None:
+        '''
+        Wait until the output has been transmitted if it is a terminal, pipes have nothing to flush.
+        '''
+        import termios
+
+        if os.isatty(self.write_fd):
+            termios.tcdrain(self.write_fd)
+
+    def _set_raw(self, fd: int) -> None:
+        import termios
+        import tty
+
+        self._saved_modes.append((fd, termios.tcgetattr(fd)))
+        tty.setraw(fd, termios.TCSADRAIN)
+
+    def _set_pipe_size(self, fd: int) -> None:
+        import fcntl
+        import stat
+
+        if not stat.S_ISFIFO(os.fstat(fd).st_mode):
+            return
+        try:
+            fcntl.fcntl(fd, self.F_SETPIPE_SZ, self.pipe_size)
+        except OSError as err:
+            # above /proc/sys/fs/pipe-max-size for unprivileged processes
+            self.logger.debug(f"[Modem]: Cannot enlarge the output pipe: {err}")
@@ -2,49 +2,88 @@ import argparse
 import logging
 import math
 import os
+import sys
 import time
-from typing import Optional, Any, Union
-
-import serial
 
+from ymodem.Compression import available_methods, compression_levels
+from ymodem.Digest import available_digests
 from ymodem.Protocol import ProtocolType
-from ymodem.Socket import ModemSocket
+from ymodem.Socket import FLUSH_POLICIES, ModemSocket
 
 
 class TaskProgressBar:
-    def __init__(self):
+    def __init__(self, file=None):
+        self.file = file
         self.bar_width = 50
         self.last_task_name = ""
         self.current_task_start_time = -1
 
     def show(self, task_index, task_name, total, success):
+        now = time.perf_counter()
         if task_name != self.last_task_name:
-            self.current_task_start_time = time.perf_counter()
+            self.current_task_start_time = now
             if self.last_task_name != "":
-                print('\n', end="")
+                print('\n', end="", file=self.file)
             self.last_task_name = task_name
 
-        success_width = math.ceil(success * self.bar_width / total)
+        cost = now - self.current_task_start_time
+        speed = success / cost if cost > 0 else 0
+
+        # the total is unknown if the sender omits the length field
+        if total > 0:
+            ratio = min(success / total, 1)
+            eta = (total - success) / speed if speed > 0 and success < total else 0
+        else:
+            ratio = 0
+            eta = 0
+
+        success_width = math.ceil(ratio * self.bar_width)
 
         a = "#" * success_width
         b = "." * (self.bar_width - success_width)
-        progress = (success_width / self.bar_width) * 100
-        cost = time.perf_counter() - self.current_task_start_time
+        progress = ratio * 100
 
-        print(f"\r{task_index} - {task_name} {progress:.2f}% [{a}->{b}]{cost:.2f}s", end="")
+        print(f"\r{task_index} - {task_name} {progress:.2f}% [{a}->{b}] {self.format_size(speed)}/s ETA {eta:.1f}s {cost:.2f}s", end="", flush=True, file=self.file)
+
+    @staticmethod
+    def format_size(size):
+        for unit in ("B", "KB", "MB"):
+            if size < 1024:
+                return f"{size:.1f}{unit}"
+            size /= 1024
+        return f"{size:.1f}GB"
 
 
 def add_modem_args(parser):
-    parser.add_argument("-p", "--port", required=True, type=str, help="COM port")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("-p", "--port", type=str, help="COM port")
+    target.add_argument("--tcp", type=str, metavar="HOST:PORT", help="Connect to a serial device server over TCP instead of a COM port")
+    target.add_argument("--stdio", action='store_true', help="Transfer over stdin/stdout like sz/rz, messages go to stderr (POSIX only)")
     parser.add_argument("-b", "--baudrate", type=int, default=115200, help="Baudrate, default 115200")
     parser.add_argument("-pr", "--parity", type=str, default="N", help="Parity, default N")
     parser.add_argument("-bs", "--bytesize", type=int, default=8, help="Bytesize, default 8")
     parser.add_argument("-sb", "--stopbits", type=int, default=1, help="Stopbits, default 1")
-    parser.add_argument("-t", "--timeout", type=float, default=2, help="Serial timeout, default 2")
+    parser.add_argument("-t", "--timeout", type=float, help="Ignored, kept for compatibility: the protocol gives the timeout of every read and write")
+    parser.add_argument("--rtscts", action='store_true', help="RTS/CTS hardware flow control (COM port, or --tcp with --rfc2217)")
+    parser.add_argument("--dsrdtr", action='store_true', help="DSR/DTR hardware flow control (COM port with pyserial)")
+    parser.add_argument("--xonxoff", action='store_true',
+                        help="XON/XOFF software flow control: the sender pauses YMODEM-G on XOFF, the receiving tty sends XOFF when full (receiving requires --termios)")
     parser.add_argument("-cs", "--chunk-size", type=int, default=1024, help="Chunk size, default 1024")
     parser.add_argument("-x", "--xmodem", action='store_true', help="Force XMODEM protocol")
     parser.add_argument("-g", "--ymodem-g", action='store_true', help="Force YMODEM-G (allowed only for YMODEM)")
+    parser.add_argument("-pi", "--progress-interval", type=float, default=0.1, help="Minimum seconds between progress updates, default 0.1")
     parser.add_argument("-d", "--debug", action='store_true', help="Enable debug")
+    parser.add_argument("--termios", action='store_true', help="Drive the tty directly with termios instead of pyserial (Linux only)")
+    parser.add_argument("--low-latency", action='store_true', help="Set ASYNC_LOW_LATENCY on the port (with --termios)")
+    parser.add_argument("--telnet", action='store_true', help="Use Telnet escaping on the TCP connection (with --tcp)")
+    parser.add_argument("--rfc2217", action='store_true', help="Set the serial settings of the remote port with RFC 2217, implies --telnet (with --tcp)")
+    parser.add_argument("-fl", "--flush", type=str, choices=FLUSH_POLICIES, default="turnaround",
+                        help="Wait for the output to drain: never, after every packet, or only before waiting for the peer (default)")
+    parser.add_argument("-dg", "--digest", type=str, choices=available_digests(), help="Compute a digest of every file while it is transferred")
+    parser.add_argument("-fh", "--fast-handshake", action='store_true', help="Poll the sender every 0.2 s and fall back to checksum mode after 3 C requests")
+    parser.add_argument("-st", "--start-timeout", type=float, help="Give up if the peer has not started within this many seconds")
+    parser.add_argument("--metrics-file", type=str, metavar="PATH", help="Write Prometheus metrics to this file every 5 seconds, e.g. for the node_exporter textfile collector")
+    parser.add_argument("--metrics-http", type=str, metavar="[HOST:]PORT", help="Serve Prometheus metrics on /metrics and JSON on /metrics.json, HOST defaults to 127.0.0.1")
 
 
 def get_cli_args():
@@ -54,40 +93,99 @@ def get_cli_args():
     )
 
     subparsers = parser.add_subparsers(title='Commands', dest='cmd', required=True,
-                                       help="'{send,receive} -h' for more info")
+                                       help="'{send,recv,pack} -h' for more info")
 
     sender_argparser = subparsers.add_parser('send', help="Command to send files")
-    sender_argparser.add_argument("sources", nargs="+", help="Filepaths to send ./filepath.bin ./filepath2.bin")
+    sender_argparser.add_argument("sources", nargs="+", help="Filepaths or directories to send ./filepath.bin ./filepath2.bin ./folder")
+    sender_argparser.add_argument("-in", "--include", action='append', help="Send only files matching the glob pattern, can be repeated")
+    sender_argparser.add_argument("-ex", "--exclude", action='append', help="Skip files and directories matching the glob pattern, can be repeated")
+    sender_argparser.add_argument("-sf", "--small-first", action='store_true', help="Send the smallest files first")
+    sender_argparser.add_argument("-z", "--compress", type=str, choices=available_methods(), help="Offer compression, used only if the receiver is also this program")
+    sender_argparser.add_argument("-zl", "--compress-level", type=int, default=6, choices=compression_levels("zlib"), metavar="{-1..9}",
+                                  help="Compression level, default 6, 0 to 9 with lzma")
+    sender_argparser.add_argument("-im", "--images", action='store_true', help="Sources are packet images made by 'ymodem pack'")
+    sender_argparser.add_argument("-vd", "--verify", action='store_true', help="Compare the digest with the receiver, used only if the receiver is also this program (with --digest)")
+    sender_argparser.add_argument("-j", "--journal", type=str, help="Record every delivered file in this checkpoint journal")
+    sender_argparser.add_argument("-rb", "--resume-batch", action='store_true', help="Skip the files already recorded in the journal (with --journal)")
     add_modem_args(sender_argparser)
 
     receiver_argparser = subparsers.add_parser('recv', help="Command to receive file")
     receiver_argparser.add_argument("dest")
+    receiver_argparser.add_argument("--daemon", action='store_true', help="Keep the port open and receive batch after batch until SIGINT / SIGTERM")
+    receiver_argparser.add_argument("--flat", action='store_true', help="Store all batches directly in dest instead of one folder per batch (with --daemon)")
     add_modem_args(receiver_argparser)
 
-    return vars(parser.parse_args())
+    pack_argparser = subparsers.add_parser('pack', help="Command to precompile a file into a packet image")
+    pack_argparser.add_argument("source", help="File to pack")
+    pack_argparser.add_argument("image", help="Packet image to write")
+    pack_argparser.add_argument("-cs", "--chunk-size", type=int, default=1024, help="Chunk size, default 1024")
+    pack_argparser.add_argument("-ck", "--checksum", action='store_true', help="Frame with the arithmetic checksum instead of CRC-16")
+    pack_argparser.add_argument("-n", "--name", type=str, help="File name sent in the filename packet, default the base name of the source")
 
+    args = parser.parse_args()
+    if args.cmd == 'send' and args.compress and args.compress_level not in compression_levels(args.compress):
+        parser.error(f"Invalid compression level specified for {args.compress}: {args.compress_level}")
+    if args.cmd != 'pack':
+        check_flow_control(parser, args)
+    return vars(args)
 
-def main():
-    def read(size: int, timeout: Optional[float] = 3) -> Any:
-        serial_io.timeout = timeout
-        return serial_io.read(size)
-
-    def write(data: Union[bytes, bytearray], timeout: Optional[float] = 3) -> Any:
-        serial_io.write_timeout = timeout
-        serial_io.write(data)
-        serial_io.flush()
-        return
 
+def check_flow_control(parser, args):
+    # pyserial and RFC 2217 also enable XON/XOFF on the input, which would drop those bytes from the received data
+    if args.cmd == 'recv' and args.xonxoff and not args.termios:
+        parser.error("--xonxoff requires --termios when receiving")
+    if args.dsrdtr and (args.stdio or args.tcp or args.termios):
+        parser.error("--dsrdtr requires a COM port opened with pyserial")
+    if args.rtscts and (args.stdio or (args.tcp and not args.rfc2217)):
+        parser.error("--rtscts requires a COM port or --tcp with --rfc2217")
+    # RFC 2217 sets a single flow control on the remote port
+    if args.tcp and args.rtscts and args.xonxoff:
+        parser.error("--rtscts and --xonxoff cannot be combined with --tcp")
+
+
+def pack_image(args):
+    from ymodem.Image import pack
+
+    with pack(args['source'], args['image'], packet_size=args['chunk_size'], crc=not args['checksum'], name=args['name']) as image:
+        print(f"{image.name}: {image.length} bytes, {image.frame_count} packets of {image.packet_size} bytes, "
+              f"{'CRC-16' if image.crc else 'checksum'}, style {image.style_id} -> {args['image']}")
+
+
+def main():
     args = get_cli_args()
 
     cmd = args.pop('cmd')
+    if cmd == 'pack':
+        pack_image(args)
+        return
+    images = args.pop('images', False)
     sources = args.pop('sources', [])
+    send_args = {
+        'include': args.pop('include', None),
+        'exclude': args.pop('exclude', None),
+        'order': "size" if args.pop('small_first', False) else None,
+        'journal': args.pop('journal', None),
+        'resume_batch': args.pop('resume_batch', False)
+    }
     dest = args.pop('dest', './')
+    # every channel is given the timeout of each call by the protocol
+    args.pop('timeout')
+    daemon = args.pop('daemon', False)
+    flat = args.pop('flat', False)
 
     socket_args = {
         'packet_size': args.pop('chunk_size', 1024),
         'protocol_type': ProtocolType.XMODEM if args.pop('xmodem') else ProtocolType.YMODEM,
-        'protocol_type_options': ['g'] if args.pop('ymodem_g') else []
+        'protocol_type_options': ['g'] if args.pop('ymodem_g') else [],
+        'progress_interval': args.pop('progress_interval'),
+        'compression': args.pop('compress', None),
+        'compression_level': args.pop('compress_level', 6),
+        'flush_policy': args.pop('flush'),
+        'fast_handshake': args.pop('fast_handshake'),
+        'start_timeout': args.pop('start_timeout'),
+        'digest': args.pop('digest'),
+        'digest_trailer': args.pop('verify', False),
+        'xonxoff': args['xonxoff']
     }
 
     debug_level = logging.DEBUG if args.pop('debug') else logging.INFO
@@ -96,18 +194,111 @@ def main():
     logger = logging.getLogger('YMODEM')
     logger.setLevel(debug_level)
 
-    serial_io = serial.Serial(**args)
+    low_latency = args.pop('low_latency')
+    use_termios = args.pop('termios')
+    tcp = args.pop('tcp')
+    telnet = args.pop('telnet')
+    rfc2217 = args.pop('rfc2217')
+    stdio = args.pop('stdio')
+    metrics_file = args.pop('metrics_file')
+    metrics_http = args.pop('metrics_http')
+
+    if stdio:
+        from ymodem.Transport import StdioChannel
+
+        # the standard output carries the protocol, nothing else may be printed there
+        args['port'] = "stdio"
+        serial_io = StdioChannel()
+        serial_io.open()
+        read, write = serial_io.read, serial_io.write
+        socket_args['writev'] = serial_io.writev
+    elif tcp:
+        from ymodem.Transport import TcpChannel
+
+        host, _, port = tcp.rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError(f"Invalid TCP address specified: {tcp}")
+        args['port'] = tcp
+        serial_io = TcpChannel(host.strip("[]"), int(port), telnet=telnet, rfc2217=rfc2217, baudrate=args['baudrate'],
+                               bytesize=args['bytesize'], parity=args['parity'], stopbits=args['stopbits'],
+                               rtscts=args['rtscts'], xonxoff=args['xonxoff'])
+        serial_io.open()
+        read, write = serial_io.read, serial_io.write
+        # otherwise writev() would only join the buffers, as ModemSocket does
+        if serial_io.gathered_writes:
+            socket_args['writev'] = serial_io.writev
+    elif use_termios:
+        from ymodem.Transport import TermiosChannel
+
+        args.pop('dsrdtr')
+        # a receiver only sends XOFF, the XON/XOFF bytes in the data are left alone
+        if args['xonxoff']:
+            args['xonxoff'] = "output" if cmd == 'send' else "input"
+        serial_io = TermiosChannel(**args, low_latency=low_latency)
+        serial_io.open()
+        read, write = serial_io.read, serial_io.write
+        socket_args['writev'] = serial_io.writev
+    else:
+        # pyserial is only needed once a port is actually opened, keep it out of the startup path
+        import serial
+        from ymodem.Transport import SerialChannel
+
+        # the adapter waits for its own deadlines instead of reconfiguring the port on every call
+        serial_io = SerialChannel(serial.Serial(**args))
+        read, write = serial_io.read, serial_io.write
+
+    metrics = None
+    if metrics_file or metrics_http:
+        from ymodem.Metrics import Metrics
+
+        metrics = Metrics()
+        if metrics_file:
+            metrics.start_textfile(metrics_file)
+        if metrics_http:
+            host, _, port = metrics_http.rpartition(":")
+            if not port.isdigit():
+                raise ValueError(f"Invalid metrics address specified: {metrics_http}")
+            host, port = metrics.serve_http(host.strip("[]") or "127.0.0.1", int(port))
+            logger.info(f"Metrics served on http://{host}:{port}/metrics")
+        socket_args['metrics'] = metrics
+        socket_args['metrics_port'] = args['port']
 
     if serial_io.is_open:
         logger.info(f"Port {args['port']} opened")
         try:
-            progress_bar = TaskProgressBar()
-            socket = ModemSocket(read, write, **socket_args)
+            progress_bar = TaskProgressBar(sys.stderr if stdio else None)
+            socket = ModemSocket(read, write, flush=serial_io.flush, **socket_args)
 
-            if cmd == 'send':
+            if cmd == 'send' and images:
+                from ymodem.Image import PacketImage
+
+                packet_images = [PacketImage(source) for source in sources]
+                try:
+                    logger.info("Waiting for command from Receiver...")
+                    socket.send(packet_images, progress_bar.show, **send_args)
+                finally:
+                    for image in packet_images:
+                        image.close()
+            elif cmd == 'send':
                 paths = [os.path.abspath(source) for source in sources]
                 logger.info(f"Waiting for command from Receiver...")
-                socket.send(paths, progress_bar.show)
+                socket.send(paths, progress_bar.show, **send_args)
+            elif cmd == 'recv' and daemon:
+                import signal
+
+                def stop(signum, frame):
+                    logger.info("\nStopping after the current batch, repeat to cancel it")
+                    socket.stop()
+
+                handlers = {signum: signal.signal(signum, stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+                try:
+                    path = os.path.abspath(dest)
+                    logger.info("Waiting for batches from Sender...")
+                    batches = socket.serve(path, progress_bar.show, batch_directories=not flat)
+                    logger.info(f"{batches} batches received")
+                finally:
+                    for signum, handler in handlers.items():
+                        signal.signal(signum, handler)
             elif cmd == 'recv':
                 path = os.path.abspath(dest)
                 logger.info(f"Waiting for response from Sender...")
@@ -120,6 +311,8 @@ def main():
         finally:
             serial_io.close()
             logger.info(f"\nPort {args['port']} closed")
+            if metrics is not None:
+                metrics.close()
 
 
 if __name__ == '__main__':